@@ -0,0 +1,130 @@
+import heapq
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../mysql/proxy_manager"))
+
+from balancer import (  # noqa: E402
+    LEAST_OUTSTANDING,
+    POWER_OF_TWO,
+    WEIGHTED_ROUND_ROBIN,
+    WeightedRoundRobin,
+    select_node,
+)
+
+# Mean service time in seconds of each simulated replica; one replica is slow
+REPLICA_SERVICE_TIMES = {
+    "slave-1": 0.010,
+    "slave-2": 0.010,
+    "slave-3": 0.010,
+    "slave-4": 0.050,
+}
+# "Weight" of each replica in instance_info.json for weighted round robin,
+# set in proportion to its capacity
+REPLICA_WEIGHTS = {
+    "slave-1": 5,
+    "slave-2": 5,
+    "slave-3": 5,
+    "slave-4": 1,
+}
+WORKER_THREADS_PER_REPLICA = 4
+REQUEST_COUNT = 50000
+UTILIZATION = 0.7
+SEED = 42
+
+STRATEGIES = ["RANDOM", LEAST_OUTSTANDING, POWER_OF_TWO, WEIGHTED_ROUND_ROBIN]
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def simulate(strategy, service_times, weights, request_count, utilization, threads, seed):
+    """
+    Discrete event simulation of Poisson arrivals balanced over replicas
+    that each serve `threads` requests at a time with exponential service
+    times, weighted by `weights` for weighted round robin. Returns the
+    sorted response times of every request.
+    """
+    rng = random.Random(seed)
+    replicas = list(service_times)
+    capacity = sum(threads / mean for mean in service_times.values())
+    arrival_rate = utilization * capacity
+
+    in_flight = {replica: 0 for replica in replicas}
+    busy = {replica: 0 for replica in replicas}
+    waiting = {replica: deque() for replica in replicas}
+    round_robin = WeightedRoundRobin()
+    completions = []
+    latencies = []
+    sequence = 0
+
+    def start_service(replica, arrival_time, now):
+        nonlocal sequence
+        busy[replica] += 1
+        finish = now + rng.expovariate(1.0 / service_times[replica])
+        heapq.heappush(completions, (finish, sequence, replica, arrival_time))
+        sequence += 1
+
+    now = 0.0
+    next_arrival = rng.expovariate(arrival_rate)
+    arrivals = 0
+
+    while arrivals < request_count or completions:
+        if arrivals < request_count and (not completions or next_arrival <= completions[0][0]):
+            now = next_arrival
+            arrivals += 1
+            next_arrival = now + rng.expovariate(arrival_rate)
+
+            if strategy == "RANDOM":
+                replica = rng.choice(replicas)
+            else:
+                replica = select_node(strategy, replicas, in_flight.get, weights.get, round_robin, rng)
+
+            in_flight[replica] += 1
+            if busy[replica] < threads:
+                start_service(replica, now, now)
+            else:
+                waiting[replica].append(now)
+        else:
+            now, _, replica, arrival_time = heapq.heappop(completions)
+            latencies.append(now - arrival_time)
+            in_flight[replica] -= 1
+            busy[replica] -= 1
+            if waiting[replica]:
+                start_service(replica, waiting[replica].popleft(), now)
+
+    latencies.sort()
+    return latencies
+
+
+def main():
+    print(
+        f"Simulating {REQUEST_COUNT} requests at {UTILIZATION:.0%} utilization over "
+        f"{len(REPLICA_SERVICE_TIMES)} replicas ({WORKER_THREADS_PER_REPLICA} threads each)"
+    )
+    print(f"{'Strategy':<22}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}")
+    for strategy in STRATEGIES:
+        latencies = simulate(
+            strategy,
+            REPLICA_SERVICE_TIMES,
+            REPLICA_WEIGHTS,
+            REQUEST_COUNT,
+            UTILIZATION,
+            WORKER_THREADS_PER_REPLICA,
+            SEED,
+        )
+        print(
+            f"{strategy:<22}"
+            f"{percentile(latencies, 0.50) * 1000:>10.2f}"
+            f"{percentile(latencies, 0.95) * 1000:>10.2f}"
+            f"{percentile(latencies, 0.99) * 1000:>10.2f}"
+            f"{latencies[-1] * 1000:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
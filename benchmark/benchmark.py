@@ -7,6 +7,9 @@ from statistics import mean, stdev
 USERNAME = "admin_elaa"
 PASSWORD = "admin_elaa_password123"
 
+# Number of queries sent per request by the batch runs
+BATCH_SIZE = 50
+
 # Function to generate unique INSERT, UPDATE, and SELECT queries for the sakila database
 
 def generate_sakila_queries():
@@ -22,6 +25,10 @@ def generate_sakila_queries():
         "SELECT": [
             f"SELECT * FROM customer WHERE customer_id = {i + 1};" for i in range(100)
         ],
+        # The same reads as parameterized statements, prepared once per node connection
+        "PARAMETERIZED_SELECT": [
+            {"sql": "SELECT * FROM customer WHERE customer_id = ?", "params": [i + 1]} for i in range(100)
+        ],
     }
     return queries
 
@@ -42,7 +49,7 @@ def send_requests_to_api(queries, mode, repetitions):
     for _ in range(repetitions):
         for query in queries:
             print(f"Executing Query: {query}")
-            payload = {"query": query, "mode": mode}
+            payload = {"query": query, "mode": mode} if isinstance(query, str) else {**query, "mode": mode}
             try:
                 start_time = time.time()
                 response = requests.post(base_url, json=payload, headers=headers)
@@ -79,6 +86,58 @@ def send_requests_to_api(queries, mode, repetitions):
     with open("query_statistics.txt", "a") as file:
         file.write(statistics)
 
+# Function to send the queries in batches and measure the per-query cost
+def send_batches_to_api(queries, mode, repetitions, batch_size=BATCH_SIZE):
+    with open('gatekeeper_info.json', 'r') as file:
+        instance_details = json.load(file)
+
+    public_ips = [instance['PublicIP'] for instance in instance_details]
+    base_url = f"http://{public_ips[0]}:80/batch"
+
+    headers = {
+        "username": USERNAME,
+        "password": PASSWORD
+    }
+    batch_times = []
+    failed_queries = 0
+
+    for _ in range(repetitions):
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            payload = {"queries": batch, "mode": mode}
+            try:
+                start_time = time.time()
+                response = requests.post(base_url, json=payload, headers=headers)
+                end_time = time.time()
+                batch_times.append((end_time - start_time, len(batch)))
+
+                if response.status_code != 200:
+                    print(f"Batch error ({mode}): {response.status_code}, {response.text}")
+                    failed_queries += len(batch)
+                else:
+                    failed_queries += sum(
+                        1 for result in response.json()["results"] if isinstance(result, dict) and "error" in result
+                    )
+            except requests.RequestException as e:
+                print(f"Batch request failed ({mode}): {e}")
+
+    total_time = sum(elapsed for elapsed, _ in batch_times)
+    total_queries = sum(size for _, size in batch_times)
+
+    statistics = (
+        f"Statistics for {mode} mode (batches of {batch_size}):\n"
+        f"  Total queries executed: {total_queries}\n"
+        f"  Failed queries: {failed_queries}\n"
+        f"  Average batch response time: {mean(elapsed for elapsed, _ in batch_times):.4f} seconds\n"
+        f"  Average time per query: {total_time / total_queries:.4f} seconds\n"
+        f"{'=' * 50}\n"
+    )
+
+    print(statistics)
+
+    with open("query_statistics.txt", "a") as file:
+        file.write(statistics)
+
 if __name__ == "__main__":
     repetitions = 10
     queries = generate_sakila_queries()
@@ -94,3 +153,11 @@ if __name__ == "__main__":
     # Run queries in CUSTOMIZED mode (SELECT queries)
     print("Running queries in CUSTOMIZED mode...")
     send_requests_to_api(queries["SELECT"], "CUSTOMIZED", repetitions)
+
+    # Run the SELECT queries again as parameterized statements
+    print("Running parameterized queries in CUSTOMIZED mode...")
+    send_requests_to_api(queries["PARAMETERIZED_SELECT"], "CUSTOMIZED", repetitions)
+
+    # Run the SELECT queries again in batches to compare the per-query overhead
+    print("Running batched queries in RANDOM mode...")
+    send_batches_to_api(queries["SELECT"], "RANDOM", repetitions)
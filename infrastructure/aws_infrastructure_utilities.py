@@ -90,6 +90,10 @@ def create_security_groups(ec2_client, vpc_id, ssh_allowed_ip):
                 {'IpProtocol': 'tcp', 'FromPort': 22, 'ToPort': 22, 'IpRanges': [{'CidrIp': ssh_allowed_ip}]},
                 {'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]},
                 {'IpProtocol': 'tcp', 'FromPort': 443, 'ToPort': 443, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]},
+                # MySQL, only for the direct reads of the proxy manager; a
+                # group reference only matches traffic to the private IPs
+                {'IpProtocol': 'tcp', 'FromPort': 3306, 'ToPort': 3306,
+                 'UserIdGroupPairs': [{'GroupId': security_groups['proxy_manager']}]},
                 {'IpProtocol': 'icmp', 'FromPort': -1, 'ToPort': -1, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
             ]
         }
@@ -280,7 +284,8 @@ def collect_instance_data(instances, master_name, slave_name=None):
             'Name': instance_name,
             'InstanceID': instance.id,
             'PublicDNS': instance.public_dns_name,
-            'PublicIP': instance.public_ip_address
+            'PublicIP': instance.public_ip_address,
+            'PrivateIP': instance.private_ip_address
         }
         instance_data.append(instance_info)
 
@@ -1,12 +1,15 @@
 import paramiko
 import os
 import json
-from config import SECRET_KEY_PATH
+from config import (SECRET_KEY_PATH, PROXY_MANAGER_SERVER, PROXY_MANAGER_ASYNC_WORKERS, GUNICORN_TIMEOUT,
+                    MASTER_WORKERS, MASTER_THREADS)
 import re
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+SHARED_MODULES_DIRECTORY = "../mysql/common"
+
 # upload an entire directory to the remote server via SFTP
 def upload_directory(ssh_client, local_directory):
     """
@@ -24,20 +27,24 @@ def upload_directory(ssh_client, local_directory):
     }
 
     local_directory = directory_map.get(local_directory, "../mysql/gatekeeper")
-    local_absolute_path = os.path.abspath(local_directory)
-    
+
     # Start SFTP session
     sftp = ssh_client.open_sftp()
-    
-    print(f"Uploading files in {local_absolute_path}")
 
     try:
-        for item in os.listdir(local_directory):
-            local_path = os.path.join(local_absolute_path, item)
-            remote_app_path = f"/home/ubuntu/{item}"
-            print(f"Uploading {local_path} to {remote_app_path}")
-            sftp.put(local_path, remote_app_path)
-            print(f"Uploaded {local_path} to {remote_app_path}")
+        # Modules shared by every tier are uploaded next to the app files
+        for directory in (local_directory, SHARED_MODULES_DIRECTORY):
+            local_absolute_path = os.path.abspath(directory)
+            print(f"Uploading files in {local_absolute_path}")
+
+            for item in os.listdir(local_absolute_path):
+                local_path = os.path.join(local_absolute_path, item)
+                if not os.path.isfile(local_path):
+                    continue
+                remote_app_path = f"/home/ubuntu/{item}"
+                print(f"Uploading {local_path} to {remote_app_path}")
+                sftp.put(local_path, remote_app_path)
+                print(f"Uploaded {local_path} to {remote_app_path}")
 
     finally:
         sftp.close()  # Close the SFTP session
@@ -71,15 +78,19 @@ def extract_relevant_statistics(output):
         return "Relevant statistics not found."
 
 # Set up the deployment environment on the remote server
-def setup_deployment(path, app_name, public_ip, instance_id, instance_name, is_db=True):
+def setup_deployment(path, app_name, public_ip, instance_id, instance_name, is_db=True,
+                     workers=4, worker_class=None, threads=None, extra_packages=()):
     install_commands = [
         'sudo apt-get update',
         'sudo apt install python3 python3-pip -y',
-        'sudo pip3 install flask gunicorn requests boto3'
+        'sudo pip3 install flask gunicorn requests boto3 msgpack'
     ]
 
     if is_db:
-        install_commands.append('sudo pip3 install mysql-connector-python')
+        install_commands.append('sudo pip3 install mysql-connector-python pyarrow')
+
+    if extra_packages:
+        install_commands.append(f"sudo pip3 install {' '.join(extra_packages)}")
 
     try:
         print(f"Connecting to {public_ip} for {instance_id} in {path}...")
@@ -120,7 +131,10 @@ def setup_deployment(path, app_name, public_ip, instance_id, instance_name, is_d
             # Save the output to the file
             save_statistics_to_file(instance_name, instance_id, relevant_statistics)
 
-        app_deploy_cmd = f"sudo gunicorn {app_name.split('/')[-1].split('.')[0]}:app -w 4 --bind 0.0.0.0:80 --log-level debug --access-logfile access.log --error-logfile error.log &"
+        worker_class_option = f" -k {worker_class}" if worker_class else ""
+        if threads:
+            worker_class_option += f" --threads {threads}"
+        app_deploy_cmd = f"sudo gunicorn {app_name.split('/')[-1].split('.')[0]}:app -w {workers}{worker_class_option} --timeout {GUNICORN_TIMEOUT} --bind 0.0.0.0:80 --log-level debug --access-logfile access.log --error-logfile error.log &"
         stdin, stdout, stderr = ssh.exec_command(app_deploy_cmd)
         stdout.channel.recv_exit_status()
         print(f"Completed deploying {app_name} at {public_ip} in {path}...")
@@ -132,18 +146,20 @@ def setup_deployment(path, app_name, public_ip, instance_id, instance_name, is_d
 
 
 # Deploy an instance
-def deploy_instance(instance_file, name_filter, path, app_name, is_db=True):
+def deploy_instance(instance_file, name_filter, path, app_name, is_db=True, **deployment_options):
     with open(instance_file, 'r') as file:
         instance_details = json.load(file)
     
     for instance in instance_details:
         if instance['Name'] == name_filter or name_filter == 'all':
-            setup_deployment(path, app_name, instance['PublicIP'], instance['InstanceID'], instance['Name'], is_db)
+            setup_deployment(path, app_name, instance['PublicIP'], instance['InstanceID'], instance['Name'], is_db,
+                             **deployment_options)
 
 
 # Deploy the master node
 def deploy_master():
-    deploy_instance('../mysql/master/instance_info.json', 'mysql_master_node', "master", "master_app.py", is_db=True)
+    deploy_instance('../mysql/master/instance_info.json', 'mysql_master_node', "master", "master_app.py", is_db=True,
+                    workers=MASTER_WORKERS, threads=MASTER_THREADS)
 
 # Deploy the slave node
 def deploy_slave():
@@ -151,7 +167,13 @@ def deploy_slave():
 
 # Deploy the proxy manager
 def deploy_proxy_manager():
-    deploy_instance('../mysql/trusted_host/proxy_info.json', 'all', "proxy_manager", "proxy_manager_app.py", is_db=False)
+    if PROXY_MANAGER_SERVER == 'async':
+        deploy_instance('../mysql/trusted_host/proxy_info.json', 'all', "proxy_manager", "proxy_manager_async_app.py",
+                        is_db=False, workers=PROXY_MANAGER_ASYNC_WORKERS, worker_class="aiohttp.GunicornWebWorker",
+                        extra_packages=("aiohttp", "mysql-connector-python", "pyarrow"))
+    else:
+        deploy_instance('../mysql/trusted_host/proxy_info.json', 'all', "proxy_manager", "proxy_manager_app.py", is_db=False,
+                        extra_packages=("mysql-connector-python", "pyarrow"))
 
 # Deploy the trusted host
 def deploy_trusted_host():
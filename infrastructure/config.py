@@ -15,3 +15,13 @@ TRUSTED_HOST_NODE_COUNT = 1
 IMAGE_ID = 'ami-005fc0f236362e99f'
 SECRET_KEY_NAME='Log8415_Lab3_Keypair'
 SECRET_KEY_PATH = 'Log8415_Lab3_keypair.pem'
+# Proxy manager implementation deployed: 'sync' (Flask) or 'async' (aiohttp)
+PROXY_MANAGER_SERVER = 'sync'
+PROXY_MANAGER_ASYNC_WORKERS = 2
+# Seconds a gunicorn worker may spend on one request; streamed reads hold a
+# sync worker for as long as the client takes to consume the result set
+GUNICORN_TIMEOUT = 300
+# The master keeps replication state in memory (replay outcomes), so it runs
+# a single gunicorn process serving requests from a pool of threads
+MASTER_WORKERS = 1
+MASTER_THREADS = 16
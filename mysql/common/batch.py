@@ -0,0 +1,42 @@
+from idempotency import read_idempotency_key
+from statements import read_statement
+
+# Largest number of queries accepted in one batch request
+BATCH_MAX_QUERIES = 1000
+
+# Batch-level fields applied to every item that does not set its own
+BATCH_DEFAULTS = ("mode", "ack")
+
+
+def normalize_batch(data, max_queries=BATCH_MAX_QUERIES):
+    """
+    Validates a batch request body and returns its items as dicts holding
+    a raw "query" or a parameterized "sql" with its "params". Items may be
+    plain query strings or objects, which may carry their own "ack" and
+    "idempotency_key", and a batch-level "mode" or "ack" applies to every
+    item that does not set its own. Raises ValueError describing the first
+    invalid item.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Batch body must be a JSON object")
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("Queries are missing")
+    if len(queries) > max_queries:
+        raise ValueError(f"Batch exceeds {max_queries} queries")
+
+    defaults = {key: data[key] for key in BATCH_DEFAULTS if data.get(key) is not None}
+    items = []
+    for index, entry in enumerate(queries):
+        item = {"query": entry} if isinstance(entry, str) else dict(entry) if isinstance(entry, dict) else None
+        if item is None:
+            raise ValueError(f"Query {index} is missing")
+        try:
+            read_statement(item)
+            read_idempotency_key(item)
+        except ValueError as e:
+            raise ValueError(f"Query {index}: {e}")
+        for key, value in defaults.items():
+            item.setdefault(key, value)
+        items.append(item)
+    return items
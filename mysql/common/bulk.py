@@ -0,0 +1,88 @@
+import codecs
+import csv
+import re
+from collections.abc import Mapping
+from statements import PARAM_TYPES
+
+CSV_MIMETYPE = "text/csv"
+
+# Largest number of rows accepted in one bulk request
+BULK_MAX_ROWS = 100000
+# Rows per multi-row INSERT; a statement also stays under MySQL's limit of
+# 65535 placeholders
+BULK_CHUNK_ROWS = 500
+MAX_PLACEHOLDERS = 65535
+
+# CSV field read as NULL, as LOAD DATA does
+CSV_NULL = "\\N"
+
+_IDENTIFIER_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_$]*$")
+
+
+def read_bulk_target(source):
+    """
+    Returns the table and columns of a bulk insert from a JSON body or the
+    query arguments of a CSV upload, where the columns are comma separated.
+    Raises ValueError unless they are plain identifiers.
+    """
+    if not isinstance(source, Mapping):
+        raise ValueError("Table and columns are missing")
+    table = source.get("table")
+    columns = source.get("columns")
+    if isinstance(columns, str):
+        columns = [column.strip() for column in columns.split(",")]
+    if not isinstance(table, str) or not _IDENTIFIER_REGEX.match(table):
+        raise ValueError("Table must be a plain identifier")
+    if not isinstance(columns, list) or not columns:
+        raise ValueError("Columns are missing")
+    if not all(isinstance(column, str) and _IDENTIFIER_REGEX.match(column) for column in columns):
+        raise ValueError("Columns must be plain identifiers")
+    return table, columns
+
+
+def iter_csv_rows(stream, encoding="utf-8"):
+    """
+    Yields the rows of a CSV byte stream as lists, reading it incrementally.
+    Fields equal to \\N become None.
+    """
+    lines = codecs.iterdecode(stream, encoding)
+    for row in csv.reader(lines):
+        if row:
+            yield [None if field == CSV_NULL else field for field in row]
+
+
+def bulk_insert_statements(table, columns, rows, chunk_rows=BULK_CHUNK_ROWS, max_rows=BULK_MAX_ROWS):
+    """
+    Groups rows into multi-row INSERT statements of up to `chunk_rows` rows,
+    yielded as statement payloads with "sql" and "params". Chunks of the same
+    size share their SQL text, so they reuse one prepared statement.
+    Raises ValueError on a malformed row or past `max_rows` rows.
+    """
+    chunk_rows = max(1, min(chunk_rows, MAX_PLACEHOLDERS // len(columns)))
+    column_list = ", ".join(f"`{column}`" for column in columns)
+    row_placeholders = "(" + ", ".join("?" for _ in columns) + ")"
+    sql_by_size = {}
+
+    def statement(chunk):
+        sql = sql_by_size.get(len(chunk))
+        if sql is None:
+            sql = f"INSERT INTO `{table}` ({column_list}) VALUES " + ", ".join([row_placeholders] * len(chunk))
+            sql_by_size[len(chunk)] = sql
+        return {"sql": sql, "params": [value for row in chunk for value in row]}
+
+    chunk = []
+    count = 0
+    for row in rows:
+        count += 1
+        if count > max_rows:
+            raise ValueError(f"Bulk insert exceeds {max_rows} rows")
+        if not isinstance(row, list) or len(row) != len(columns):
+            raise ValueError(f"Row {count - 1} does not have {len(columns)} values")
+        if not all(isinstance(value, PARAM_TYPES) for value in row):
+            raise ValueError(f"Row {count - 1} holds a value that is not a string, number, boolean or null")
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield statement(chunk)
+            chunk = []
+    if chunk:
+        yield statement(chunk)
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import deque
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+# Default ejection policy
+FAILURE_THRESHOLD = 3
+SLOW_CALL_MS = 5000.0
+BASE_EJECTION_S = 1.0
+MAX_EJECTION_S = 60.0
+
+# Upstream statuses that reflect an unhealthy node rather than a bad query
+FAILURE_STATUS_CODES = {502, 503, 504}
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker for one upstream node.
+
+    `failure_threshold` consecutive failures (errors, or calls slower than
+    `slow_call_ms`) open the circuit and eject the node. The ejection time
+    doubles every time the node is ejected again without having recovered
+    in between, up to `max_ejection_s`. Once it elapses a single probe
+    request is let through (half-open): success closes the circuit, failure
+    opens it again.
+    """
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=FAILURE_THRESHOLD,
+        slow_call_ms=SLOW_CALL_MS,
+        base_ejection_s=BASE_EJECTION_S,
+        max_ejection_s=MAX_EJECTION_S,
+        clock=time.monotonic,
+        on_transition=None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_ms = slow_call_ms
+        self.base_ejection_s = base_ejection_s
+        self.max_ejection_s = max_ejection_s
+        self.clock = clock
+        self.on_transition = on_transition
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        if previous != state:
+            logging.warning(f"Circuit breaker {self.name}: {previous} -> {state}")
+            if self.on_transition is not None:
+                self.on_transition(self.name, previous, state, self.clock())
+
+    def _open(self):
+        self.ejections += 1
+        ejection = min(self.base_ejection_s * 2 ** (self.ejections - 1), self.max_ejection_s)
+        self.open_until = self.clock() + ejection
+        self._probe_in_flight = False
+        self._transition(OPEN)
+
+    def available(self):
+        """
+        Returns True when a request may currently be routed to this node,
+        without claiming the half-open probe slot.
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self.clock() >= self.open_until
+        return not self._probe_in_flight
+
+    def allow_request(self):
+        """
+        Returns True if a request may be sent now. In the half-open state only
+        one probe request is allowed at a time.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if self.clock() < self.open_until:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def release(self):
+        """
+        Gives back the half-open probe slot of a request that was admitted
+        by `allow_request` but never sent.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self, latency_ms=None):
+        """
+        Records a completed call. Calls slower than `slow_call_ms` count as failures.
+        """
+        if latency_ms is not None and self.slow_call_ms is not None and latency_ms > self.slow_call_ms:
+            self.record_failure()
+            return
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self.ejections = 0
+                self._probe_in_flight = False
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN:
+                self._open()
+            elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def record_response(self, status_code, latency_ms=None):
+        """
+        Records an HTTP response, counting FAILURE_STATUS_CODES as failures.
+        """
+        if status_code in FAILURE_STATUS_CODES:
+            self.record_failure()
+        else:
+            self.record_success(latency_ms)
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "open_for_s": round(max(self.open_until - self.clock(), 0.0), 3) if self.state == OPEN else 0.0,
+        }
+
+
+class BreakerRegistry:
+    """
+    Creates one circuit breaker per upstream node on demand and keeps a
+    bounded history of their state transitions.
+    """
+
+    def __init__(self, clock=time.monotonic, history_size=100, **breaker_options):
+        self.clock = clock
+        self.breaker_options = breaker_options
+        self.transitions = deque(maxlen=history_size)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _record_transition(self, name, previous, state, timestamp):
+        self.transitions.append({"node": name, "from": previous, "to": state, "at": timestamp})
+
+    def get(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        name, clock=self.clock, on_transition=self._record_transition, **self.breaker_options
+                    )
+                    self._breakers[name] = breaker
+        return breaker
+
+    def available(self, names):
+        """
+        Filters `names` down to the nodes whose circuit currently admits requests.
+        """
+        return [name for name in names if self.get(name).available()]
+
+    def snapshot(self):
+        return {
+            "breakers": {name: breaker.snapshot() for name, breaker in list(self._breakers.items())},
+            "transitions": list(self.transitions),
+        }
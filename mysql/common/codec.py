@@ -0,0 +1,190 @@
+import datetime
+import decimal
+import json
+import uuid
+from email.utils import format_datetime
+from functools import lru_cache
+from importlib.util import find_spec
+
+# Response encodings. JSON is always available; MessagePack needs msgpack
+# and Arrow needs pyarrow, and each is only offered where it is installed.
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# Older clients ask for MessagePack by its unregistered name
+_MIMETYPE_ALIASES = {"application/x-msgpack": MSGPACK_MIMETYPE}
+
+_MODULES = {MSGPACK_MIMETYPE: "msgpack", ARROW_MIMETYPE: "pyarrow"}
+
+# Rows per record batch of an Arrow stream
+ARROW_BATCH_ROWS = 10000
+
+# MessagePack extension types keeping DECIMAL and DATE columns typed
+_DECIMAL_EXT = 1
+_DATE_EXT = 2
+
+# Values JSON holds as they are
+JSON_TYPES = (str, int, float, bool, type(None), list, dict)
+
+
+@lru_cache(maxsize=None)
+def is_available(mimetype):
+    module = _MODULES.get(mimetype)
+    return mimetype == JSON_MIMETYPE or (module is not None and find_spec(module) is not None)
+
+
+def negotiate(accept):
+    """
+    Returns the encoding to answer an Accept header with: the available type
+    with the highest quality, the first listed on a tie. Wildcards and a
+    missing header select JSON.
+    """
+    best, best_quality = JSON_MIMETYPE, 0.0
+    for part in (accept or "").split(","):
+        mimetype, *parameters = part.split(";")
+        mimetype = mimetype.strip().lower()
+        mimetype = _MIMETYPE_ALIASES.get(mimetype, mimetype)
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality and is_available(mimetype):
+            best, best_quality = mimetype, quality
+    return best
+
+
+def upstream_accept():
+    """
+    Accept header sent to the data nodes, preferring MessagePack when this
+    process can decode it.
+    """
+    if is_available(MSGPACK_MIMETYPE):
+        return f"{MSGPACK_MIMETYPE}, {JSON_MIMETYPE};q=0.5"
+    return JSON_MIMETYPE
+
+
+def to_json_value(value):
+    """
+    Converts the column types JSON cannot hold the way jsonify does, so every
+    encoding of a result decodes to the same JSON. TIME columns become their
+    text, SET columns sorted lists and binary columns text with undecodable
+    bytes replaced.
+    """
+    if isinstance(value, decimal.Decimal) or isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return format_datetime(value.astimezone(datetime.timezone.utc), usegmt=True)
+    if isinstance(value, datetime.date):
+        return format_datetime(datetime.datetime.combine(value, datetime.time(), datetime.timezone.utc), usegmt=True)
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode(errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def to_json_row(row):
+    """
+    Converts the values of a result row to the JSON a data node returns for them.
+    """
+    return {column: value if isinstance(value, JSON_TYPES) else to_json_value(value) for column, value in row.items()}
+
+
+def _to_msgpack_value(value):
+    import msgpack
+
+    # Datetimes become MessagePack timestamps, read back in UTC
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, datetime.date):
+        return msgpack.ExtType(_DATE_EXT, value.isoformat().encode())
+    if isinstance(value, decimal.Decimal):
+        return msgpack.ExtType(_DECIMAL_EXT, str(value).encode())
+    return to_json_value(value)
+
+
+def _from_msgpack_ext(code, data):
+    import msgpack
+
+    if code == _DECIMAL_EXT:
+        return decimal.Decimal(data.decode())
+    if code == _DATE_EXT:
+        return datetime.date.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def _is_row_result(body):
+    return isinstance(body, dict) and isinstance(body.get("data"), list) and all(
+        isinstance(row, dict) for row in body["data"]
+    )
+
+
+def _encode_arrow(body):
+    import pyarrow as pa
+
+    table = pa.Table.from_pylist(body["data"])
+    rest = {key: value for key, value in body.items() if key != "data"}
+    table = table.replace_schema_metadata({"body": json.dumps(rest, default=to_json_value)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=ARROW_BATCH_ROWS)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_body(body, mimetype):
+    """
+    Encodes a response body as `mimetype` and returns it with the type it was
+    encoded as. Arrow holds the "data" rows of a read as typed columns;
+    bodies without rows, or rows Arrow cannot type, fall back to JSON.
+    """
+    if mimetype == ARROW_MIMETYPE and _is_row_result(body):
+        import pyarrow as pa
+
+        try:
+            return _encode_arrow(body), ARROW_MIMETYPE
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    elif mimetype == MSGPACK_MIMETYPE:
+        import msgpack
+
+        return msgpack.packb(body, default=_to_msgpack_value), MSGPACK_MIMETYPE
+    return json.dumps(body, default=to_json_value, separators=(",", ":")).encode(), JSON_MIMETYPE
+
+
+def decode_body(data, content_type):
+    """
+    Decodes a response body by its Content-Type, JSON when it has none.
+    Raises ValueError on a malformed body.
+    """
+    mimetype = (content_type or JSON_MIMETYPE).split(";")[0].strip().lower()
+    mimetype = _MIMETYPE_ALIASES.get(mimetype, mimetype)
+    if mimetype == MSGPACK_MIMETYPE:
+        import msgpack
+
+        try:
+            return msgpack.unpackb(data, timestamp=3, ext_hook=_from_msgpack_ext)
+        except Exception as e:
+            raise ValueError(f"Invalid MessagePack body: {e}") from e
+    if mimetype == ARROW_MIMETYPE:
+        import pyarrow as pa
+
+        try:
+            table = pa.ipc.open_stream(data).read_all()
+        except pa.ArrowException as e:
+            raise ValueError(f"Invalid Arrow body: {e}") from e
+        metadata = table.schema.metadata or {}
+        body = json.loads(metadata.get(b"body", b"{}"))
+        body["data"] = table.to_pylist()
+        return body
+    return json.loads(data)
@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+from collections import deque
+import mysql.connector
+
+# Default sizing and recycling of the MySQL connection pools
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 16
+DB_POOL_CHECKOUT_TIMEOUT = 5.0
+DB_POOL_MAX_LIFETIME = 1800.0
+DB_POOL_IDLE_TIMEOUT = 300.0
+DB_POOL_VALIDATE_AFTER = 5.0
+DB_POOL_MAINTENANCE_INTERVAL = 10.0
+
+
+class PoolTimeout(ConnectionError):
+    """
+    Raised when no pooled connection becomes free within the checkout timeout.
+    """
+
+
+class PooledConnection:
+    """
+    Connection checked out of a ConnectionPool. It behaves like the MySQL
+    connection it wraps, except that close() hands it back to the pool.
+    `state` is a dict kept with the underlying connection across checkouts,
+    such as its prepared statements.
+    """
+
+    def __init__(self, pool, connection, created_at, state):
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+        self._returned = False
+        self.state = state
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool._release(self._connection, self._created_at)
+
+    def __del__(self):
+        # A connection dropped on an error path without close() would
+        # otherwise keep its slot in the pool forever
+        self.discard()
+
+    def discard(self):
+        """
+        Closes the underlying connection instead of returning it to the pool.
+        """
+        if not self._returned:
+            self._returned = True
+            self._pool._discard(self._connection)
+
+
+class ConnectionPool:
+    """
+    Pool of warm MySQL connections shared by the threads of a worker.
+
+    The pool keeps at least `min_size` connections open and opens up to
+    `max_size`; callers beyond that wait up to `checkout_timeout` for one to
+    be returned. A connection idle for more than `validate_after` seconds is
+    pinged before it is handed out, connections older than `max_lifetime`
+    are replaced, and idle ones above `min_size` are closed after
+    `idle_timeout` by a maintenance thread.
+
+    A returned connection has its open transaction rolled back, so a read
+    does not leave a stale snapshot behind for the next caller.
+    """
+
+    def __init__(
+        self,
+        db_config,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        idle_timeout=DB_POOL_IDLE_TIMEOUT,
+        validate_after=DB_POOL_VALIDATE_AFTER,
+        maintenance_interval=DB_POOL_MAINTENANCE_INTERVAL,
+    ):
+        self.db_config = dict(db_config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self.maintenance_interval = maintenance_interval
+
+        # Idle connections as (connection, created_at, returned_at), most recently returned last
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._states = {}
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+
+        self.checkouts = 0
+        self.waited_checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.created = 0
+        self.closed = 0
+        self.validation_failures = 0
+
+        self._thread = threading.Thread(target=self._run_maintenance, name="db-pool", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        connection = mysql.connector.connect(**self.db_config)
+        with self._lock:
+            self.created += 1
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+        with self._lock:
+            self.closed += 1
+            self._states.pop(id(connection), None)
+
+    def _is_usable(self, connection, created_at, returned_at, now):
+        if now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at <= self.validate_after:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            with self._lock:
+                self.validation_failures += 1
+            return False
+
+    def acquire(self):
+        """
+        Checks a connection out of the pool. Raises PoolTimeout when the pool
+        stays saturated for `checkout_timeout` seconds, and mysql.connector
+        errors when a new connection cannot be opened.
+        """
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        while True:
+            with self._returned:
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection became free within {self.checkout_timeout}s")
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._returned.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    connection, created_at, returned_at = self._idle.pop()
+                else:
+                    connection = None
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    connection = self._open()
+                except Exception:
+                    self._forget()
+                    raise
+                created_at = time.monotonic()
+            elif not self._is_usable(connection, created_at, returned_at, time.monotonic()):
+                self._discard(connection)
+                continue
+
+            wait = time.monotonic() - started
+            with self._lock:
+                self.checkouts += 1
+                self.waited_checkouts += waited
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                state = self._states.setdefault(id(connection), {})
+            return PooledConnection(self, connection, created_at, state)
+
+    def _release(self, connection, created_at):
+        try:
+            if connection.in_transaction or connection.unread_result:
+                connection.rollback()
+        except mysql.connector.Error:
+            self._discard(connection)
+            return
+        if time.monotonic() - created_at > self.max_lifetime:
+            self._discard(connection)
+            return
+        with self._returned:
+            self._idle.append((connection, created_at, time.monotonic()))
+            self._returned.notify()
+
+    def _forget(self):
+        with self._returned:
+            self._size -= 1
+            self._returned.notify()
+
+    def _discard(self, connection):
+        self._close(connection)
+        self._forget()
+
+    def _run_maintenance(self):
+        while True:
+            try:
+                self.maintain()
+            except Exception:
+                logging.exception("Database pool maintenance failed")
+            time.sleep(self.maintenance_interval)
+
+    def maintain(self):
+        """
+        Closes idle connections that expired or idled past `idle_timeout`
+        beyond the minimum size, then opens connections up to `min_size`.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            kept = deque()
+            for entry in self._idle:
+                connection, created_at, returned_at = entry
+                too_old = now - created_at > self.max_lifetime
+                too_idle = now - returned_at > self.idle_timeout and self._size - len(expired) > self.min_size
+                if too_old or too_idle:
+                    expired.append(connection)
+                else:
+                    kept.append(entry)
+            self._idle = kept
+        for connection in expired:
+            self._discard(connection)
+
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except mysql.connector.Error as e:
+                self._forget()
+                logging.warning(f"Could not open a warm database connection: {e}")
+                return
+            self._release(connection, time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "saturation": round((self._size - len(self._idle)) / self.max_size, 3),
+                "checkouts": self.checkouts,
+                "waited_checkouts": self.waited_checkouts,
+                "timeouts": self.timeouts,
+                "average_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else None,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "created": self.created,
+                "closed": self.closed,
+                "validation_failures": self.validation_failures,
+            }
@@ -0,0 +1,118 @@
+import math
+import time
+from contextvars import ContextVar
+
+# Header carrying the time left to serve a request, in milliseconds. It is
+# a budget rather than a timestamp so the clocks of the tiers need not agree.
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+# Budget of a request arriving without a deadline, and the largest accepted
+DEFAULT_BUDGET = 30.0
+MAX_BUDGET = 300.0
+
+# Time kept back at each hop for the response to travel back
+HOP_MARGIN = 0.05
+
+_current = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when the deadline of a request passed before its work started.
+    """
+
+
+class Deadline:
+    """
+    Point in time by which a request must be answered, measured on this
+    host's monotonic clock from the budget the request arrived with.
+    """
+
+    def __init__(self, budget, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + budget
+
+    @classmethod
+    def from_headers(cls, headers, default=DEFAULT_BUDGET):
+        """
+        Returns the deadline of a request from its DEADLINE_HEADER, or one
+        `default` seconds away when the header is missing or malformed.
+        """
+        try:
+            budget = float(headers[DEADLINE_HEADER]) / 1000
+        except (KeyError, TypeError, ValueError):
+            budget = default
+        if math.isnan(budget):
+            budget = default
+        return cls(min(max(budget, 0.0), MAX_BUDGET))
+
+    def remaining(self):
+        return max(self.expires_at - self.clock(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded("Request deadline exceeded")
+
+    def headers(self):
+        """
+        Header passing the remaining budget on to the next hop, less HOP_MARGIN.
+        """
+        return {DEADLINE_HEADER: str(max(int((self.remaining() - HOP_MARGIN) * 1000), 0))}
+
+    def http_timeout(self, connect_timeout, read_timeout):
+        """
+        Returns the (connect, read) timeout of a call to the next hop, cut
+        down to the time left.
+        """
+        # requests rejects a zero timeout
+        remaining = max(self.remaining(), 0.001)
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    def execution_time_ms(self):
+        """
+        Returns the max_execution_time of the next statements, rounded down
+        to the second above one second left so consecutive requests mostly
+        reuse the session setting without outliving the deadline.
+        """
+        remaining_ms = self.remaining() * 1000
+        step = 1000 if remaining_ms >= 1000 else 100
+        return max(math.floor(remaining_ms / step) * step, 1)
+
+
+def set_current_deadline(deadline):
+    """
+    Makes `deadline` the deadline of the work running in this context: the
+    request a thread or task is serving.
+    """
+    _current.set(deadline)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def limit_execution_time(connection, deadline=None):
+    """
+    Bounds the SELECTs run next on a MySQL connection to the time left
+    before `deadline`, or the current deadline, through the session's
+    max_execution_time, so MySQL interrupts a read nobody waits for any
+    more. Without a deadline the limit is lifted. Raises DeadlineExceeded
+    when the deadline already passed. The setting is remembered in the
+    state of a pooled connection and only sent when it changes.
+    """
+    deadline = deadline or current_deadline()
+    limit = 0
+    if deadline is not None:
+        deadline.check()
+        limit = deadline.execution_time_ms()
+    state = getattr(connection, "state", None)
+    if state is not None and state.get("max_execution_time", 0) == limit:
+        return
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION max_execution_time = %s", (limit,))
+    cursor.close()
+    if state is not None:
+        state["max_execution_time"] = limit
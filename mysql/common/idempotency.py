@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+# Keys are opaque client strings, such as UUIDs
+MAX_KEY_LENGTH = 255
+_KEY_REGEX = re.compile(r"^[\x21-\x7e]+$")
+
+# Keys of the writes committed on the master, with the fingerprint of the
+# request and the result it got. A key is recorded in the transaction of
+# its write, so a write is either committed with its key or not at all.
+IDEMPOTENCY_KEYS_DDL = (
+    "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+    "idempotency_key VARCHAR(255) PRIMARY KEY, "
+    "fingerprint CHAR(64) NOT NULL, "
+    "response JSON NOT NULL, "
+    "created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3), "
+    "KEY idx_created_at (created_at))"
+)
+
+# MySQL error raised when a key is recorded twice
+_DUPLICATE_ENTRY = 1062
+
+
+def read_idempotency_key(data):
+    """
+    Returns the "idempotency_key" of a write request, or None when it has
+    none. Raises ValueError unless it is 1 to MAX_KEY_LENGTH printable
+    ASCII characters.
+    """
+    key = data.get("idempotency_key")
+    if key is None:
+        return None
+    if not isinstance(key, str) or len(key) > MAX_KEY_LENGTH or not _KEY_REGEX.match(key):
+        raise ValueError(f"idempotency_key must be 1 to {MAX_KEY_LENGTH} printable ASCII characters")
+    return key
+
+
+def request_fingerprint(*parts):
+    """
+    Digest of the parts of a write request a key stands for, so a key sent
+    again with another write is told apart from a retry.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def is_duplicate_key(err):
+    return getattr(err, "errno", None) == _DUPLICATE_ENTRY
+
+
+class IdempotencyConflict(ValueError):
+    """
+    Raised when a key is sent again with a different request.
+    """
+
+
+class IdempotencyStore:
+    """
+    Bounded, expiring table of the idempotency keys of committed writes.
+
+    Keys are kept at least `ttl` seconds. A purge thread, running every
+    `purge_interval` seconds on a connection from `connect`, deletes the
+    expired keys and then the oldest ones beyond `max_keys`.
+    """
+
+    def __init__(self, connect, ttl=86400.0, max_keys=1000000, purge_interval=60.0):
+        self.connect = connect
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.purge_interval = purge_interval
+        self._initialized = False
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.purged = 0
+        self._thread = threading.Thread(target=self._run_purge, name="idempotency-purge", daemon=True)
+        self._thread.start()
+
+    def ensure_table(self, connection):
+        """
+        Creates the idempotency_keys table once per process. DDL commits
+        implicitly, so this must run outside of a write transaction.
+        """
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            cursor = connection.cursor()
+            cursor.execute(IDEMPOTENCY_KEYS_DDL)
+            cursor.close()
+            self._initialized = True
+
+    def lookup(self, connection, key, fingerprint):
+        """
+        Returns the result stored for `key`, or None when it is unknown.
+        Raises IdempotencyConflict when it was recorded for another request.
+        """
+        cursor = connection.cursor()
+        cursor.execute("SELECT fingerprint, response FROM idempotency_keys WHERE idempotency_key = %s", (key,))
+        row = cursor.fetchone()
+        cursor.close()
+        if row is None:
+            return None
+        if row[0] != fingerprint:
+            with self._lock:
+                self.conflicts += 1
+            raise IdempotencyConflict(f"Idempotency key {key} was already used for a different request")
+        with self._lock:
+            self.replayed += 1
+        return json.loads(row[1])
+
+    def record(self, cursor, key, fingerprint, response):
+        """
+        Records the result of a write in its transaction. A concurrent write
+        with the same key waits on the row lock and then fails with a
+        duplicate entry error once this one commits.
+        """
+        cursor.execute(
+            "INSERT INTO idempotency_keys (idempotency_key, fingerprint, response) VALUES (%s, %s, %s)",
+            (key, fingerprint, json.dumps(response)),
+        )
+        with self._lock:
+            self.recorded += 1
+
+    def _run_purge(self):
+        while True:
+            time.sleep(self.purge_interval)
+            if not self._initialized:
+                continue
+            try:
+                self.purge()
+            except Exception:
+                logging.exception("Idempotency key purge failed")
+
+    def purge(self):
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < NOW(3) - INTERVAL %s SECOND", (self.ttl,)
+            )
+            purged = cursor.rowcount
+            cursor.execute("SELECT COUNT(*) FROM idempotency_keys")
+            excess = cursor.fetchone()[0] - self.max_keys
+            if excess > 0:
+                cursor.execute("DELETE FROM idempotency_keys ORDER BY created_at LIMIT %s", (excess,))
+                purged += cursor.rowcount
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        with self._lock:
+            self.purged += purged
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "max_keys": self.max_keys,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "conflicts": self.conflicts,
+                "purged": self.purged,
+            }
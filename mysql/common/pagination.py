@@ -0,0 +1,189 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+import re
+import threading
+from statements import PARAM_TYPES, execute_prepared
+
+# Rows per page when the request does not say, and the most it may ask for
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_IDENTIFIER_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_$]*$")
+
+# Primary key columns by table, looked up once per process
+_primary_keys = {}
+_primary_keys_lock = threading.Lock()
+
+
+def _is_identifier(name):
+    return isinstance(name, str) and bool(_IDENTIFIER_REGEX.match(name))
+
+
+def _read_identifiers(value, name):
+    if value is None:
+        return None
+    if not isinstance(value, list) or not value or not all(_is_identifier(column) for column in value):
+        raise ValueError(f"{name} must be a list of plain identifiers")
+    return value
+
+
+def encode_page_token(state):
+    """
+    Packs the position of a paginated read into an opaque URL-safe token.
+    """
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_page_token(token):
+    """
+    Unpacks a token made by `encode_page_token`. Raises ValueError when it
+    is malformed; its fields are validated like a first page request.
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid page token") from None
+    if not isinstance(state, dict):
+        raise ValueError("Invalid page token")
+    return state
+
+
+def read_page_request(data):
+    """
+    Returns the table, columns, key, filters, last key and page size of a
+    paginated read, from a first page request or from its "token". Raises
+    ValueError unless every name is a plain identifier and every value a
+    bindable parameter.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Table or token is missing")
+    token = data.get("token")
+    if token is not None:
+        if not isinstance(token, str):
+            raise ValueError("Invalid page token")
+        state = decode_page_token(token)
+    else:
+        state = {key: data.get(key) for key in ("table", "columns", "key", "filters")}
+
+    table = state.get("table")
+    if not _is_identifier(table):
+        raise ValueError("Table must be a plain identifier")
+    columns = _read_identifiers(state.get("columns"), "Columns")
+    key = _read_identifiers(state.get("key"), "Key")
+    filters = state.get("filters") or {}
+    if not isinstance(filters, dict) or not all(
+        _is_identifier(column) and isinstance(value, PARAM_TYPES) for column, value in filters.items()
+    ):
+        raise ValueError("Filters must map plain identifiers to strings, numbers, booleans or nulls")
+    after = state.get("after")
+    if after is not None and (
+        key is None or not isinstance(after, list) or len(after) != len(key)
+        or not all(isinstance(value, PARAM_TYPES) for value in after)
+    ):
+        raise ValueError("Invalid page token")
+
+    page_size = data.get("page_size", state.get("page_size", PAGE_SIZE))
+    if not isinstance(page_size, int) or isinstance(page_size, bool) or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be an integer between 1 and {MAX_PAGE_SIZE}")
+
+    return {
+        "table": table,
+        "columns": columns,
+        "key": key,
+        "filters": filters,
+        "after": after,
+        "page_size": page_size,
+    }
+
+
+def primary_key_columns(connection, table):
+    """
+    Returns the primary key columns of a table in index order, or an empty
+    list when it has none.
+    """
+    with _primary_keys_lock:
+        columns = _primary_keys.get(table)
+    if columns is None:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY' "
+            "ORDER BY ORDINAL_POSITION",
+            (table,),
+        )
+        columns = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        # A table without one may still get a primary key, so it is looked up again
+        if columns:
+            with _primary_keys_lock:
+                _primary_keys[table] = columns
+    return columns
+
+
+def page_statement(page):
+    """
+    Builds the keyset query of a page: the rows after the last key seen, in
+    key order, plus one row telling whether another page follows. The SQL
+    text only depends on the shape of the request, so every page of a read
+    reuses one prepared statement.
+    """
+    key = page["key"]
+    columns = page["columns"]
+    if columns:
+        selected = ", ".join(f"`{column}`" for column in columns + [column for column in key if column not in columns])
+    else:
+        selected = "*"
+    conditions = [f"`{column}` = ?" for column in sorted(page["filters"])]
+    params = [page["filters"][column] for column in sorted(page["filters"])]
+    if page["after"] is not None:
+        key_list = ", ".join(f"`{column}`" for column in key)
+        placeholders = ", ".join("?" for _ in key)
+        conditions.append(f"({key_list}) > ({placeholders})" if len(key) > 1 else f"`{key[0]}` > ?")
+        params.extend(page["after"])
+    sql = f"SELECT {selected} FROM `{page['table']}`"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + ", ".join(f"`{column}`" for column in key) + " LIMIT ?"
+    params.append(page["page_size"] + 1)
+    return sql, params
+
+
+def _token_value(value):
+    # Key values travel as JSON; MySQL converts the strings back on comparison
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (datetime.date, datetime.timedelta, decimal.Decimal)):
+        return str(value)
+    if not isinstance(value, PARAM_TYPES):
+        raise ValueError(f"Key values of type {type(value).__name__} cannot be paged")
+    return value
+
+
+def read_page(connection, data):
+    """
+    Runs one page of a keyset paginated read and returns {"data", "next"},
+    where "next" is the token of the following page or None after the last.
+
+    Pages are ordered by the table's primary key unless the request names a
+    unique "key". The token only holds the request and the last key seen,
+    so any node and worker can serve the next page, and each page is an
+    index range scan that costs the same however deep it is.
+    """
+    page = read_page_request(data)
+    if page["key"] is None:
+        page["key"] = primary_key_columns(connection, page["table"])
+        if not page["key"]:
+            raise ValueError(f"Table {page['table']} has no primary key; a unique key must be given")
+
+    sql, params = page_statement(page)
+    rows = execute_prepared(connection, sql, params).fetchall()
+    if len(rows) <= page["page_size"]:
+        return {"data": rows, "next": None}
+
+    rows = rows[:page["page_size"]]
+    last_row = {column.lower(): value for column, value in rows[-1].items()}
+    page["after"] = [_token_value(last_row[column.lower()]) for column in page["key"]]
+    return {"data": rows, "next": encode_page_token(page)}
@@ -0,0 +1,101 @@
+import threading
+
+# Single-row table holding the replication position of a data node. On the
+# master the position is the sequence number of the last committed write,
+# on a slave the last position up to which it applied every write.
+REPLICATION_STATE_DDL = (
+    "CREATE TABLE IF NOT EXISTS replication_state ("
+    "id TINYINT UNSIGNED PRIMARY KEY, "
+    "position BIGINT UNSIGNED NOT NULL)"
+)
+
+# Positions a slave applied past a missing write, kept until the gap is filled
+REPLICATION_APPLIED_DDL = (
+    "CREATE TABLE IF NOT EXISTS replication_applied ("
+    "position BIGINT UNSIGNED PRIMARY KEY)"
+)
+
+_initialized = False
+_initialized_lock = threading.Lock()
+
+
+def ensure_replication_state(connection):
+    """
+    Creates the replication_state table and its row, and the
+    replication_applied table, once per process. DDL commits implicitly,
+    so this must run outside of a write transaction.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _initialized_lock:
+        if _initialized:
+            return
+        cursor = connection.cursor()
+        cursor.execute(REPLICATION_STATE_DDL)
+        cursor.execute(REPLICATION_APPLIED_DDL)
+        cursor.execute("INSERT IGNORE INTO replication_state (id, position) VALUES (1, 0)")
+        connection.commit()
+        cursor.close()
+        _initialized = True
+
+
+def allocate_position(cursor):
+    """
+    Assigns the next position to the write running in the current transaction.
+    The row lock taken here orders positions the same way as commits.
+    """
+    cursor.execute("UPDATE replication_state SET position = LAST_INSERT_ID(position + 1) WHERE id = 1")
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    return cursor.fetchone()[0]
+
+
+def allocate_positions(cursor, count):
+    """
+    Assigns the next `count` consecutive positions to the writes running in
+    the current transaction, in one update of the row.
+    """
+    cursor.execute("UPDATE replication_state SET position = LAST_INSERT_ID(position + %s) WHERE id = 1", (count,))
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    last_position = cursor.fetchone()[0]
+    return list(range(last_position - count + 1, last_position + 1))
+
+
+def advance_position(cursor, position):
+    """
+    Records, in the current transaction, that the write at `position` was
+    applied, and returns the slave's position afterwards. The position only
+    moves when the write is the next one, and then past the writes already
+    applied after it; a write applied past a missing one is kept in
+    replication_applied, so the position never covers a write not applied.
+    """
+    cursor.execute("SELECT position FROM replication_state WHERE id = 1 FOR UPDATE")
+    current = cursor.fetchone()[0]
+    if position <= current:
+        return current
+    if position > current + 1:
+        cursor.execute("INSERT IGNORE INTO replication_applied (position) VALUES (%s)", (position,))
+        return current
+
+    cursor.execute("SELECT position FROM replication_applied WHERE position > %s ORDER BY position", (position,))
+    for (applied,) in cursor.fetchall():
+        if applied != position + 1:
+            break
+        position = applied
+    cursor.execute("DELETE FROM replication_applied WHERE position <= %s", (position,))
+    cursor.execute("UPDATE replication_state SET position = %s WHERE id = 1", (position,))
+    return position
+
+
+def read_applied_ahead(cursor):
+    """
+    Returns the positions applied past the slave's position, behind a gap.
+    """
+    cursor.execute("SELECT position FROM replication_applied")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def read_position(cursor):
+    cursor.execute("SELECT position FROM replication_state WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+
+# Prepared statements kept per connection, least recently used evicted first
+PREPARED_CACHE_SIZE = 64
+
+# Types a bound parameter may have in a request body
+PARAM_TYPES = (str, int, float, bool, type(None))
+
+
+def read_statement(data):
+    """
+    Returns the SQL text and parameters of a request body holding either a
+    raw "query" or a parameterized "sql" with its "params". The parameters
+    are None for a raw query. Raises ValueError when neither is valid.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Query is missing")
+    if "sql" in data:
+        sql = data["sql"]
+        params = data.get("params", [])
+        if not isinstance(sql, str) or not sql.strip():
+            raise ValueError("SQL is missing")
+        if not isinstance(params, list) or not all(isinstance(param, PARAM_TYPES) for param in params):
+            raise ValueError("Params must be a list of strings, numbers, booleans or nulls")
+        return sql, params
+    query = data.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("Query is missing")
+    return query, None
+
+
+def statement_payload(sql, params):
+    """
+    Builds the body fields forwarded for a statement read by `read_statement`.
+    """
+    if params is None:
+        return {"query": sql}
+    return {"sql": sql, "params": params}
+
+
+class PreparedStatementCache:
+    """
+    Server-side prepared statements of one connection, keyed by SQL text.
+
+    Each statement keeps its own prepared cursor, so executing the same SQL
+    again only sends the parameters. The cursors re-prepare whenever they
+    are given a different string object, so statements always run with the
+    SQL string they were cached under.
+    """
+
+    def __init__(self, max_size=PREPARED_CACHE_SIZE):
+        self.max_size = max_size
+        self._statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def execute(self, connection, sql, params):
+        """
+        Executes `sql` with `params` on its prepared cursor and returns the
+        cursor, whose rows are dictionaries.
+        """
+        entry = self._statements.get(sql)
+        if entry is None:
+            self.misses += 1
+            entry = (sql, connection.cursor(prepared=True, dictionary=True))
+            self._statements[sql] = entry
+            while len(self._statements) > self.max_size:
+                _, (_, evicted) = self._statements.popitem(last=False)
+                evicted.close()
+        else:
+            self.hits += 1
+            self._statements.move_to_end(sql)
+        cached_sql, cursor = entry
+        cursor.execute(cached_sql, params)
+        return cursor
+
+    def __len__(self):
+        return len(self._statements)
+
+
+_totals_lock = threading.Lock()
+_totals = {"hits": 0, "misses": 0}
+
+
+def execute_prepared(connection, sql, params):
+    """
+    Executes a parameterized statement through the prepared statement cache
+    of a pooled connection. Connections without per-connection state get a
+    cache of their own for the call.
+    """
+    state = getattr(connection, "state", None)
+    cache = PreparedStatementCache() if state is None else state.setdefault("statements", PreparedStatementCache())
+    hits, misses = cache.hits, cache.misses
+    try:
+        return cache.execute(connection, sql, params)
+    finally:
+        with _totals_lock:
+            _totals["hits"] += cache.hits - hits
+            _totals["misses"] += cache.misses - misses
+
+
+def prepared_statement_stats():
+    with _totals_lock:
+        lookups = _totals["hits"] + _totals["misses"]
+        return {
+            "cache_size": PREPARED_CACHE_SIZE,
+            "hits": _totals["hits"],
+            "misses": _totals["misses"],
+            "hit_ratio": round(_totals["hits"] / lookups, 3) if lookups else None,
+        }
+
+
+def execute_statement(connection, sql, params, **cursor_options):
+    """
+    Executes a raw query on a new cursor created with `cursor_options`, or a
+    parameterized one through the prepared statement cache. Returns the cursor.
+    """
+    if params is not None:
+        return execute_prepared(connection, sql, params)
+    cursor = connection.cursor(**cursor_options)
+    cursor.execute(sql)
+    return cursor
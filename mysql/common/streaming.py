@@ -0,0 +1,28 @@
+import json
+import requests
+
+# Media type of streamed reads: one JSON document per line
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Rows fetched from MySQL per round trip when streaming a result set
+STREAM_FETCH_SIZE = 500
+
+# Seconds a streamed read may run on MySQL, rows sent to a slow client
+# included, in place of the request's deadline; matches GUNICORN_TIMEOUT
+STREAM_BUDGET = 300.0
+
+
+def relay_stream(response):
+    """
+    Yields the body of a streamed upstream response as it arrives, without
+    buffering it, and releases the connection once it is consumed or the
+    client goes away. The status line is already sent when the upstream
+    fails mid-stream, so the failure is reported as a final error line.
+    """
+    try:
+        for chunk in response.iter_content(chunk_size=None):
+            yield chunk
+    except requests.RequestException as e:
+        yield (json.dumps({"error": f"Stream interrupted: {e}"}) + "\n").encode()
+    finally:
+        response.close()
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+MASTER_NODE_NAME = "mysql_master_node"
+
+# Minimum number of seconds between two stat() calls on a topology file
+RELOAD_CHECK_INTERVAL = 1.0
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Topology:
+    """
+    Parsed, pre-split view of an instance details file.
+    """
+
+    def __init__(self, instances):
+        self.instances = instances
+        self.master = next((instance for instance in instances if instance["Name"] == MASTER_NODE_NAME), None)
+        self.replicas = [instance for instance in instances if instance["Name"] != MASTER_NODE_NAME]
+        self.replica_ips = [instance["PublicIP"] for instance in self.replicas]
+        self.upstream_ips = [instance["PublicIP"] for instance in instances]
+        self.first_ip = self.upstream_ips[0] if self.upstream_ips else None
+        self.by_ip = {instance["PublicIP"]: instance for instance in instances}
+
+    def private_ip(self, public_ip):
+        """
+        Returns the VPC address of the node at `public_ip`, or `public_ip`
+        itself when the topology file does not record one.
+        """
+        return self.by_ip.get(public_ip, {}).get("PrivateIP") or public_ip
+
+
+class TopologyFile:
+    """
+    Keeps a topology file parsed in memory and reloads it only when its
+    mtime or inode changes, or after `invalidate()` has been called.
+    """
+
+    def __init__(self, path, check_interval=RELOAD_CHECK_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self._topology = None
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        name = os.path.basename(self.path)
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return
+            with open(self.path, "r") as file:
+                instances = json.load(file)
+        except FileNotFoundError:
+            if self._topology is not None:
+                logging.warning(f"{name} disappeared, keeping the last loaded topology")
+                return
+            logging.error(f"{name} not found")
+            raise FileNotFoundError(f"{name} not found")
+        except json.JSONDecodeError:
+            if self._topology is not None:
+                logging.warning(f"Error decoding JSON from {name}, keeping the last loaded topology")
+                return
+            logging.error(f"Error decoding JSON from {name}")
+            raise ValueError(f"Error decoding JSON from {name}")
+
+        self._topology = Topology(instances)
+        self._signature = signature
+        logging.info(f"Loaded topology from {name}: {len(instances)} instance(s)")
+
+    def get(self):
+        """
+        Returns the current topology, checking the file for changes at most
+        once every `check_interval` seconds.
+        """
+        now = self.clock()
+        if self._topology is not None and now < self._next_check:
+            return self._topology
+        with self._lock:
+            if self._topology is None or now >= self._next_check:
+                self._load()
+                self._next_check = now + self.check_interval
+        return self._topology
+
+    def invalidate(self):
+        """
+        Forces the next `get()` to re-read the file.
+        """
+        self._signature = None
+        self._next_check = 0.0
+
+
+def get_topology(path):
+    """
+    Returns the cached topology of `path`, loading it on first use.
+    """
+    topology_file = _registry.get(path)
+    if topology_file is None:
+        with _registry_lock:
+            topology_file = _registry.setdefault(path, TopologyFile(path))
+    return topology_file.get()
+
+
+def invalidate_all(*_):
+    """
+    Forces every cached topology to be re-read on its next use.
+    """
+    for topology_file in list(_registry.values()):
+        topology_file.invalidate()
+
+
+def install_reload_signal(signum=signal.SIGHUP):
+    """
+    Reloads every cached topology when the process receives `signum`.
+    """
+    try:
+        signal.signal(signum, invalidate_all)
+    except ValueError:
+        # Signal handlers can only be installed from the main thread
+        logging.warning("Could not install topology reload signal handler outside the main thread")
@@ -0,0 +1,136 @@
+import time
+import requests
+from deadline import current_deadline
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Default sizing and timeouts of the inter-tier HTTP clients
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 32
+CONNECT_TIMEOUT = 2.0
+READ_TIMEOUT = 30.0
+CONNECT_RETRIES = 2
+RETRY_BACKOFF_FACTOR = 0.05
+
+# Idempotent requests, such as writes carrying an idempotency key, are also
+# retried after read timeouts, dropped connections and these statuses
+IDEMPOTENT_RETRIES = 2
+RETRY_STATUS_CODES = {502, 503}
+
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP client shared by every request of a worker.
+
+    Connections are pooled per upstream host, every call gets a connect and
+    read timeout, and connection failures are retried with a small budget.
+    Only connect errors are retried by default since a POST that reached the
+    upstream may already have been applied. A request sent with
+    `idempotent=True` is retried on any failure, `idempotent_retries` times.
+
+    Within a request that has a deadline, the timeouts shrink to the time it
+    has left and the deadline is passed on to the upstream, unless
+    `propagate_deadline` is False.
+    """
+
+    def __init__(
+        self,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries=CONNECT_RETRIES,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        pool_block=False,
+        propagate_deadline=True,
+        idempotent_retries=IDEMPOTENT_RETRIES,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.propagate_deadline = propagate_deadline
+        self.idempotent_retries = idempotent_retries
+        self.backoff_factor = backoff_factor
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+            pool_block=pool_block,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def request(self, method, url, timeout=None, idempotent=False, **kwargs):
+        """
+        Sends a request through the pooled session. Raises requests.RequestException
+        on connection errors and timeouts, like requests does, and
+        requests.Timeout without sending anything once the deadline passed.
+        An idempotent request is sent again after a failure or a
+        RETRY_STATUS_CODES response, unless its body is a stream, which
+        cannot be sent twice.
+        """
+        data = kwargs.get("data")
+        if not idempotent or not (data is None or isinstance(data, (bytes, str, dict))):
+            return self._send(method, url, timeout, **kwargs)
+        for attempt in range(self.idempotent_retries + 1):
+            if attempt:
+                time.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            last_attempt = attempt == self.idempotent_retries
+            try:
+                response = self._send(method, url, timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                deadline = current_deadline() if self.propagate_deadline else None
+                if last_attempt or (deadline is not None and deadline.expired()):
+                    raise
+                continue
+            if last_attempt or response.status_code not in RETRY_STATUS_CODES:
+                return response
+            response.close()
+
+    def _send(self, method, url, timeout=None, **kwargs):
+        timeout = timeout or self.timeout
+        deadline = current_deadline() if self.propagate_deadline else None
+        if deadline is not None:
+            if deadline.expired():
+                raise requests.Timeout(f"Request deadline exceeded before calling {url}")
+            connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            timeout = deadline.http_timeout(connect_timeout, read_timeout)
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **deadline.headers()}
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def stats(self):
+        """
+        Returns per-host pool statistics. A request served on an already open
+        connection counts as a hit, one that had to open a connection as a miss.
+        """
+        pools = self.adapter.poolmanager.pools
+        hosts = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            misses = pool.num_connections
+            hits = max(pool.num_requests - misses, 0)
+            hosts[f"{pool.host}:{pool.port}"] = {
+                "requests": pool.num_requests,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / pool.num_requests, 4) if pool.num_requests else None,
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                "max_connections": pool.pool.maxsize if pool.pool else 0,
+            }
+        return {"hosts": hosts}
@@ -1,8 +1,15 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import re
 import requests
-import json
 import logging
+from batch import normalize_batch
+from bulk import CSV_MIMETYPE, read_bulk_target
+from deadline import Deadline, DeadlineExceeded, set_current_deadline
+from idempotency import read_idempotency_key
+from statements import read_statement
+from streaming import relay_stream
+from topology import get_topology, install_reload_signal
+from upstream import UpstreamClient
 
 app = Flask(__name__)
 
@@ -15,21 +22,53 @@ logging.basicConfig(
 # Regular expression for basic SQL injection prevention
 SQL_SANITIZATION_REGEX = re.compile(r"^[a-zA-Z0-9\s,.*_=<>@'\"()-]+;?$")
 
+# Parameterized SQL also allows "?" placeholders; the bound values are never
+# part of the SQL text, so they are type-checked instead of regex-checked
+PARAMETERIZED_SQL_REGEX = re.compile(r"^[a-zA-Z0-9\s,.*_=<>@'\"()?-]+;?$")
+
+# Table and column names accepted in paginated reads
+IDENTIFIER_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_$]*$")
+
+# Request headers relayed to the trusted host along with the raw body;
+# Accept selects the result encoding, which the response is relayed in
+FORWARDED_HEADERS = ("username", "password", "Accept", "Content-Type")
+
+install_reload_signal()
+
+# Pooled keep-alive client used to reach the trusted host
+upstream = UpstreamClient()
+
 
 # Utility function to load trusted host details
 def get_trusted_host_config():
     """
-    Loads trusted host details from the configuration file.
+    Returns the trusted host topology, reloaded only when trustedhost_info.json changes.
     """
-    try:
-        with open("trustedhost_info.json", "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        app.logger.error("trustedhost_info.json not found")
-        raise FileNotFoundError("trustedhost_info.json not found")
-    except json.JSONDecodeError:
-        app.logger.error("Error decoding JSON from trustedhost_info.json")
-        raise ValueError("Error decoding JSON from trustedhost_info.json")
+    return get_topology("trustedhost_info.json")
+
+
+# Utility function to relay a trusted host response
+def relay_response(resp):
+    """
+    Relays a response body as raw bytes while it arrives, with the content
+    type it came with, without decoding it.
+    """
+    return Response(relay_stream(resp), status=resp.status_code, content_type=resp.headers.get("Content-Type"))
+
+
+# Deadline of each request: a client may send its own budget in
+# X-Deadline-Ms, otherwise the default budget applies. The remaining time
+# is passed on at every hop and bounds the queries run on the data nodes.
+@app.before_request
+def start_deadline():
+    deadline = Deadline.from_headers(request.headers)
+    set_current_deadline(deadline)
+    deadline.check()
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(err):
+    return jsonify({"error": str(err)}), 504
 
 
 # Health Check Endpoint
@@ -42,6 +81,15 @@ def health_check():
     return jsonify({"status": "healthy"}), 200
 
 
+# Upstream Stats Endpoint
+@app.route("/stats/upstream", methods=["GET"])
+def upstream_stats():
+    """
+    Returns connection pool statistics of the upstream HTTP client.
+    """
+    return jsonify(upstream.stats()), 200
+
+
 # Process Query Endpoint
 @app.route("/process", methods=["POST"])
 def handle_query_request():
@@ -50,20 +98,23 @@ def handle_query_request():
     """
     app.logger.info("Processing query endpoint accessed")
     data = request.json
-    query = data.get("query")
+    try:
+        query, params = read_statement(data)
+        idempotency_key = read_idempotency_key(data)
+    except ValueError as e:
+        app.logger.warning(f"Invalid query: {e}")
+        return jsonify({"error": str(e)}), 400
     app.logger.debug(f"Received query: {query}")
 
     # Validate query for basic SQL injection prevention
-    if not query or not SQL_SANITIZATION_REGEX.match(query.strip()):
+    sanitization_regex = SQL_SANITIZATION_REGEX if params is None else PARAMETERIZED_SQL_REGEX
+    if not sanitization_regex.match(query.strip()):
         app.logger.warning("Query failed sanitization check")
         return jsonify({"error": "Query contains potentially dangerous characters or is not sanitized."}), 400
 
     try:
         # Load trusted host details
-        instance_details = get_trusted_host_config()
-        trusted_host_ip = next(
-            (instance["PublicIP"] for instance in instance_details), None
-        )
+        trusted_host_ip = get_trusted_host_config().first_ip
 
         if not trusted_host_ip:
             app.logger.error("No trusted host IP found in the configuration")
@@ -72,12 +123,16 @@ def handle_query_request():
         app.logger.info(f"Forwarding request to trusted host: {trusted_host_ip}")
         url = f"http://{trusted_host_ip}:80/process"
 
-        # Forward the request
-        resp = requests.post(url, json=data, headers=request.headers)
+        # Forward the request body as received and relay the result as it arrives.
+        # A write carrying an idempotency key is retried when the trusted host fails.
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        resp = upstream.post(
+            url, data=request.get_data(), headers=headers, stream=True, idempotent=idempotency_key is not None
+        )
 
         if resp.status_code == 200:
             app.logger.info("Query forwarded successfully")
-            return resp.json(), 200
+            return relay_response(resp)
         else:
             app.logger.error(f"Query forwarding failed with status code: {resp.status_code}")
             return jsonify({
@@ -99,6 +154,217 @@ def handle_query_request():
         }), 500
 
 
+# Process Query Batch Endpoint
+@app.route("/batch", methods=["POST"])
+def handle_batch_request():
+    """
+    Sanitizes every query of a batch and forwards the batch to the trusted
+    host in one request. A single rejected query rejects the whole batch.
+    """
+    app.logger.info("Processing batch endpoint accessed")
+    data = request.json
+    try:
+        items = normalize_batch(data)
+    except ValueError as e:
+        app.logger.warning(f"Invalid batch: {e}")
+        return jsonify({"error": str(e)}), 400
+
+    app.logger.debug(f"Received batch of {len(items)} queries")
+    for index, item in enumerate(items):
+        query, params = read_statement(item)
+        sanitization_regex = SQL_SANITIZATION_REGEX if params is None else PARAMETERIZED_SQL_REGEX
+        if not sanitization_regex.match(query.strip()):
+            app.logger.warning(f"Batch query {index} failed sanitization check")
+            return jsonify({
+                "error": f"Query {index} contains potentially dangerous characters or is not sanitized."
+            }), 400
+
+    try:
+        trusted_host_ip = get_trusted_host_config().first_ip
+
+        if not trusted_host_ip:
+            app.logger.error("No trusted host IP found in the configuration")
+            return jsonify({"error": "No trusted host found"}), 500
+
+        app.logger.info(f"Forwarding batch to trusted host: {trusted_host_ip}")
+        url = f"http://{trusted_host_ip}:80/batch"
+
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        resp = upstream.post(url, data=request.get_data(), headers=headers, stream=True)
+
+        if resp.status_code == 200:
+            app.logger.info("Batch forwarded successfully")
+            return relay_response(resp)
+        else:
+            app.logger.error(f"Batch forwarding failed with status code: {resp.status_code}")
+            return jsonify({"message": "Batch execution failed", "error": resp.text}), resp.status_code
+
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+    except requests.RequestException as e:
+        app.logger.error(f"Request exception occurred: {e}")
+        return jsonify({"message": "Batch forwarding failed", "error": str(e)}), 500
+
+
+# Bulk Insert Endpoint
+@app.route("/bulk", methods=["POST"])
+def handle_bulk_request():
+    """
+    Checks the table and columns of a bulk insert and relays its JSON or CSV
+    body to the trusted host. Row values are bound as parameters on the
+    master, so they are not sanitized.
+    """
+    app.logger.info("Processing bulk endpoint accessed")
+    if request.mimetype == CSV_MIMETYPE:
+        target, body = request.args, request.stream
+    else:
+        target = request.get_json(silent=True)
+        body = request.get_data()
+    try:
+        read_bulk_target(target)
+        idempotency_key = read_idempotency_key(target)
+    except ValueError as e:
+        app.logger.warning(f"Invalid bulk insert: {e}")
+        return jsonify({"error": str(e)}), 400
+    # A keyed CSV load is read whole, so it can be sent again
+    if idempotency_key is not None:
+        body = request.get_data()
+
+    try:
+        trusted_host_ip = get_trusted_host_config().first_ip
+
+        if not trusted_host_ip:
+            app.logger.error("No trusted host IP found in the configuration")
+            return jsonify({"error": "No trusted host found"}), 500
+
+        app.logger.info(f"Forwarding bulk insert to trusted host: {trusted_host_ip}")
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        resp = upstream.post(
+            f"http://{trusted_host_ip}:80/bulk",
+            data=body,
+            params=request.args,
+            headers=headers,
+            stream=True,
+            idempotent=idempotency_key is not None,
+        )
+
+        if resp.status_code == 200:
+            app.logger.info("Bulk insert forwarded successfully")
+            return relay_response(resp)
+        else:
+            app.logger.error(f"Bulk insert failed with status code: {resp.status_code}")
+            return jsonify({"message": "Bulk insert failed", "error": resp.text}), resp.status_code
+
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+    except requests.RequestException as e:
+        app.logger.error(f"Request exception occurred: {e}")
+        return jsonify({"message": "Bulk insert forwarding failed", "error": str(e)}), 500
+
+
+# Paginated Read Endpoint
+@app.route("/page", methods=["POST"])
+def handle_page_request():
+    """
+    Checks a paginated read and relays it to the trusted host. A first page
+    names its table and columns, which must be plain identifiers; later
+    pages only carry the opaque token, which the data node validates.
+    """
+    app.logger.info("Processing page endpoint accessed")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    if "token" in data:
+        if not isinstance(data["token"], str):
+            return jsonify({"error": "Invalid page token"}), 400
+    else:
+        names = [data.get("table")] + [name for field in ("columns", "key") for name in data.get(field) or []]
+        names += list(data.get("filters") or {})
+        if not all(isinstance(name, str) and IDENTIFIER_REGEX.match(name) for name in names):
+            app.logger.warning("Page request failed identifier check")
+            return jsonify({"error": "Table, columns, key and filters must name plain identifiers"}), 400
+
+    try:
+        trusted_host_ip = get_trusted_host_config().first_ip
+
+        if not trusted_host_ip:
+            app.logger.error("No trusted host IP found in the configuration")
+            return jsonify({"error": "No trusted host found"}), 500
+
+        app.logger.info(f"Forwarding page request to trusted host: {trusted_host_ip}")
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        resp = upstream.post(f"http://{trusted_host_ip}:80/page", data=request.get_data(), headers=headers, stream=True)
+
+        if resp.status_code == 200:
+            return relay_response(resp)
+        app.logger.error(f"Page request failed with status code: {resp.status_code}")
+        return jsonify({"message": "Page request failed", "error": resp.text}), resp.status_code
+
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+    except requests.RequestException as e:
+        app.logger.error(f"Request exception occurred: {e}")
+        return jsonify({"message": "Page request failed", "error": str(e)}), 500
+
+
+# Utility function to forward a transaction session call to the trusted host
+def forward_session_call(path):
+    try:
+        trusted_host_ip = get_trusted_host_config().first_ip
+
+        if not trusted_host_ip:
+            app.logger.error("No trusted host IP found in the configuration")
+            return jsonify({"error": "No trusted host found"}), 500
+
+        app.logger.info(f"Forwarding session call {path} to trusted host: {trusted_host_ip}")
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        resp = upstream.post(f"http://{trusted_host_ip}:80{path}", data=request.get_data(), headers=headers, stream=True)
+
+        if resp.status_code == 200:
+            return relay_response(resp)
+        app.logger.error(f"Session call failed with status code: {resp.status_code}")
+        return jsonify({"message": "Session call failed", "error": resp.text}), resp.status_code
+
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+    except requests.RequestException as e:
+        app.logger.error(f"Request exception occurred: {e}")
+        return jsonify({"message": "Session call failed", "error": str(e)}), 500
+
+
+# Open Transaction Session Endpoint
+@app.route("/session", methods=["POST"])
+def open_session():
+    """
+    Opens a transaction session and returns its token.
+    """
+    app.logger.info("Open session endpoint accessed")
+    return forward_session_call("/session")
+
+
+# Transaction Session Call Endpoint
+@app.route("/session/<token>/<action>", methods=["POST"])
+def session_call(token, action):
+    """
+    Forwards an execute, commit or rollback call made with a session token.
+    Queries run in the session are sanitized like /process.
+    """
+    data = request.get_json(silent=True) or {}
+    if action == "execute":
+        try:
+            query, params = read_statement(data)
+        except ValueError as e:
+            app.logger.warning(f"Invalid query: {e}")
+            return jsonify({"error": str(e)}), 400
+        sanitization_regex = SQL_SANITIZATION_REGEX if params is None else PARAMETERIZED_SQL_REGEX
+        if not sanitization_regex.match(query.strip()):
+            app.logger.warning("Session query failed sanitization check")
+            return jsonify({"error": "Query contains potentially dangerous characters or is not sanitized."}), 400
+    elif action not in ("commit", "rollback"):
+        return jsonify({"error": f"Unknown session action {action}"}), 404
+    return forward_session_call(f"/session/{token}/{action}")
+
+
 if __name__ == "__main__":
     app.logger.info("Starting Flask application")
     app.run(host="0.0.0.0", port=80)
@@ -0,0 +1,100 @@
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+# Only plain DML can share a transaction: statements such as DDL commit
+# implicitly, which would commit the rest of the group with them
+_GROUPABLE_REGEX = re.compile(r"^\s*(insert|update|delete|replace)\b", re.IGNORECASE)
+
+
+def is_groupable(query):
+    return bool(_GROUPABLE_REGEX.match(query))
+
+
+class GroupCommitter:
+    """
+    Gathers concurrent writes and commits them together.
+
+    A committer thread takes the writes queued within `max_wait` seconds of
+    the first one, or up to `batch_size` of them, and hands their statements
+    to `commit_fn(statements)`, which runs them in one transaction and
+    returns one result per statement. Each caller of `submit` receives its
+    own result, or the exception that failed the whole group.
+    """
+
+    def __init__(self, commit_fn, batch_size=32, max_wait=0.002):
+        self.commit_fn = commit_fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+        self.groups = 0
+        self.statements = 0
+        self.failed_groups = 0
+        self.total_wait = 0.0
+        self.total_commit_time = 0.0
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, statement):
+        """
+        Queues a write and blocks until its group is committed.
+        """
+        future = Future()
+        with self._queued:
+            self._pending.append((statement, future, time.monotonic()))
+            self._queued.notify()
+        return future.result()
+
+    def _next_group(self):
+        with self._queued:
+            self._queued.wait_for(lambda: self._pending)
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._queued.wait(remaining)
+            group = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            started = time.monotonic()
+            try:
+                results = self.commit_fn([statement for statement, _, _ in group])
+            except Exception as e:
+                logging.warning(f"Group commit of {len(group)} writes failed: {e}")
+                with self._lock:
+                    self.failed_groups += 1
+                for _, future, _ in group:
+                    future.set_exception(e)
+                continue
+            finished = time.monotonic()
+
+            with self._lock:
+                self.groups += 1
+                self.statements += len(group)
+                self.total_wait += sum(started - queued_at for _, _, queued_at in group)
+                self.total_commit_time += finished - started
+            for (_, future, _), result in zip(group, results):
+                future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "max_wait": self.max_wait,
+                "queued": len(self._pending),
+                "groups": self.groups,
+                "statements": self.statements,
+                "failed_groups": self.failed_groups,
+                "average_group_size": round(self.statements / self.groups, 2) if self.groups else None,
+                "average_wait_ms": round(self.total_wait / self.statements * 1000, 3) if self.statements else None,
+                "average_commit_ms": round(self.total_commit_time / self.groups * 1000, 3) if self.groups else None,
+            }
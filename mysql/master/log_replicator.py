@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from replication_log import LogGap
+
+# Replicator states of a slave
+SYNCING = "syncing"
+STREAMING = "streaming"
+STALLED = "stalled"
+
+
+class SlaveStream:
+    """
+    Replication progress of one slave: the last position it acknowledged
+    and the reason it is not streaming, if any.
+    """
+
+    def __init__(self, ip):
+        self.ip = ip
+        self.acked_position = None
+        self.state = SYNCING
+        self.last_error = None
+        self.entries_sent = 0
+        self.batches_sent = 0
+        self.stop_event = threading.Event()
+
+    def snapshot(self, last_position):
+        return {
+            "state": self.state,
+            "acked_position": self.acked_position,
+            "lag": None if self.acked_position is None else last_position - self.acked_position,
+            "entries_sent": self.entries_sent,
+            "batches_sent": self.batches_sent,
+            "last_error": self.last_error,
+        }
+
+
+class LogReplicator:
+    """
+    Streams the entries of a replication log to every slave, in order and
+    in batches, from one thread per slave.
+
+    A slave's stream starts from the position the slave reports with
+    `fetch_position_fn`, which it records in the same transaction as each
+    applied write, so a slave that was down resumes exactly where it
+    stopped. `send_fn(ip, entries)` ships a batch and returns the last
+    position the slave applied, or raises to report why it could not.
+    """
+
+    def __init__(self, log, targets_fn, send_fn, fetch_position_fn, batch_size=500, idle_wait=0.05,
+                 retry_backoff=0.5, max_retry_backoff=10.0, sync_interval=1.0):
+        self.log = log
+        self.targets_fn = targets_fn
+        self.send_fn = send_fn
+        self.fetch_position_fn = fetch_position_fn
+        self.batch_size = batch_size
+        self.idle_wait = idle_wait
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.sync_interval = sync_interval
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._acked = threading.Condition(self._lock)
+        self._thread = None
+
+    def _stream(self, stream):
+        backoff = self.retry_backoff
+        reader = None
+        while not stream.stop_event.is_set():
+            try:
+                if reader is None:
+                    stream.state = SYNCING
+                    position = self.fetch_position_fn(stream.ip)
+                    self._record_ack(stream, position)
+                    reader = self.log.reader(position)
+                    stream.state = STREAMING
+                    stream.last_error = None
+
+                entries = reader.read(self.batch_size)
+                if not entries:
+                    stream.stop_event.wait(self.idle_wait)
+                    continue
+
+                applied_position = self.send_fn(stream.ip, entries)
+                stream.batches_sent += 1
+                stream.entries_sent += len(entries)
+                self._record_ack(stream, applied_position)
+                if applied_position < entries[-1]["position"]:
+                    raise RuntimeError(f"Slave stopped applying the log after position {applied_position}")
+                backoff = self.retry_backoff
+            except LogGap as e:
+                # The slave needs a reseed, retrying cannot help until then
+                self._fail(stream, e, reader)
+                reader = None
+                stream.stop_event.wait(self.max_retry_backoff)
+            except Exception as e:
+                self._fail(stream, e, reader)
+                reader = None
+                stream.stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_retry_backoff)
+        if reader is not None:
+            reader.close()
+
+    def _fail(self, stream, error, reader):
+        logging.warning(f"Replication to {stream.ip} stalled: {error}")
+        stream.state = STALLED
+        stream.last_error = str(error)
+        if reader is not None:
+            reader.close()
+
+    def _record_ack(self, stream, position):
+        with self._acked:
+            if stream.acked_position is None or position > stream.acked_position:
+                stream.acked_position = position
+                self._acked.notify_all()
+
+    def wait_for(self, ips, position, required, timeout):
+        """
+        Waits until `required` of the slaves in `ips` acknowledged `position`,
+        or until `timeout` seconds passed. Returns the acknowledged position
+        of each slave.
+        """
+        def acked_positions():
+            return {ip: self._streams[ip].acked_position if ip in self._streams else None for ip in ips}
+
+        def satisfied():
+            positions = acked_positions().values()
+            return sum(1 for acked in positions if acked is not None and acked >= position) >= required
+
+        with self._acked:
+            self._acked.wait_for(satisfied, timeout)
+            return acked_positions()
+
+    def sync_targets(self):
+        """
+        Starts a stream for every new slave and stops the streams of removed ones.
+        """
+        targets = set(self.targets_fn())
+        with self._lock:
+            for ip in targets - set(self._streams):
+                stream = SlaveStream(ip)
+                self._streams[ip] = stream
+                threading.Thread(target=self._stream, args=(stream,), name=f"replicate-{ip}", daemon=True).start()
+            for ip in set(self._streams) - targets:
+                self._streams.pop(ip).stop_event.set()
+            acked = [stream.acked_position for stream in self._streams.values()]
+        if acked and None not in acked:
+            self.log.truncate(min(acked))
+
+    def _run(self):
+        while True:
+            try:
+                self.sync_targets()
+            except Exception:
+                logging.exception("Replication target refresh failed")
+            time.sleep(self.sync_interval)
+
+    def start(self):
+        self.sync_targets()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="replication-targets", daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        last_position = self.log.last_position
+        with self._lock:
+            return {ip: stream.snapshot(last_position) for ip, stream in self._streams.items()}
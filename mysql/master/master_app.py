@@ -1,7 +1,34 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import requests
+import csv
+import logging
 import mysql.connector
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bulk import CSV_MIMETYPE, bulk_insert_statements, iter_csv_rows, read_bulk_target
+from circuit_breaker import BreakerRegistry
+from codec import encode_body, negotiate
+from db_pool import ConnectionPool
+from deadline import Deadline, DeadlineExceeded, limit_execution_time, set_current_deadline
+from group_commit import GroupCommitter, is_groupable
+from idempotency import (
+    IdempotencyConflict,
+    IdempotencyStore,
+    is_duplicate_key,
+    read_idempotency_key,
+    request_fingerprint,
+)
+from log_replicator import LogReplicator
+from pagination import read_page
+from replication_fanout import ACK_ALL, ACK_LEVELS, ACK_LOCAL, ReplicationOutcomes, fan_out, required_acks
+from replication_log import ReplicationLog
+from replication_state import allocate_positions, ensure_replication_state, read_position
+from sessions import SessionLimitReached, SessionRegistry, is_session_statement
+from statements import execute_statement, prepared_statement_stats, read_statement, statement_payload
+from streaming import NDJSON_MIMETYPE, STREAM_BUDGET, STREAM_FETCH_SIZE
+from topology import get_topology, install_reload_signal
+from upstream import UpstreamClient
 
 app = Flask(__name__)
 
@@ -13,24 +40,598 @@ DB_CONFIG = {
     "database": "sakila",
 }
 
+# Warm MySQL connections shared by the threads of this worker
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 24
 
-# Utility function to establish a database connection
-def get_db_connection():
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+# Write replication settings: each slave replay has its own read timeout,
+# and the replays of one write run concurrently
+REPLAY_TIMEOUT = 5.0
+REPLAY_EXECUTOR_THREADS = 16
+DEFAULT_ACK_LEVEL = ACK_ALL
+
+install_reload_signal()
+
+# Pooled keep-alive client used to replay writes on the slaves. A committed
+# write is replicated even when its client stopped waiting, so replays do
+# not inherit the deadline of the request.
+upstream = UpstreamClient(read_timeout=REPLAY_TIMEOUT, propagate_deadline=False)
+replay_executor = ThreadPoolExecutor(max_workers=REPLAY_EXECUTOR_THREADS, thread_name_prefix="replay")
+
+# Per-slave outcomes of recent writes, including replays finished after the ack
+replication_outcomes = ReplicationOutcomes()
+
+# Durable replication log: when enabled, committed writes are appended to a
+# segmented log and streamed to the slaves by a background replicator rather
+# than replayed on the write path; ack levels then wait on the replicator.
+# The log is locked by one process, so the master must run a single worker.
+# Logged writes default to the "local" ack level, which then means the
+# write committed on the master and its log entry was fsynced; no slave is
+# waited on. Higher levels wait for the replicator to ship it as well.
+REPLICATION_LOG_ENABLED = False
+LOGGED_DEFAULT_ACK_LEVEL = ACK_LOCAL
+REPLICATION_LOG_DIRECTORY = "replication_log"
+REPLICATION_BATCH_SIZE = 500
+# Longest a committed write waits for its log entry to be fsynced before
+# it is answered with an error
+REPLICATION_LOG_DURABLE_TIMEOUT = 5.0
+
+_log_replicator = None
+_log_replicator_lock = threading.Lock()
+
+# Keeps log appends in commit order. It is held from allocating positions
+# to committing, like the row lock allocate_positions takes, but not while
+# waiting for the fsync, so concurrent writes share one flush of the log.
+_commit_lock = threading.Lock()
+
+# Group commit: when enabled, concurrent /write calls running plain DML are
+# executed in one transaction and committed together. A group closes after
+# GROUP_COMMIT_MAX_WAIT seconds or GROUP_COMMIT_BATCH_SIZE writes, trading
+# a little latency for fewer fsync-bound commits.
+GROUP_COMMIT_ENABLED = False
+GROUP_COMMIT_BATCH_SIZE = 32
+GROUP_COMMIT_MAX_WAIT = 0.002
+
+_group_committer = None
+_group_committer_lock = threading.Lock()
+
+# Transaction sessions: each holds a pooled connection with an open
+# transaction across calls until it commits, rolls back or idles for
+# SESSION_IDLE_TIMEOUT seconds
+SESSION_IDLE_TIMEOUT = 60.0
+MAX_SESSIONS = 16
+sessions = SessionRegistry(idle_timeout=SESSION_IDLE_TIMEOUT, max_sessions=MAX_SESSIONS)
+
+# Idempotency keys: a write sent with an "idempotency_key" records its result
+# under the key in its transaction, and the same write sent again with the
+# key gets that result back instead of running again. Keys are kept
+# IDEMPOTENCY_KEY_TTL seconds, and at most IDEMPOTENCY_MAX_KEYS of them.
+IDEMPOTENCY_KEY_TTL = 86400.0
+IDEMPOTENCY_MAX_KEYS = 1000000
+
+_idempotency_store = None
+_idempotency_store_lock = threading.Lock()
+
+# Circuit breakers of the slaves
+breakers = BreakerRegistry()
+
+
+# Utility function to open the database connection pool
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(DB_CONFIG, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+    return _db_pool
+
+
+# Utility function to check out a database connection
+def get_db_connection(deadline=None):
+    """
+    Checks a connection out of the pool; closing it returns it to the pool.
+    Its reads are limited to the time left before `deadline`, by default
+    the request's deadline.
+    """
     try:
-        return mysql.connector.connect(**DB_CONFIG)
+        connection = get_db_pool().acquire()
     except mysql.connector.Error as err:
         raise ConnectionError(f"Database connection failed: {err}")
+    try:
+        limit_execution_time(connection, deadline)
+    except Exception:
+        connection.close()
+        raise
+    return connection
 
 
 # Utility function to load instance details
 def get_instance_details():
+    return get_topology("instance_info.json")
+
+
+# Utility function to encode a response in the negotiated format
+def encoded_response(body, status=200):
+    """
+    Encodes a result as JSON, MessagePack or Arrow, as asked for by the
+    Accept header of the request. JSON is the default.
+    """
+    payload, mimetype = encode_body(body, negotiate(request.headers.get("Accept")))
+    return Response(payload, status=status, mimetype=mimetype)
+
+
+# Utility function to stream the rows of an executed query
+def stream_rows(connection, cursor):
+    """
+    Yields the rows of an executed query as NDJSON lines, STREAM_FETCH_SIZE
+    rows at a time. The status line is already sent when a fetch fails,
+    so the failure is reported as a final error line.
+    """
     try:
-        with open("instance_info.json", "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        raise FileNotFoundError("Instance details file not found")
-    except json.JSONDecodeError:
-        raise ValueError("Error decoding JSON from instance details file")
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            yield "".join(app.json.dumps(row) + "\n" for row in rows)
+    except mysql.connector.Error as err:
+        yield app.json.dumps({"error": str(err)}) + "\n"
+    finally:
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+
+# Utility function to open the replication log
+def get_log_replicator():
+    """
+    Opens the replication log and starts its replicator on first use.
+    """
+    global _log_replicator
+    if _log_replicator is None:
+        with _log_replicator_lock:
+            if _log_replicator is None:
+                log = ReplicationLog(REPLICATION_LOG_DIRECTORY)
+                reconcile_replication_log(log)
+                replicator = LogReplicator(
+                    log,
+                    lambda: get_instance_details().replica_ips,
+                    send_log_entries,
+                    fetch_slave_position,
+                    batch_size=REPLICATION_BATCH_SIZE,
+                )
+                replicator.start()
+                _log_replicator = replicator
+    return _log_replicator
+
+
+# Utility function to line the replication log up with the committed writes
+def reconcile_replication_log(log):
+    """
+    Drops the log entries past the master's replication position: writes
+    logged by a process that stopped before committing them.
+    """
+    connection = get_db_connection()
+    try:
+        ensure_replication_state(connection)
+        cursor = connection.cursor()
+        position = read_position(cursor)
+        cursor.close()
+        connection.rollback()
+    finally:
+        connection.close()
+    if log.last_position > position:
+        log.discard(position)
+    elif log.last_position < position:
+        logging.error(f"Replication log ends at position {log.last_position}, before the master's {position}")
+    log.mark_committed(log.last_position)
+
+
+# Utility function to start the idempotency key store
+def get_idempotency_store():
+    global _idempotency_store
+    if _idempotency_store is None:
+        with _idempotency_store_lock:
+            if _idempotency_store is None:
+                _idempotency_store = IdempotencyStore(
+                    get_db_connection, ttl=IDEMPOTENCY_KEY_TTL, max_keys=IDEMPOTENCY_MAX_KEYS
+                )
+    return _idempotency_store
+
+
+# Utility function to commit writes
+def commit_writes(connection, cursor, statements, before_commit=None):
+    """
+    Stamps the writes in progress with the next replication positions and
+    commits them. With the replication log enabled the writes, given as
+    statement payloads, are first appended to the log, in commit order, and
+    committed; when appending or committing fails, the transaction is rolled
+    back and the entries discarded. The call then waits, outside the commit
+    lock, for the entries to be fsynced, so the writes committed meanwhile
+    are made durable by the same flush. A crash in between leaves a
+    committed write missing from the log, which reconcile_replication_log
+    reports. `before_commit` is called with the positions inside the
+    transaction, right before it commits.
+    """
+    if not REPLICATION_LOG_ENABLED:
+        positions = allocate_positions(cursor, len(statements))
+        if before_commit is not None:
+            before_commit(positions)
+        connection.commit()
+        return positions
+
+    log = get_log_replicator().log
+    with _commit_lock:
+        positions = allocate_positions(cursor, len(statements))
+        if before_commit is not None:
+            before_commit(positions)
+        try:
+            for position, statement in zip(positions, statements):
+                log.append(position, statement)
+            connection.commit()
+        except (OSError, mysql.connector.Error) as err:
+            try:
+                connection.rollback()
+            except mysql.connector.Error:
+                pass
+            log.discard(positions[0] - 1)
+            if isinstance(err, OSError):
+                # Reported like a failed commit, which it now is
+                raise mysql.connector.errors.OperationalError(msg=f"Replication log append failed: {err}")
+            raise
+        log.mark_committed(positions[-1])
+
+    if not log.wait_durable(positions[-1], REPLICATION_LOG_DURABLE_TIMEOUT):
+        raise mysql.connector.errors.OperationalError(
+            msg=f"Write committed at position {positions[-1]} but its replication log entry was not synced"
+        )
+    return positions
+
+
+# Utility function to execute a write on the master
+def execute_local_write(connection, query, params=None, idempotency_key=None, fingerprint=None):
+    """
+    Executes a write and stamps it with the next replication position in
+    the same transaction. With an `idempotency_key`, the result is recorded
+    under the key in that transaction too; when a concurrent request with
+    the same key committed first, its result is returned instead.
+    """
+    try:
+        cursor = connection.cursor(buffered=True)
+        affected_rows = execute_statement(connection, query, params, buffered=True).rowcount
+        result = {"message": "Query executed successfully", "affected_rows": affected_rows}
+
+        def record_result(positions):
+            result["position"] = positions[0]
+            if idempotency_key is not None:
+                get_idempotency_store().record(cursor, idempotency_key, fingerprint, result)
+
+        commit_writes(connection, cursor, [statement_payload(query, params)], before_commit=record_result)
+        cursor.close()
+        return result
+    except mysql.connector.Error as err:
+        try:
+            connection.rollback()
+        except mysql.connector.Error:
+            pass
+        if idempotency_key is not None and is_duplicate_key(err):
+            stored = stored_write_result(connection, idempotency_key, fingerprint)
+            if stored is not None:
+                return stored
+        return {"message": "Query failed", "error": str(err), "affected_rows": 0}
+
+
+# Utility function to look up the result of an idempotent write
+def stored_write_result(connection, idempotency_key, fingerprint):
+    """
+    Returns the result recorded for `idempotency_key`, marked as replayed,
+    or None when no write committed with that key yet. Raises
+    IdempotencyConflict when the key was used for another request.
+    """
+    store = get_idempotency_store()
+    store.ensure_table(connection)
+    stored = store.lookup(connection, idempotency_key, fingerprint)
+    # Ends the snapshot of the lookup before a write runs on the connection
+    connection.rollback()
+    return None if stored is None else {**stored, "replayed": True}
+
+
+# Utility function to commit a group of writes in one transaction
+def commit_group(statements):
+    """
+    Executes the writes of a group, given as statement payloads, in one
+    transaction, each behind a savepoint so a failing write is rolled back
+    alone, then commits the successful ones together. Returns one /write
+    result per statement.
+    """
+    connection = get_db_connection()
+    try:
+        ensure_replication_state(connection)
+        cursor = connection.cursor(buffered=True)
+        results = []
+        for statement in statements:
+            try:
+                cursor.execute("SAVEPOINT group_write")
+                affected_rows = execute_statement(connection, *read_statement(statement), buffered=True).rowcount
+                results.append({"message": "Query executed successfully", "affected_rows": affected_rows})
+            except mysql.connector.Error as err:
+                # Fails the whole group if the error already ended the transaction
+                cursor.execute("ROLLBACK TO SAVEPOINT group_write")
+                results.append({"message": "Query failed", "error": str(err), "affected_rows": 0})
+
+        committed = [(statement, result) for statement, result in zip(statements, results) if "error" not in result]
+        if committed:
+            positions = commit_writes(connection, cursor, [statement for statement, _ in committed])
+            for (_, result), position in zip(committed, positions):
+                result["position"] = position
+        else:
+            connection.rollback()
+        cursor.close()
+        return results
+    except mysql.connector.Error:
+        try:
+            connection.rollback()
+        except mysql.connector.Error:
+            pass
+        raise
+    finally:
+        connection.close()
+
+
+# Utility function to start the group committer
+def get_group_committer():
+    global _group_committer
+    if _group_committer is None:
+        with _group_committer_lock:
+            if _group_committer is None:
+                _group_committer = GroupCommitter(
+                    commit_group, batch_size=GROUP_COMMIT_BATCH_SIZE, max_wait=GROUP_COMMIT_MAX_WAIT
+                )
+    return _group_committer
+
+
+# Utility function to replay a write on one slave
+def replay_to_slave(ip, path, payload):
+    """
+    Posts a replay request to a slave unless its circuit breaker is open.
+    Returns the decoded JSON body on success, otherwise the message and
+    error describing the failure.
+    """
+    breaker = breakers.get(ip)
+    if not breaker.allow_request():
+        return {"message": "Query forwarding skipped", "error": f"Circuit open for {ip}"}
+    try:
+        url = f"http://{ip}:80{path}"
+        print("Write replay URL:", url)
+        start_time = time.monotonic()
+        response = upstream.post(url, json=payload)
+        breaker.record_response(response.status_code, (time.monotonic() - start_time) * 1000)
+        if response.status_code == 200:
+            return {"body": response.json()}
+        return {"message": "Query forwarding failed", "error": response.json()}
+    except requests.RequestException as e:
+        breaker.record_failure()
+        return {"message": "Query forwarding failed", "error": str(e)}
+    except ValueError as e:
+        return {"message": "Query forwarding failed", "error": f"Invalid response from {ip}: {e}"}
+
+
+# Utility function to replay writes on the slaves
+def replay_to_slaves(public_ips, path, payload, required, on_late):
+    """
+    Replays a write to every slave concurrently and returns the outcomes
+    finished once `required` slaves acknowledged it. The remaining replays
+    complete in the background and are passed to `on_late(ip, outcome)`.
+    """
+    return fan_out(
+        replay_executor, lambda ip: replay_to_slave(ip, path, payload), public_ips, required, is_replica_ack, on_late
+    )
+
+
+def is_replica_ack(outcome):
+    return "body" in outcome and "error" not in outcome["body"]
+
+
+# Utility function to describe the outcome of a replayed write
+def replica_write_response(ip, outcome):
+    body = outcome.get("body")
+    if body is not None and "error" not in body:
+        return {
+            "node": ip,
+            "message": body.get("message", "No message provided"),
+            "affected_rows": body.get("affected_rows", 0),
+            "position": body.get("position"),
+            "applied_position": body.get("applied_position")
+        }
+    if body is not None:
+        return {"node": ip, "message": "Query failed", "error": body["error"], "affected_rows": 0}
+    return {"node": ip, "message": outcome["message"], "error": outcome["error"], "affected_rows": 0}
+
+
+# Utility function to ship replication log entries to a slave
+def send_log_entries(ip, entries):
+    """
+    Applies a batch of log entries on a slave and returns the last position
+    it applied. Entries the slave already applied are skipped by the slave.
+    """
+    outcome = replay_to_slave(ip, "/write/batch", {"queries": entries, "skip_applied": True})
+    if "body" not in outcome:
+        raise ConnectionError(f"{outcome['message']}: {outcome['error']}")
+    applied_position = entries[0]["position"] - 1
+    for entry, item in zip(entries, outcome["body"].get("results", [])):
+        if "error" in item:
+            raise RuntimeError(f"Slave failed to apply position {entry['position']}: {item['error']}")
+        applied_position = entry["position"]
+    return applied_position
+
+
+# Utility function to ask a slave for its replication position
+def fetch_slave_position(ip):
+    response = upstream.get(f"http://{ip}:80/position")
+    response.raise_for_status()
+    return response.json()["position"]
+
+
+# Utility function to wait for a logged write to be replicated
+def await_logged_replication(public_ips, position, required):
+    """
+    Waits until a logged write, already durable since commit_writes waited
+    for it, is applied by `required` slaves, for at most REPLAY_TIMEOUT.
+    Returns the position each slave applied.
+    """
+    return get_log_replicator().wait_for(public_ips, position, required, REPLAY_TIMEOUT)
+
+
+# Utility function to describe the replication of a logged write
+def logged_replica_responses(acked_positions, position):
+    return [
+        {"node": ip, "message": "Query replicated", "affected_rows": 0, "position": acked, "applied_position": acked}
+        if acked is not None and acked >= position else pending_replica_response(ip)
+        for ip, acked in acked_positions.items()
+    ]
+
+
+# Utility function to describe the replication of a past write
+def known_replica_responses(position):
+    """
+    Returns the per-slave outcomes still known for the write at `position`,
+    or None when they were already dropped.
+    """
+    if REPLICATION_LOG_ENABLED:
+        replicator = get_log_replicator()
+        if position > replicator.log.last_position:
+            return None
+        acked_positions = {ip: slave["acked_position"] for ip, slave in replicator.snapshot().items()}
+        return logged_replica_responses(acked_positions, position)
+    return replication_outcomes.get(position)
+
+
+def pending_replica_response(ip):
+    return {"node": ip, "message": "Replication pending", "pending": True, "affected_rows": 0}
+
+
+def count_acks(responses):
+    return sum(1 for response in responses if "error" not in response and not response.get("pending"))
+
+
+def ack_summary(level, required, acknowledged):
+    """
+    Describes how far the acknowledgement level of a write was met.
+    """
+    return {"level": level, "required": required, "acknowledged": acknowledged, "satisfied": acknowledged >= required}
+
+
+# Utility function to replicate committed writes to the slaves
+def replicate_writes(public_ips, statements, positions, ack_level):
+    """
+    Replicates writes committed at `positions`, given as statement payloads,
+    to each slave in a single request and waits for the "ack" level.
+    Returns the ack summary and the replica responses of every write.
+    """
+    required = required_acks(ack_level, len(public_ips))
+
+    # With the replication log, the replicator ships the writes to the slaves
+    if REPLICATION_LOG_ENABLED:
+        acked_positions = await_logged_replication(public_ips, positions[-1], required)
+        replicated = []
+        for position in positions:
+            replica_responses = logged_replica_responses(acked_positions, position)
+            replicated.append((ack_summary(ack_level, required, count_acks(replica_responses)), replica_responses))
+        return replicated
+
+    replay_payload = {
+        "queries": [{**statement, "position": position} for statement, position in zip(statements, positions)]
+    }
+
+    def record_outcome(ip, outcome):
+        for position, item_outcome in zip(positions, batch_item_outcomes(outcome, len(positions))):
+            replication_outcomes.record(position, replica_write_response(ip, item_outcome))
+
+    outcomes = replay_to_slaves(public_ips, "/write/batch", replay_payload, required, record_outcome)
+    summary = ack_summary(ack_level, required, sum(1 for outcome in outcomes.values() if is_replica_ack(outcome)))
+    replica_responses = [[] for _ in positions]
+    for ip in public_ips:
+        if ip in outcomes:
+            record_outcome(ip, outcomes[ip])
+            entries = [replica_write_response(ip, item) for item in batch_item_outcomes(outcomes[ip], len(positions))]
+        else:
+            entries = [pending_replica_response(ip)] * len(positions)
+        for responses, entry in zip(replica_responses, entries):
+            responses.append(entry)
+    return [(summary, responses) for responses in replica_responses]
+
+
+# Circuit Breaker Stats Endpoint
+@app.route("/stats/breakers", methods=["GET"])
+def breaker_stats():
+    """
+    Returns the circuit breaker state of every slave and recent transitions.
+    """
+    return jsonify(breakers.snapshot()), 200
+
+
+# Database Pool Stats Endpoint
+@app.route("/stats/db_pool", methods=["GET"])
+def db_pool_stats():
+    """
+    Returns the size, saturation and checkout waits of the connection pool.
+    """
+    return jsonify(get_db_pool().stats()), 200
+
+
+# Prepared Statement Stats Endpoint
+@app.route("/stats/statements", methods=["GET"])
+def statement_stats():
+    """
+    Returns the hit ratio of the prepared statement caches.
+    """
+    return jsonify(prepared_statement_stats()), 200
+
+
+# Group Commit Stats Endpoint
+@app.route("/stats/group_commit", methods=["GET"])
+def group_commit_stats():
+    """
+    Returns the group sizes, queueing delay and commit time of group commit.
+    """
+    if not GROUP_COMMIT_ENABLED:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **get_group_committer().stats()}), 200
+
+
+# Idempotency Key Stats Endpoint
+@app.route("/stats/idempotency", methods=["GET"])
+def idempotency_stats():
+    """
+    Returns how many idempotency keys were recorded, replayed and purged.
+    """
+    return jsonify(get_idempotency_store().stats()), 200
+
+
+# Upstream Stats Endpoint
+@app.route("/stats/upstream", methods=["GET"])
+def upstream_stats():
+    """
+    Returns connection pool statistics of the upstream HTTP client.
+    """
+    return jsonify(upstream.stats()), 200
+
+
+# Deadline of each request, from the budget its caller has left
+@app.before_request
+def start_deadline():
+    deadline = Deadline.from_headers(request.headers)
+    set_current_deadline(deadline)
+    deadline.check()
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(err):
+    return jsonify({"error": str(err)}), 504
 
 
 # Health Check Endpoint
@@ -45,36 +646,168 @@ def health_check():
         return jsonify({"status": "unhealthy", "error": str(err)}), 500
 
 
+# Replication Position Endpoint
+@app.route("/position", methods=["GET"])
+def replication_position():
+    try:
+        connection = get_db_connection()
+        ensure_replication_state(connection)
+        cursor = connection.cursor()
+        position = read_position(cursor)
+        connection.close()
+        return jsonify({"position": position}), 200
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+
 # Execute a Read Query Endpoint
 @app.route("/read", methods=["POST"])
 def read_data():
     data = request.json
-    query = data.get("query")
-    if not query:
-        return jsonify({"error": "Query is missing"}), 400
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     print("Read query:", query)
 
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(query)
+        cursor = execute_statement(connection, query, params, dictionary=True)
         rows = cursor.fetchall()
         connection.close()
-        return jsonify({"data": rows}), 200
+        return encoded_response({"data": rows})
     except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
         return jsonify({"error": str(err)}), 500
+
+
+# Stream a Read Query Endpoint
+@app.route("/read/stream", methods=["POST"])
+def read_stream():
+    """
+    Executes a read query on an unbuffered cursor and streams the rows as
+    NDJSON, so memory stays flat however many rows come back. The read may
+    run for STREAM_BUDGET rather than the request's deadline, since rows
+    keep flowing to the client long after it would have passed.
+    """
+    data = request.json
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        connection = get_db_connection(Deadline(STREAM_BUDGET))
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+
+    try:
+        cursor = execute_statement(connection, query, params, dictionary=True)
+    except mysql.connector.Error as err:
+        connection.close()
+        return jsonify({"error": str(err)}), 500
+    return Response(stream_rows(connection, cursor), mimetype=NDJSON_MIMETYPE)
+
+
+# Paginated Read Endpoint
+@app.route("/page", methods=["POST"])
+def page_data():
+    """
+    Returns one page of a table in key order and the token of the next page.
+    """
+    try:
+        connection = get_db_connection()
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    try:
+        return encoded_response(read_page(connection, request.get_json(silent=True)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except mysql.connector.Error as err:
         return jsonify({"error": str(err)}), 500
+    finally:
+        connection.close()
+
+
+# Execute a Batch of Read Queries Endpoint
+@app.route("/read/batch", methods=["POST"])
+def read_batch():
+    """
+    Executes a list of reads on one connection, each a query string or a
+    statement payload. Returns the results in request order, with an error
+    entry for each query that failed.
+    """
+    data = request.json
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Queries are missing"}), 400
+
+    try:
+        connection = get_db_connection()
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+
+    results = []
+    for query in queries:
+        try:
+            sql, params = read_statement({"query": query} if isinstance(query, str) else query)
+            cursor = execute_statement(connection, sql, params, dictionary=True, buffered=True)
+            results.append({"data": cursor.fetchall()})
+        except ValueError as e:
+            results.append({"error": str(e)})
+        except mysql.connector.Error as err:
+            results.append({"error": str(err)})
+    connection.close()
+    return encoded_response({"results": results})
+
+
+# Utility function to read the acknowledgement level of a write request
+def requested_ack_level(data):
+    default_level = LOGGED_DEFAULT_ACK_LEVEL if REPLICATION_LOG_ENABLED else DEFAULT_ACK_LEVEL
+    ack_level = data.get("ack", default_level)
+    if ack_level not in ACK_LEVELS:
+        raise ValueError(f"Invalid ack level. Allowed levels are: {', '.join(ACK_LEVELS)}")
+    return ack_level
+
+
+# Utility function to split the outcome of a batch replay per query
+def batch_item_outcomes(outcome, count):
+    if "body" in outcome:
+        return [{"body": item} for item in outcome["body"].get("results", [])]
+    return [outcome] * count
 
 
 # Execute a Write Query Endpoint
 @app.route("/write", methods=["POST"])
 def write_data():
+    """
+    Executes a write, then replays it to every slave concurrently. The
+    "ack" level (local, one, quorum or all) sets how many slaves must have
+    applied it before answering; slaves still replaying are reported as
+    pending and their outcome is kept under /replication/<position>. With
+    the replication log enabled, the write is logged instead and the
+    default "local" level answers once it is committed and fsynced in the
+    log; levels above local also wait on the log replicator. With group commit enabled, plain DML
+    is committed in one transaction with the writes arriving alongside it.
+    A write sent again with the "idempotency_key" of a committed one gets
+    its stored result back, marked "replayed", and is not run again.
+    """
     data = request.json
-    query = data.get("query")
-    if not query:
-        return jsonify({"error": "Query is missing"}), 400
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        ack_level = requested_ack_level(data)
+        idempotency_key = read_idempotency_key(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fingerprint = None if idempotency_key is None else request_fingerprint("write", query, params)
 
     print("Write Query:", query)
 
@@ -83,58 +816,402 @@ def write_data():
     except (FileNotFoundError, ValueError) as e:
         return jsonify({"error": str(e)}), 500
 
-    # Separate instance IDs and public IPs for forwarding
-    instance_ids = [instance["InstanceID"] for instance in instance_details if instance["Name"] != "mysql_master_node"]
-    public_ips = [instance["PublicIP"] for instance in instance_details if instance["Name"] != "mysql_master_node"]
+    # Public IPs of the slaves for forwarding
+    public_ips = instance_details.replica_ips
+
+    # Execute query locally and stamp it with the next replication position.
+    # Keyed writes are not grouped, since the key is recorded in their own transaction.
+    try:
+        if idempotency_key is None and GROUP_COMMIT_ENABLED and is_groupable(query):
+            local_response = get_group_committer().submit(statement_payload(query, params))
+        else:
+            connection = get_db_connection()
+            try:
+                ensure_replication_state(connection)
+                local_response = None
+                if idempotency_key is not None:
+                    local_response = stored_write_result(connection, idempotency_key, fingerprint)
+                if local_response is None:
+                    local_response = execute_local_write(connection, query, params, idempotency_key, fingerprint)
+            finally:
+                connection.close()
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except ConnectionError as err:
+        local_response = {"message": "Query failed", "error": str(err), "affected_rows": 0}
+    except mysql.connector.Error as err:
+        local_response = {"message": "Query failed", "error": str(err), "affected_rows": 0}
+
+    position = local_response.get("position")
+    if local_response.get("replayed"):
+        return jsonify([local_response] + (known_replica_responses(position) or [])), 200
+    required = required_acks(ack_level, len(public_ips))
+
+    # With the replication log, the replicator ships the write to the slaves
+    if REPLICATION_LOG_ENABLED:
+        responses = [local_response]
+        if position is not None:
+            replica_responses = logged_replica_responses(
+                await_logged_replication(public_ips, position, required), position
+            )
+            local_response["ack"] = ack_summary(ack_level, required, count_acks(replica_responses))
+            responses.extend(replica_responses)
+        return jsonify(responses), 200
+
+    # Forward query to other servers
+    replay_payload = statement_payload(query, params)
+    if position is not None:
+        replay_payload["position"] = position
+
+    def record_outcome(ip, outcome):
+        if position is not None:
+            replication_outcomes.record(position, replica_write_response(ip, outcome))
+
+    outcomes = replay_to_slaves(public_ips, "/write", replay_payload, required, record_outcome)
+    for ip, outcome in outcomes.items():
+        record_outcome(ip, outcome)
 
-    responses = []
+    replica_responses = [
+        replica_write_response(ip, outcomes[ip]) if ip in outcomes else pending_replica_response(ip)
+        for ip in public_ips
+    ]
+    local_response["ack"] = ack_summary(ack_level, required, count_acks(replica_responses))
+    responses = [local_response] + replica_responses
+
+    return jsonify(responses), 200
+
+
+# Execute a Batch of Write Queries Endpoint
+@app.route("/write/batch", methods=["POST"])
+def write_batch():
+    """
+    Executes a list of writes on one connection and replays the successful
+    ones to each slave in a single request, with the same "ack" levels as
+    /write. Each write is a query string or a statement payload, which may
+    carry its own "ack" and "idempotency_key"; the batch waits for the
+    highest ack level asked for. Returns, in request order, the same
+    per-node outcome list as /write for every query.
+    """
+    data = request.json
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Queries are missing"}), 400
+
+    try:
+        batch_ack_level = requested_ack_level(data)
+        writes = []
+        for query in queries:
+            item = {"query": query} if isinstance(query, str) else query
+            sql, params = read_statement(item)
+            ack_level = requested_ack_level({"ack": item.get("ack", batch_ack_level)})
+            idempotency_key = read_idempotency_key(item)
+            fingerprint = None if idempotency_key is None else request_fingerprint("write", sql, params)
+            writes.append((sql, params, ack_level, idempotency_key, fingerprint))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        public_ips = get_instance_details().replica_ips
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
 
-    # Execute query locally
     try:
         connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute(query)
-        connection.commit()
-        affected_rows = cursor.rowcount
+        try:
+            ensure_replication_state(connection)
+            local_responses = [batch_local_write(connection, *write) for write in writes]
+        finally:
+            connection.close()
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+    results = [[local_response] for local_response in local_responses]
+    for index, local_response in enumerate(local_responses):
+        if local_response.get("replayed"):
+            results[index].extend(known_replica_responses(local_response["position"]) or [])
+
+    replayed_indices = [
+        index for index, local_response in enumerate(local_responses)
+        if "position" in local_response and not local_response.get("replayed")
+    ]
+    if replayed_indices:
+        statements = [statement_payload(*writes[index][:2]) for index in replayed_indices]
+        positions = [local_responses[index]["position"] for index in replayed_indices]
+        wait_level = max((writes[index][2] for index in replayed_indices), key=ACK_LEVELS.index)
+        replicated = replicate_writes(public_ips, statements, positions, wait_level)
+        for index, (_, replica_responses) in zip(replayed_indices, replicated):
+            ack_level = writes[index][2]
+            required = required_acks(ack_level, len(public_ips))
+            local_responses[index]["ack"] = ack_summary(ack_level, required, count_acks(replica_responses))
+            results[index].extend(replica_responses)
+
+    return jsonify({"results": results}), 200
+
+
+# Utility function to execute one write of a batch
+def batch_local_write(connection, query, params, ack_level, idempotency_key, fingerprint):
+    """
+    Executes a write of a batch like /write does, returning the stored
+    result of a key already committed. A key used for another request, or
+    a failed key lookup, fails that write alone, since the writes before
+    it are already committed.
+    """
+    try:
+        if idempotency_key is not None:
+            stored = stored_write_result(connection, idempotency_key, fingerprint)
+            if stored is not None:
+                return stored
+        return execute_local_write(connection, query, params, idempotency_key, fingerprint)
+    except (IdempotencyConflict, mysql.connector.Error) as err:
+        return {"message": "Query failed", "error": str(err), "affected_rows": 0}
+
+
+# Bulk Insert Endpoint
+@app.route("/bulk", methods=["POST"])
+def bulk_insert():
+    """
+    Inserts many rows into one table in a single transaction, as multi-row
+    INSERTs sharing a prepared statement, and replicates them to each slave
+    in one batch with the requested "ack" level. Rows come as a JSON body
+    {"table", "columns", "rows"} or as a CSV stream, with the table and the
+    comma separated columns in the query arguments. Like /write, a load
+    sent again with the "idempotency_key" of a committed one is not run
+    again; for a CSV stream the key only stands for its table and columns.
+    """
+    csv_upload = request.mimetype == CSV_MIMETYPE
+    data = request.args if csv_upload else request.get_json(silent=True) or {}
+    try:
+        table, columns = read_bulk_target(data)
+        ack_level = requested_ack_level(data)
+        idempotency_key = read_idempotency_key(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = iter_csv_rows(request.stream) if csv_upload else data.get("rows")
+    if not csv_upload and (not isinstance(rows, list) or not rows):
+        return jsonify({"error": "Rows are missing"}), 400
+    fingerprint = None
+    if idempotency_key is not None:
+        fingerprint = request_fingerprint("bulk", table, columns, None if csv_upload else rows)
+
+    try:
+        public_ips = get_instance_details().replica_ips
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+
+    try:
+        connection = get_db_connection()
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+
+    # Closing the connection before the commit returns it to the pool rolled back
+    statements = []
+    local_response = {"message": "Bulk insert committed", "affected_rows": 0}
+
+    def record_result(positions):
+        local_response["statements"] = len(statements)
+        local_response["position"] = positions[-1]
+        if idempotency_key is not None:
+            get_idempotency_store().record(cursor, idempotency_key, fingerprint, local_response)
+
+    try:
+        ensure_replication_state(connection)
+        stored = None
+        if idempotency_key is not None:
+            stored = stored_write_result(connection, idempotency_key, fingerprint)
+        if stored is None:
+            try:
+                for statement in bulk_insert_statements(table, columns, rows):
+                    local_response["affected_rows"] += execute_statement(
+                        connection, statement["sql"], statement["params"]
+                    ).rowcount
+                    statements.append(statement)
+                if not statements:
+                    return jsonify({"error": "Rows are missing"}), 400
+                cursor = connection.cursor(buffered=True)
+                positions = commit_writes(connection, cursor, statements, before_commit=record_result)
+            except mysql.connector.Error as err:
+                # A concurrent load with the same key committed first
+                if idempotency_key is None or not is_duplicate_key(err):
+                    raise
+                connection.rollback()
+                stored = stored_write_result(connection, idempotency_key, fingerprint)
+                if stored is None:
+                    raise
+        if stored is not None:
+            return jsonify([stored] + (known_replica_responses(stored["position"]) or [])), 200
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except (ValueError, csv.Error) as e:
+        return jsonify({"error": str(e)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({"message": "Bulk insert failed", "error": str(err), "affected_rows": 0}), 500
+    finally:
         connection.close()
 
-        local_response = {
-            "message": "Query executed successfully",
-            "affected_rows": affected_rows
-        }
+    local_response["ack"], replica_responses = replicate_writes(public_ips, statements, positions, ack_level)[-1]
+    return jsonify([local_response] + replica_responses), 200
+
+
+# Open a Transaction Session Endpoint
+@app.route("/session", methods=["POST"])
+def open_session():
+    """
+    Starts a transaction on a dedicated pooled connection and returns the id
+    of the session that holds it.
+    """
+    try:
+        connection = get_db_connection()
+        ensure_replication_state(connection)
+        connection.start_transaction()
     except ConnectionError as err:
-        local_response = {"message": "Query failed", "error": str(err), "affected_rows": 0}
+        return jsonify({"error": str(err)}), 503
     except mysql.connector.Error as err:
-        local_response = {"message": "Query failed", "error": str(err), "affected_rows": 0}
+        return jsonify({"error": str(err)}), 500
+
+    try:
+        session = sessions.open(connection)
+    except SessionLimitReached as e:
+        connection.close()
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"session": session.id}), 200
 
-    responses.append(local_response)
 
-    # Forward query to other servers
-    for ip in public_ips:
+# Execute a Query in a Transaction Session Endpoint
+@app.route("/session/<session_id>/execute", methods=["POST"])
+def execute_in_session(session_id):
+    """
+    Runs a read or a DML statement in the transaction of a session. Writes
+    are kept to be replicated when the transaction commits.
+    """
+    data = request.json
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not is_session_statement(query):
+        return jsonify({"error": "Only SELECT, INSERT, UPDATE, DELETE and REPLACE can run in a session"}), 400
+
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session expired or unknown"}), 404
+    with session.lock:
+        if session.closed:
+            return jsonify({"error": "Session expired or unknown"}), 404
+        try:
+            limit_execution_time(session.connection)
+            cursor = execute_statement(session.connection, query, params, dictionary=True, buffered=True)
+            if cursor.with_rows:
+                return encoded_response({"data": cursor.fetchall()})
+            session.statements.append(statement_payload(query, params))
+            return jsonify({"message": "Query executed successfully", "affected_rows": cursor.rowcount}), 200
+        except mysql.connector.Error as err:
+            # Deadlocks and similar errors roll the whole transaction back
+            if not session.connection.in_transaction:
+                sessions.end(session, committed=False)
+                session.connection.close()
+                return jsonify({"error": f"Transaction rolled back: {err}"}), 409
+            return jsonify({"error": str(err)}), 500
+
+
+# Commit a Transaction Session Endpoint
+@app.route("/session/<session_id>/commit", methods=["POST"])
+def commit_session(session_id):
+    """
+    Commits the transaction of a session, stamping its writes with
+    consecutive positions, and replicates them like /write/batch with the
+    requested "ack" level. Returns the /write outcome list of the last write.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        ack_level = requested_ack_level(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        public_ips = get_instance_details().replica_ips
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session expired or unknown"}), 404
+    with session.lock:
+        if session.closed:
+            return jsonify({"error": "Session expired or unknown"}), 404
+        connection = session.connection
         try:
-            url = f"http://{ip}:80/write"
-            print("Write replay URL:", url)
-            response = requests.post(url, json={"query": query})
-            if response.status_code == 200:
-                json_response = response.json()
-                responses.append({
-                    "message": json_response.get("message", "No message provided"),
-                    "affected_rows": json_response.get("affected_rows", 0)
-                })
+            if session.statements:
+                positions = commit_writes(connection, connection.cursor(buffered=True), session.statements)
             else:
-                responses.append({
-                    "message": "Query forwarding failed",
-                    "error": response.json(),
-                    "affected_rows": 0
-                })
-        except requests.RequestException as e:
-            responses.append({
-                "message": "Query forwarding failed",
-                "error": str(e),
-                "affected_rows": 0
-            })
+                connection.commit()
+                positions = []
+            sessions.end(session, committed=True)
+        except mysql.connector.Error as err:
+            sessions.end(session, committed=False)
+            return jsonify({"error": f"Transaction rolled back: {err}"}), 500
+        finally:
+            connection.close()
 
-    return jsonify(responses), 200
+    local_response = {"message": "Transaction committed", "statements": len(session.statements), "positions": positions}
+    if not positions:
+        return jsonify([local_response]), 200
+    local_response["position"] = positions[-1]
+    local_response["ack"], replica_responses = replicate_writes(public_ips, session.statements, positions, ack_level)[-1]
+    return jsonify([local_response] + replica_responses), 200
+
+
+# Roll Back a Transaction Session Endpoint
+@app.route("/session/<session_id>/rollback", methods=["POST"])
+def rollback_session(session_id):
+    """
+    Rolls back the transaction of a session and releases its connection.
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session expired or unknown"}), 404
+    with session.lock:
+        if session.closed:
+            return jsonify({"error": "Session expired or unknown"}), 404
+        sessions.end(session, committed=False)
+        # Returning the connection to the pool rolls the transaction back
+        session.connection.close()
+    return jsonify({"message": "Transaction rolled back"}), 200
+
+
+# Transaction Session Stats Endpoint
+@app.route("/stats/sessions", methods=["GET"])
+def session_stats():
+    """
+    Returns the number of open transaction sessions and how past ones ended.
+    """
+    return jsonify(sessions.stats()), 200
+
+
+# Replication Log Stats Endpoint
+@app.route("/stats/replication", methods=["GET"])
+def replication_stats():
+    """
+    Returns the state of the replication log and the progress of each slave.
+    """
+    if not REPLICATION_LOG_ENABLED:
+        return jsonify({"enabled": False}), 200
+    replicator = get_log_replicator()
+    return jsonify({"enabled": True, "log": replicator.log.stats(), "slaves": replicator.snapshot()}), 200
+
+
+# Replication Outcome Endpoint
+@app.route("/replication/<int:position>", methods=["GET"])
+def replication_outcome(position):
+    """
+    Returns the per-slave outcomes of the write at `position`, including
+    replays that finished after the write was acknowledged.
+    """
+    entries = known_replica_responses(position)
+    if entries is None:
+        return jsonify({"error": f"No replication outcome for position {position}"}), 404
+    return jsonify({"position": position, "replicas": entries}), 200
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Acknowledgement levels of a write: how many slaves must have applied it
+# before the master answers
+ACK_LOCAL = "local"
+ACK_ONE = "one"
+ACK_QUORUM = "quorum"
+ACK_ALL = "all"
+ACK_LEVELS = (ACK_LOCAL, ACK_ONE, ACK_QUORUM, ACK_ALL)
+
+
+def required_acks(level, replica_count):
+    """
+    Returns how many slaves must acknowledge a write for `level`. A quorum
+    is a majority of all nodes, the master included.
+    """
+    if level == ACK_LOCAL:
+        return 0
+    if level == ACK_ONE:
+        return min(1, replica_count)
+    if level == ACK_QUORUM:
+        return (replica_count + 1) // 2
+    return replica_count
+
+
+def fan_out(executor, replay_fn, ips, required, is_ack, on_late):
+    """
+    Runs `replay_fn(ip)` for every slave concurrently and waits until
+    `required` outcomes satisfy `is_ack`, or until that can no longer happen.
+    Returns the outcomes finished by then, keyed by IP. Each replay still
+    running is left to complete in the background and its outcome is passed
+    to `on_late(ip, outcome)`.
+    """
+    futures = {executor.submit(replay_fn, ip): ip for ip in ips}
+    outcomes = {}
+    acknowledged = 0
+    pending = set(futures)
+    while pending and acknowledged < required <= acknowledged + len(pending):
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            outcome = future.result()
+            outcomes[futures[future]] = outcome
+            if is_ack(outcome):
+                acknowledged += 1
+
+    for future in pending:
+        future.add_done_callback(lambda future, ip=futures[future]: on_late(ip, future.result()))
+    return outcomes
+
+
+class ReplicationOutcomes:
+    """
+    Keeps the per-slave outcomes of the most recent writes by position, so
+    replays that finished after the write was acknowledged can be looked up.
+    """
+
+    def __init__(self, max_positions=10000):
+        self.max_positions = max_positions
+        self._outcomes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, position, entry):
+        with self._lock:
+            self._outcomes.setdefault(position, {})[entry["node"]] = entry
+            self._outcomes.move_to_end(position)
+            while len(self._outcomes) > self.max_positions:
+                self._outcomes.popitem(last=False)
+
+    def get(self, position):
+        with self._lock:
+            entries = self._outcomes.get(position)
+            return None if entries is None else list(entries.values())
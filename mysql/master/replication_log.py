@@ -0,0 +1,313 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+# Segments roll over once they grow past this size
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# How long the flusher waits to gather appends into one fsync
+FSYNC_INTERVAL = 0.005
+
+SEGMENT_SUFFIX = ".log"
+
+
+class LogGap(Exception):
+    """
+    Raised when the entries following a position are no longer, or were
+    never, in the log.
+    """
+
+
+class ReplicationLog:
+    """
+    Durable, append-only log of the writes committed by the master.
+
+    Entries are JSON lines holding a position and the statement fields of
+    a write ("query", or "sql" and "params"), appended in position order to
+    segment files named after their first position.
+    Appends only write to the page cache; a flusher thread fsyncs them in
+    batches every `fsync_interval` and advances `durable_position`, which
+    `wait_durable` callers block on. Writes are logged before the master
+    commits them, so readers only see entries up to `committed_position`,
+    and the entries of a write that failed to commit are dropped with
+    `discard`. An exclusive flock on the directory keeps a second process
+    from appending to the same log.
+    """
+
+    def __init__(self, directory, segment_max_bytes=SEGMENT_MAX_BYTES, fsync_interval=FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        # Held across an fsync so a discard never closes a file being synced
+        self._flush_lock = threading.Lock()
+        self._durable_changed = threading.Condition(self._lock)
+        self._appended_event = threading.Event()
+        self._retired = []
+        self.fsyncs = 0
+        self.fsynced_entries = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "LOCK"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(f"Replication log {directory} is locked by another process")
+
+        self.last_position = self._recover()
+        self.durable_position = self.last_position
+        self.committed_position = self.last_position
+        self._unsynced_entries = 0
+
+        self._thread = threading.Thread(target=self._run_flusher, name="replication-log-flusher", daemon=True)
+        self._thread.start()
+
+    def _segment_path(self, first_position):
+        return os.path.join(self.directory, f"{first_position:020d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        """
+        Returns the (first position, path) of every segment, oldest first.
+        """
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        return [(int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(self.directory, name)) for name in names]
+
+    def _recover(self):
+        """
+        Opens the newest segment for appending and returns the last logged
+        position. A torn line left by a crash mid-append is cut off.
+        """
+        segments = self.segments()
+        if not segments:
+            self._file = None
+            self._file_size = 0
+            return 0
+
+        _, path = segments[-1]
+        last_position = segments[-1][0] - 1
+        valid_size = 0
+        with open(path, "rb") as segment:
+            for line in segment:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_position = json.loads(line)["position"]
+                except (ValueError, KeyError):
+                    break
+                valid_size += len(line)
+        if valid_size != os.path.getsize(path):
+            logging.warning(f"Truncating torn entry at the end of {path}")
+            os.truncate(path, valid_size)
+        self._file = open(path, "a", encoding="utf-8")
+        self._file_size = valid_size
+        return last_position
+
+    def append(self, position, statement):
+        """
+        Appends a write about to be committed. Positions must be appended in
+        increasing order; the entry is durable once `wait_durable(position)`
+        returns.
+        """
+        line = json.dumps({"position": position, **statement}) + "\n"
+        with self._lock:
+            if position <= self.last_position:
+                raise ValueError(f"Position {position} is not after the last logged position {self.last_position}")
+            if self._file is None or self._file_size >= self.segment_max_bytes:
+                self._roll(position)
+            self._file.write(line)
+            # Handed to the page cache at once, so a crash of the process
+            # after the write commits does not lose its entry
+            self._file.flush()
+            self._file_size += len(line.encode("utf-8"))
+            self.last_position = position
+            self._unsynced_entries += 1
+        self._appended_event.set()
+
+    def mark_committed(self, position):
+        """
+        Lets readers ship the entries up to `position`, whose writes committed.
+        """
+        with self._lock:
+            self.committed_position = max(self.committed_position, position)
+
+    def discard(self, after_position):
+        """
+        Cuts off the entries after `after_position`, which were appended for
+        writes that did not commit. They must not have been marked committed.
+        """
+        with self._flush_lock, self._lock:
+            if after_position < self.committed_position:
+                raise ValueError(f"Position {after_position} is before the committed position {self.committed_position}")
+            if self.last_position <= after_position:
+                return
+            self._file.close()
+            self._file = None
+            self._file_size = 0
+            segments = self.segments()
+            # Segments started by a discarded entry go entirely
+            while segments and segments[-1][0] > after_position:
+                os.remove(segments.pop()[1])
+            if segments:
+                path = segments[-1][1]
+                valid_size = 0
+                with open(path, "rb") as segment:
+                    for line in segment:
+                        if json.loads(line)["position"] > after_position:
+                            break
+                        valid_size += len(line)
+                os.truncate(path, valid_size)
+                self._file = open(path, "a", encoding="utf-8")
+                self._file_size = valid_size
+                os.fsync(self._file.fileno())
+            # The kept entries are durable once the rolled segments are too
+            for segment in self._retired:
+                os.fsync(segment.fileno())
+                segment.close()
+            self._retired = []
+            self.last_position = after_position
+            self.durable_position = after_position
+            self._unsynced_entries = 0
+        logging.warning(f"Discarded replication log entries after position {after_position}")
+
+    def _roll(self, first_position):
+        if self._file is not None:
+            self._file.flush()
+            self._retired.append(self._file)
+        self._file = open(self._segment_path(first_position), "a", encoding="utf-8")
+        self._file_size = 0
+
+    def wait_durable(self, position, timeout=None):
+        """
+        Blocks until every entry up to `position` is fsynced. Returns False on timeout.
+        """
+        with self._durable_changed:
+            return self._durable_changed.wait_for(lambda: self.durable_position >= position, timeout)
+
+    def _flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if self.durable_position == self.last_position:
+                    return
+                target = self.last_position
+                entries = self._unsynced_entries
+                self._unsynced_entries = 0
+                self._file.flush()
+                files = self._retired + [self._file]
+                self._retired = []
+
+            for segment in files:
+                os.fsync(segment.fileno())
+            for segment in files[:-1]:
+                segment.close()
+
+            with self._durable_changed:
+                self.durable_position = target
+                self.fsyncs += 1
+                self.fsynced_entries += entries
+                self._durable_changed.notify_all()
+
+    def _run_flusher(self):
+        while True:
+            self._appended_event.wait()
+            time.sleep(self.fsync_interval)
+            self._appended_event.clear()
+            try:
+                self._flush()
+            except OSError:
+                logging.exception("Replication log fsync failed")
+
+    def reader(self, after_position):
+        return LogReader(self, after_position)
+
+    def truncate(self, applied_position):
+        """
+        Deletes the segments whose entries were all applied by every slave.
+        """
+        segments = self.segments()
+        for (_, path), (next_first, _) in zip(segments, segments[1:]):
+            if next_first - 1 <= applied_position:
+                logging.info(f"Deleting replicated log segment {path}")
+                os.remove(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "last_position": self.last_position,
+                "durable_position": self.durable_position,
+                "committed_position": self.committed_position,
+                "segments": len(self.segments()),
+                "fsyncs": self.fsyncs,
+                "entries_per_fsync": round(self.fsynced_entries / self.fsyncs, 2) if self.fsyncs else None,
+            }
+
+
+class LogReader:
+    """
+    Reads the committed entries of a replication log in order, starting
+    after a given position and following segment rollovers.
+    """
+
+    def __init__(self, log, after_position):
+        self.log = log
+        self.position = after_position
+        self._file = None
+        self._first_position = None
+
+    def _open_segment(self, position):
+        segments = self.log.segments()
+        candidates = [segment for segment in segments if segment[0] <= position]
+        if not candidates:
+            first = segments[0][0] if segments else self.log.last_position + 1
+            raise LogGap(f"Entries from position {position} are not in the log, which starts at {first}")
+        self._first_position, path = candidates[-1]
+        self._file = open(path, "r", encoding="utf-8")
+
+    def _next_segment(self):
+        """
+        Moves to the segment following the current one, if there is one.
+        """
+        later = [segment for segment in self.log.segments() if segment[0] > self._first_position]
+        if not later:
+            return False
+        self._file.close()
+        self._first_position, path = later[0]
+        self._file = open(path, "r", encoding="utf-8")
+        return True
+
+    def read(self, max_entries):
+        """
+        Returns up to `max_entries` committed entries following the last one
+        returned. Raises LogGap when the next entry is not in the log.
+        """
+        committed_position = min(self.log.committed_position, self.log.durable_position)
+        entries = []
+        if self.position >= committed_position:
+            return entries
+        if self._file is None:
+            self._open_segment(self.position + 1)
+
+        while len(entries) < max_entries and self.position < committed_position:
+            offset = self._file.tell()
+            line = self._file.readline()
+            if not line.endswith("\n"):
+                self._file.seek(offset)
+                if not self._next_segment():
+                    break
+                continue
+            entry = json.loads(line)
+            if entry["position"] <= self.position:
+                continue
+            if entry["position"] > committed_position:
+                self._file.seek(offset)
+                break
+            entries.append(entry)
+            self.position = entry["position"]
+        return entries
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
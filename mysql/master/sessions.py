@@ -0,0 +1,128 @@
+import logging
+import re
+import secrets
+import threading
+import time
+
+# Statements that commit implicitly, such as DDL, would end the transaction,
+# so a session only runs reads and plain DML
+_SESSION_STATEMENT_REGEX = re.compile(r"^\s*(select|insert|update|delete|replace)\b", re.IGNORECASE)
+
+
+def is_session_statement(query):
+    return bool(_SESSION_STATEMENT_REGEX.match(query))
+
+
+class SessionLimitReached(Exception):
+    """
+    Raised when opening a session while `max_sessions` are already open.
+    """
+
+
+class TransactionSession:
+    """
+    Open transaction holding a pooled connection. `statements` collects the
+    writes to replicate once the transaction commits. `lock` serializes the
+    calls made on the session, and `closed` is set once it ended.
+    """
+
+    def __init__(self, session_id, connection):
+        self.id = session_id
+        self.connection = connection
+        self.statements = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.opened_at = time.monotonic()
+        self.last_used = self.opened_at
+
+
+class SessionRegistry:
+    """
+    Open transaction sessions of this process, by session id.
+
+    A reaper thread rolls back sessions left idle for more than
+    `idle_timeout` seconds and returns their connection to the pool, so
+    abandoned transactions do not keep their row locks.
+    """
+
+    def __init__(self, idle_timeout=60.0, max_sessions=16, reap_interval=5.0):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.committed = 0
+        self.rolled_back = 0
+        self.expired = 0
+        self._thread = threading.Thread(target=self._run_reaper, name="session-reaper", daemon=True)
+        self._thread.start()
+
+    def open(self, connection):
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitReached(f"{self.max_sessions} transaction sessions are already open")
+            session = TransactionSession(secrets.token_urlsafe(16), connection)
+            self._sessions[session.id] = session
+            self.opened += 1
+            return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+            return session
+
+    def end(self, session, committed):
+        """
+        Forgets a session whose transaction ended. Must be called with the
+        session lock held; the caller releases the connection.
+        """
+        session.closed = True
+        with self._lock:
+            self._sessions.pop(session.id, None)
+            if committed:
+                self.committed += 1
+            else:
+                self.rolled_back += 1
+
+    def _run_reaper(self):
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception:
+                logging.exception("Session reaper failed")
+
+    def reap(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [session for session in self._sessions.values() if now - session.last_used > self.idle_timeout]
+        for session in idle:
+            # A session in use right now is not idle; it is checked again later
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                if session.closed:
+                    continue
+                logging.warning(f"Rolling back transaction session {session.id} idle for {self.idle_timeout}s")
+                session.closed = True
+                with self._lock:
+                    self._sessions.pop(session.id, None)
+                    self.expired += 1
+                session.connection.close()
+            finally:
+                session.lock.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+                "opened": self.opened,
+                "committed": self.committed,
+                "rolled_back": self.rolled_back,
+                "expired": self.expired,
+            }
@@ -30,11 +30,20 @@ def configure_mysql():
     commands = [
         "CREATE USER IF NOT EXISTS 'admin_elaa'@'localhost' IDENTIFIED WITH mysql_native_password BY 'admin_elaa_password123';",
         "GRANT ALL PRIVILEGES ON *.* TO 'admin_elaa'@'localhost';",
+        "CREATE USER IF NOT EXISTS 'proxy_reader'@'%' IDENTIFIED WITH mysql_native_password BY 'proxy_reader_password123';",
+        "GRANT SELECT ON sakila.* TO 'proxy_reader'@'%';",
         "FLUSH PRIVILEGES;",
         "CREATE DATABASE IF NOT EXISTS sysbench_test;"
     ]
     for command in commands:
         run_shell_command(f"echo \"{command}\" | sudo mysql", f"Failed to execute: {command}")
+
+    # Accept the direct read connections of the proxy manager
+    run_shell_command(
+        "sudo sed -i 's/^bind-address.*/bind-address = 0.0.0.0/' /etc/mysql/mysql.conf.d/mysqld.cnf",
+        "Failed to update bind-address"
+    )
+    run_shell_command("sudo systemctl restart mysql", "Failed to restart MySQL")
     print("MySQL user and database configured successfully.")
 
 
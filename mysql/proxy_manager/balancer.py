@@ -0,0 +1,114 @@
+import random
+import threading
+from contextlib import contextmanager
+
+LEAST_OUTSTANDING = "LEAST_OUTSTANDING"
+POWER_OF_TWO = "POWER_OF_TWO"
+WEIGHTED_ROUND_ROBIN = "WEIGHTED_ROUND_ROBIN"
+
+BALANCING_MODES = {LEAST_OUTSTANDING, POWER_OF_TWO, WEIGHTED_ROUND_ROBIN}
+
+
+class InFlightTracker:
+    """
+    Counts the requests currently outstanding on each upstream node.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, node):
+        with self._lock:
+            self._counts[node] = self._counts.get(node, 0) + 1
+
+    def release(self, node):
+        with self._lock:
+            count = self._counts.get(node, 0) - 1
+            if count > 0:
+                self._counts[node] = count
+            else:
+                self._counts.pop(node, None)
+
+    @contextmanager
+    def track(self, node):
+        """
+        Counts `node` as busy for the duration of the block.
+        """
+        self.acquire(node)
+        try:
+            yield
+        finally:
+            self.release(node)
+
+    def get(self, node):
+        return self._counts.get(node, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def least_outstanding(candidates, in_flight, rng=random):
+    """
+    Picks the candidate with the fewest outstanding requests, breaking ties at random.
+    """
+    if not candidates:
+        raise ValueError("No read nodes found")
+    lowest = min(in_flight(node) for node in candidates)
+    return rng.choice([node for node in candidates if in_flight(node) == lowest])
+
+
+def power_of_two_choices(candidates, in_flight, rng=random):
+    """
+    Samples two distinct candidates and picks the one with fewer outstanding requests.
+    """
+    if not candidates:
+        raise ValueError("No read nodes found")
+    if len(candidates) == 1:
+        return candidates[0]
+    first, second = rng.sample(candidates, 2)
+    return first if in_flight(first) <= in_flight(second) else second
+
+
+class WeightedRoundRobin:
+    """
+    Smooth weighted round robin: over one cycle each candidate is picked in
+    proportion to its weight, and picks of a heavy node are interleaved
+    with the others rather than sent in bursts.
+    """
+
+    def __init__(self):
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def select(self, candidates, weight):
+        if not candidates:
+            raise ValueError("No read nodes found")
+        with self._lock:
+            for node in list(self._current):
+                if node not in candidates:
+                    del self._current[node]
+            total = 0
+            best = None
+            for node in candidates:
+                node_weight = weight(node)
+                total += node_weight
+                self._current[node] = self._current.get(node, 0) + node_weight
+                if best is None or self._current[node] > self._current[best]:
+                    best = node
+            self._current[best] -= total
+            return best
+
+
+def select_node(strategy, candidates, in_flight, weight, round_robin, rng=random):
+    """
+    Applies one of the BALANCING_MODES to the candidate nodes.
+    """
+    if strategy == LEAST_OUTSTANDING:
+        return least_outstanding(candidates, in_flight, rng)
+    if strategy == POWER_OF_TWO:
+        return power_of_two_choices(candidates, in_flight, rng)
+    if strategy == WEIGHTED_ROUND_ROBIN:
+        return round_robin.select(candidates, weight)
+    raise ValueError(f"Unknown balancing strategy: {strategy}")
@@ -0,0 +1,97 @@
+import logging
+import threading
+import mysql.connector
+from mysql.connector import errors, pooling
+from codec import to_json_row
+from deadline import limit_execution_time
+
+# Read-only account created on every data node for the proxy manager
+DIRECT_DB_CONFIG = {
+    "user": "proxy_reader",
+    "password": "proxy_reader_password123",
+    "database": "sakila",
+    "port": 3306,
+    "connection_timeout": 2,
+}
+DIRECT_POOL_SIZE = 8
+
+
+class PoolExhausted(Exception):
+    """
+    Raised when every pooled connection to a node is in use.
+    """
+
+
+class NodeUnavailable(Exception):
+    """
+    Raised when the MySQL server of a node cannot be reached.
+    """
+
+
+class DirectBackend:
+    """
+    Runs read queries on the data nodes over pooled MySQL connections,
+    skipping the HTTP hop to the node's Flask app.
+
+    One pool is created per node on first use. `db_config` holds the
+    connection settings shared by every node, so the backend can be pointed
+    at a local MySQL server or a protocol stand-in by passing its port.
+    """
+
+    def __init__(self, db_config=None, pool_size=DIRECT_POOL_SIZE):
+        self.db_config = dict(DIRECT_DB_CONFIG if db_config is None else db_config)
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, host):
+        pool = self._pools.get(host)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(host)
+                if pool is None:
+                    logging.info(f"Opening a pool of {self.pool_size} MySQL connections to {host}")
+                    pool = pooling.MySQLConnectionPool(
+                        pool_name=f"direct-{host}", pool_size=self.pool_size, host=host, **self.db_config
+                    )
+                    self._pools[host] = pool
+        return pool
+
+    def read(self, host, query):
+        """
+        Executes a plain read query on `host` and returns the body the node's
+        /read endpoint would have produced: {"data": rows}, or an error dict when
+        the query fails. The query is limited to the time left before the
+        request's deadline. Raises PoolExhausted when no pooled connection is
+        free, NodeUnavailable when the node cannot be reached and
+        DeadlineExceeded when the deadline passed. Parameters are not
+        supported, and the node's prepared statement cache is not used.
+        """
+        try:
+            connection = self._pool(host).get_connection()
+        except errors.PoolError as e:
+            raise PoolExhausted(str(e))
+        except (errors.InterfaceError, errors.OperationalError) as e:
+            raise NodeUnavailable(str(e))
+        try:
+            limit_execution_time(connection)
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(query)
+            rows = [to_json_row(row) for row in cursor.fetchall()]
+            cursor.close()
+            return {"data": rows}
+        except (errors.InterfaceError, errors.OperationalError) as e:
+            raise NodeUnavailable(str(e))
+        except mysql.connector.Error as e:
+            return {"message": "Query execution failed", "error": str(e), "affected_rows": 0}
+        finally:
+            # Hands the connection back to the pool, which resets its session
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {host: {"pool_size": pool.pool_size} for host, pool in self._pools.items()}
+
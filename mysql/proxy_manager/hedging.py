@@ -0,0 +1,95 @@
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    """
+    Decides when a read should be hedged to a second replica.
+
+    The hedge delay is a percentile of the recently observed read latencies,
+    so only the slowest reads are duplicated. Hedges are paid for by a token
+    bucket that earns `budget_ratio` tokens per read, which caps the extra
+    load at that fraction of the traffic.
+    """
+
+    def __init__(
+        self,
+        percentile=0.95,
+        budget_ratio=0.05,
+        window=1000,
+        min_samples=20,
+        default_delay_ms=50.0,
+        min_delay_ms=1.0,
+        max_tokens=10.0,
+    ):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.default_delay_ms = default_delay_ms
+        self.min_delay_ms = min_delay_ms
+        self.max_tokens = max_tokens
+        self._latencies = deque(maxlen=window)
+        self._delay_ms = default_delay_ms
+        self._samples_since_refresh = 0
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denials = 0
+
+    def on_read(self):
+        """
+        Counts a hedge-eligible read and earns its share of the hedge budget.
+        """
+        with self._lock:
+            self.reads += 1
+            self._tokens = min(self._tokens + self.budget_ratio, self.max_tokens)
+
+    def record_latency(self, latency_ms):
+        """
+        Adds the latency of a completed read to the percentile window.
+        """
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self._samples_since_refresh += 1
+            if len(self._latencies) >= self.min_samples and self._samples_since_refresh >= self.min_samples:
+                ordered = sorted(self._latencies)
+                index = min(int(self.percentile * len(ordered)), len(ordered) - 1)
+                self._delay_ms = max(ordered[index], self.min_delay_ms)
+                self._samples_since_refresh = 0
+
+    def hedge_delay(self):
+        """
+        Returns how long, in seconds, to wait for the first replica before hedging.
+        """
+        return self._delay_ms / 1000
+
+    def try_acquire(self):
+        """
+        Spends one hedge from the budget. Returns False when the budget is exhausted.
+        """
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.hedges += 1
+                return True
+            self.budget_denials += 1
+            return False
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "reads": self.reads,
+                "hedges": self.hedges,
+                "hedge_rate": round(self.hedges / self.reads, 4) if self.reads else None,
+                "hedge_wins": self.hedge_wins,
+                "win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else None,
+                "budget_denials": self.budget_denials,
+                "hedge_delay_ms": round(self._delay_ms, 3),
+                "budget_ratio": self.budget_ratio,
+            }
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+
+
+class LatencyProber:
+    """
+    Keeps an EWMA latency and loss table per replica so CUSTOMIZED routing
+    can pick the fastest node without probing on the request path.
+
+    The table is refreshed by a background thread that calls `probe_fn` for
+    every address returned by `targets_fn`, and is also fed with the response
+    times the proxy observes when it forwards queries. `clock` and `probe_fn`
+    are injectable so the table can be driven deterministically.
+    """
+
+    def __init__(self, probe_fn, targets_fn, interval=2.0, alpha=0.3, stale_after=30.0, clock=time.monotonic):
+        self.probe_fn = probe_fn
+        self.targets_fn = targets_fn
+        self.interval = interval
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.clock = clock
+        self._table = {}
+        self._best = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _update(self, ip, latency_ms):
+        """
+        Folds one sample into the EWMA entry of a replica. A latency of None
+        counts as a lost probe.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._table.get(ip)
+            lost = 1.0 if latency_ms is None else 0.0
+            if entry is None:
+                entry = {"latency_ms": latency_ms, "loss": lost, "samples": 0, "last_update": now}
+                self._table[ip] = entry
+            else:
+                entry["loss"] += self.alpha * (lost - entry["loss"])
+                if latency_ms is not None:
+                    if entry["latency_ms"] is None:
+                        entry["latency_ms"] = latency_ms
+                    else:
+                        entry["latency_ms"] += self.alpha * (latency_ms - entry["latency_ms"])
+                entry["last_update"] = now
+            entry["samples"] += 1
+            self._recompute_best(now)
+
+    def _score(self, entry, now):
+        """
+        Expected latency of a replica, inflated by its loss rate. Replicas
+        with no successful sample or a stale entry are not eligible.
+        """
+        if entry["latency_ms"] is None or now - entry["last_update"] > self.stale_after:
+            return None
+        return entry["latency_ms"] / max(1.0 - entry["loss"], 0.05)
+
+    def _recompute_best(self, now):
+        best_ip, best_score = None, float("inf")
+        for ip, entry in self._table.items():
+            score = self._score(entry, now)
+            if score is not None and score < best_score:
+                best_ip, best_score = ip, score
+        self._best = best_ip
+
+    def observe(self, ip, latency_ms):
+        """
+        Records an upstream response time measured on the request path.
+        """
+        self._update(ip, latency_ms)
+
+    def observe_failure(self, ip):
+        """
+        Records a failed upstream call as a lost sample.
+        """
+        self._update(ip, None)
+
+    def refresh(self):
+        """
+        Probes every current target once and drops replicas that are no longer
+        part of the topology.
+        """
+        targets = list(self.targets_fn())
+        for ip in targets:
+            self._update(ip, self.probe_fn(ip))
+        with self._lock:
+            for ip in list(self._table):
+                if ip not in targets:
+                    del self._table[ip]
+            self._recompute_best(self.clock())
+
+    def best(self):
+        """
+        Returns the address of the replica with the lowest score, or None when
+        no replica has been measured yet.
+        """
+        return self._best
+
+    def snapshot(self):
+        """
+        Returns a copy of the latency table suitable for JSON serialization.
+        """
+        now = self.clock()
+        with self._lock:
+            return {
+                "best": self._best,
+                "replicas": {
+                    ip: {
+                        "latency_ms": entry["latency_ms"],
+                        "loss": round(entry["loss"], 4),
+                        "samples": entry["samples"],
+                        "age_s": round(now - entry["last_update"], 3),
+                        "score": self._score(entry, now),
+                    }
+                    for ip, entry in self._table.items()
+                },
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception("Latency probe round failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Starts the background probe thread if it is not already running.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="latency-prober", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
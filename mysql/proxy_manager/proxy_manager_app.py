@@ -1,109 +1,123 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import requests
-import subprocess
-import json
-import random
+import contextvars
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+from batch import normalize_batch
+from bulk import CSV_MIMETYPE, read_bulk_target
+from codec import decode_body, encode_body, negotiate, upstream_accept
+from deadline import Deadline, DeadlineExceeded, set_current_deadline
+from routing import (
+    SESSION_ACTIONS,
+    batch_request,
+    breakers,
+    direct_backend_stats,
+    direct_read,
+    fetch_master_node,
+    forward_payload,
+    get_latency_prober,
+    get_position_tracker,
+    hedge_policy,
+    in_flight,
+    load_instance_details,
+    lookup_cached_result,
+    merge_batch_response,
+    page_token,
+    plan_batch,
+    record_batch_results,
+    record_bulk_result,
+    record_node_failure,
+    record_node_response,
+    record_result,
+    record_session_result,
+    record_write_positions,
+    resolve_page,
+    resolve_session_url,
+    resolve_target,
+    result_cache,
+    select_hedge_target,
+    session_token,
+    should_hedge,
+    should_read_directly,
+)
+from statements import read_statement, statement_payload
+from streaming import NDJSON_MIMETYPE, relay_stream
+from topology import install_reload_signal
+from upstream import UpstreamClient
 
 app = Flask(__name__)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+install_reload_signal()
 
-# Utility Functions
-def load_instance_details():
-    """
-    Loads instance details from the configuration file.
-    """
-    try:
-        with open("instance_info.json", "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        logging.error("instance_info.json not found")
-        raise FileNotFoundError("instance_info.json not found")
-    except json.JSONDecodeError:
-        logging.error("Error decoding JSON from instance_info.json")
-        raise ValueError("Error decoding JSON from instance_info.json")
-
-
-def ping_address(ip):
-    """
-    Pings an IP address and returns the average ping time in milliseconds.
-    Returns None if the ping fails.
-    """
-    command = ["ping", "-c", "1", ip]
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            output = result.stdout
-            time_line = next(line for line in output.splitlines() if "time=" in line)
-            time_ms = float(time_line.split("time=")[1].split()[0])
-            return time_ms
-        return None
-    except Exception as e:
-        logging.warning(f"Ping failed for IP {ip}: {e}")
-        return None
-
-
-def find_lowest_latency_instance(instance_details):
-    """
-    Finds the instance with the lowest ping.
-    """
-    lowest_ping = float("inf")
-    best_instance = None
+# Pooled keep-alive client used to reach the data nodes
+upstream = UpstreamClient()
 
-    for instance in instance_details:
-        if instance["Name"] != "mysql_master_node":
-            ip = instance["PublicIP"]
-            ping_time = ping_address(ip)
-            if ping_time is not None and ping_time < lowest_ping:
-                lowest_ping = ping_time
-                best_instance = instance
+# Threads running the hedged reads and the per-node requests of batches
+FORWARD_EXECUTOR_THREADS = 32
+forward_executor = ThreadPoolExecutor(max_workers=FORWARD_EXECUTOR_THREADS, thread_name_prefix="forward")
 
-    if best_instance:
-        return best_instance["InstanceID"], best_instance["PublicIP"]
-    raise ValueError("No instance with a valid ping found")
 
-
-def select_random_read_node(instance_details):
+# Utility Functions
+def submit_forward(fn, *args, **kwargs):
     """
-    Finds a random read node IP.
+    Runs `fn` on the forward executor within the deadline of the request.
     """
-    read_nodes = [instance for instance in instance_details if instance["Name"] != "mysql_master_node"]
-    if not read_nodes:
-        raise ValueError("No read nodes found")
+    return forward_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
 
-    selected_instance = random.choice(read_nodes)
-    return selected_instance["InstanceID"], selected_instance["PublicIP"]
 
-
-def fetch_master_node(instance_details):
+def encoded_response(body, status=200):
     """
-    Retrieves the master node ip from the list of instances.
+    Encodes a result as JSON, MessagePack or Arrow, as asked for by the
+    Accept header of the request. JSON is the default.
     """
-    master_node = next((instance for instance in instance_details if instance["Name"] == "mysql_master_node"), None)
-    if not master_node:
-        raise ValueError("No master node found")
-    return master_node["InstanceID"], master_node["PublicIP"]
+    payload, mimetype = encode_body(body, negotiate(request.headers.get("Accept")))
+    return Response(payload, status=status, mimetype=mimetype)
 
 
-def forward_query_request(url, payload):
+def forward_query_request(url, payload, node_ip=None, **post_options):
     """
     Makes an API call to the specified URL with the given payload.
+    When `node_ip` is given, the request is counted as in flight on that node
+    and the observed response time is fed to the latency prober. The outcome
+    is recorded by the circuit breaker of the target node. `post_options`
+    are passed on to the request, such as a raw body to send instead.
+    Results are asked for in MessagePack when it is installed.
     """
     logging.info(f"Redirecting to URL: {url}")
+    breaker = breakers.get(urlsplit(url).hostname)
+    if not breaker.allow_request():
+        return {
+            "message": "Query forwarding failed",
+            "error": f"Circuit open for {breaker.name}",
+            "affected_rows": 0,
+        }
+    post_options["headers"] = {"Accept": upstream_accept(), **post_options.get("headers", {})}
     try:
-        response = requests.post(url, json=payload)
+        start_time = time.monotonic()
+        if node_ip is not None:
+            with in_flight.track(node_ip):
+                response = upstream.post(url, json=payload, **post_options)
+        else:
+            response = upstream.post(url, json=payload, **post_options)
+        latency_ms = (time.monotonic() - start_time) * 1000
+        record_node_response(breaker, response.status_code, latency_ms)
+        if node_ip is not None:
+            get_latency_prober().observe(node_ip, latency_ms)
         if response.status_code == 200:
-            return response.json()
+            return decode_body(response.content, response.headers.get("Content-Type"))
         return {
             "message": "Query execution failed",
             "error": response.text,
             "affected_rows": 0,
         }
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logging.error(f"API call failed: {e}")
+        record_node_failure(breaker, node_ip)
         return {
             "message": "Query forwarding failed",
             "error": str(e),
@@ -111,34 +125,159 @@ def forward_query_request(url, payload):
         }
 
 
+def stream_query_request(url, payload, node_ip=None):
+    """
+    Forwards a streamed read and relays the NDJSON body of the data node as
+    it arrives. The circuit breaker records the time to the first byte, and
+    the in-flight slot of `node_ip` is held until the stream is consumed.
+    """
+    logging.info(f"Streaming from URL: {url}")
+    breaker = breakers.get(urlsplit(url).hostname)
+    if not breaker.allow_request():
+        return jsonify({
+            "message": "Query forwarding failed",
+            "error": f"Circuit open for {breaker.name}",
+            "affected_rows": 0,
+        }), 503
+    if node_ip is not None:
+        in_flight.acquire(node_ip)
+    try:
+        start_time = time.monotonic()
+        response = upstream.post(url, json=payload, stream=True)
+        record_node_response(breaker, response.status_code, (time.monotonic() - start_time) * 1000)
+    except requests.RequestException as e:
+        logging.error(f"API call failed: {e}")
+        record_node_failure(breaker)
+        if node_ip is not None:
+            in_flight.release(node_ip)
+        return jsonify({
+            "message": "Query forwarding failed",
+            "error": str(e),
+            "affected_rows": 0,
+        }), 502
+
+    if response.status_code != 200:
+        error = response.text
+        response.close()
+        if node_ip is not None:
+            in_flight.release(node_ip)
+        return jsonify({
+            "message": "Query execution failed",
+            "error": error,
+            "affected_rows": 0,
+        }), response.status_code
+
+    def generate():
+        try:
+            yield from relay_stream(response)
+        finally:
+            if node_ip is not None:
+                in_flight.release(node_ip)
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+
+def forward_hedged_read(url, payload, node_ip, instance_details, min_position=None):
+    """
+    Forwards a read and, if it has not completed within the hedge delay,
+    sends it to a second replica as well. The first successful answer wins.
+    The hedge delay learns from the primary's own latency, measured when it
+    completes even after a hedge won, so winning hedges do not pull it down.
+    A losing request cannot be cancelled: it keeps its in-flight slot until
+    it completes, within the request's deadline, which hedges at most
+    HEDGE_BUDGET_RATIO of the reads.
+    """
+    hedge_policy.on_read()
+    start_time = time.monotonic()
+    primary = submit_forward(forward_query_request, url, payload, node_ip)
+
+    def record_primary_latency(future):
+        if "error" not in future.result():
+            hedge_policy.record_latency((time.monotonic() - start_time) * 1000)
+
+    primary.add_done_callback(record_primary_latency)
+    done, _ = wait([primary], timeout=hedge_policy.hedge_delay())
+
+    hedge = None
+    if not done:
+        hedge_url, hedge_ip = select_hedge_target(instance_details, node_ip, min_position)
+        if hedge_url is not None and hedge_policy.try_acquire():
+            logging.info(f"Hedging read to {hedge_url}")
+            hedge = submit_forward(forward_query_request, hedge_url, payload, hedge_ip)
+
+    pending = {primary} if hedge is None else {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = next(iter(done))
+        result = winner.result()
+        if "error" not in result or not pending:
+            break
+
+    if winner is hedge:
+        hedge_policy.record_hedge_win()
+    return result
+
+
 # Flask Endpoints
+@app.before_request
+def start_deadline():
+    """
+    Starts the deadline of a request from the budget its caller has left.
+    """
+    deadline = Deadline.from_headers(request.headers)
+    set_current_deadline(deadline)
+    deadline.check()
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(err):
+    return jsonify({"error": str(err)}), 504
+
+
 @app.route("/process", methods=["POST"])
 def process_query():
     """
-    Processes queries and forwards them based on mode (DIRECT, RANDOM, or CUSTOMIZED).
+    Processes queries and forwards them based on mode (DIRECT, RANDOM, CUSTOMIZED, or AUTO).
     """
     data = request.json
-    query = data.get("query")
     mode = data.get("mode")
-    if not query or not mode:
+    if not mode:
         return jsonify({"error": "Missing query or mode"}), 400
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    min_position = data.get("min_position")
+    if min_position is not None and (not isinstance(min_position, int) or isinstance(min_position, bool)):
+        return jsonify({"error": "min_position must be an integer"}), 400
 
     try:
-        instance_details = load_instance_details()
+        # Streamed reads bypass the cache and hedging and are relayed as NDJSON
+        stream = bool(data.get("stream"))
+        cached_result, cache_ticket = (None, None) if stream else lookup_cached_result(mode, query, min_position, params)
+        if cached_result is not None:
+            return encoded_response(cached_result)
 
         # Mode-based routing logic
-        if mode == "DIRECT":
-            _, master_ip = fetch_master_node(instance_details)
-            url = f"http://{master_ip}:80/write"
-        elif mode == "RANDOM":
-            _, random_ip = select_random_read_node(instance_details)
-            url = f"http://{random_ip}:80/read"
-        else:  # CUSTOMIZED or default mode
-            _, lowest_ping_ip = find_lowest_latency_instance(instance_details)
-            url = f"http://{lowest_ping_ip}:80/read"
+        instance_details = load_instance_details()
+        url, node_ip = resolve_target(mode, instance_details, query, min_position)
+
+        if stream and url.endswith("/read"):
+            return stream_query_request(f"{url}/stream", statement_payload(query, params), node_ip)
 
         # Make the API call
-        return jsonify(forward_query_request(url, {"query": query})), 200
+        result = None
+        if should_hedge(data, node_ip):
+            result = forward_hedged_read(url, statement_payload(query, params), node_ip, instance_details, min_position)
+        elif params is None and should_read_directly(url):
+            result = direct_read(url, query, node_ip)
+        if result is None:
+            # A write carrying an idempotency key is safe to send again
+            result = forward_query_request(url, forward_payload(data), node_ip, idempotent="idempotency_key" in data)
+        record_result(query, result, cache_ticket)
+        record_write_positions(result)
+        return encoded_response(result)
 
     except (FileNotFoundError, ValueError) as e:
         return jsonify({"error": str(e)}), 500
@@ -147,6 +286,201 @@ def process_query():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/batch", methods=["POST"])
+def process_batch():
+    """
+    Processes a batch of queries. Items are routed like /process and grouped
+    by target node; each node receives its items in one request and the
+    groups run concurrently, so only items sent to the same node keep their
+    relative execution order. Results are returned in request order.
+    """
+    data = request.json
+    try:
+        items = normalize_batch(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        instance_details = load_instance_details()
+        results, tickets, groups = plan_batch(items, instance_details)
+
+        # Whole batches are not fed to the latency prober, so no read node IP is passed
+        futures = {}
+        for (url, _), indices in groups.items():
+            payload, idempotent = batch_request(items, indices)
+            futures[submit_forward(forward_query_request, f"{url}/batch", payload, idempotent=idempotent)] = indices
+        for future, indices in futures.items():
+            merge_batch_response(results, indices, future.result())
+
+        record_batch_results(items, results, tickets)
+        return encoded_response({"results": results})
+
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/bulk", methods=["POST"])
+def process_bulk():
+    """
+    Relays a bulk insert to the master, streaming a CSV body as it arrives
+    unless the load is keyed, and drops the cached reads of the loaded table.
+    """
+    if request.mimetype == CSV_MIMETYPE:
+        target, body = request.args, request.stream
+    else:
+        target = request.get_json(silent=True) or {}
+        body = request.get_data()
+    try:
+        table, _ = read_bulk_target(target)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # A keyed CSV load is read whole, so it can be sent again
+    if "idempotency_key" in target:
+        body = request.get_data()
+    try:
+        _, master_ip = fetch_master_node(load_instance_details())
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+
+    result = forward_query_request(
+        f"http://{master_ip}:80/bulk",
+        None,
+        data=body,
+        params=request.args,
+        headers={"Content-Type": request.content_type},
+        idempotent="idempotency_key" in target,
+    )
+    record_bulk_result(table, result)
+    return jsonify(result), 200
+
+
+@app.route("/page", methods=["POST"])
+def process_page():
+    """
+    Returns one page of a table and an opaque token for the next page. The
+    first page is routed by "mode" like a read; the following pages go to
+    the node named by the token.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    try:
+        url, node_ip, payload = resolve_page(data, load_instance_details())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 500
+
+    result = forward_query_request(url, payload, node_ip)
+    return encoded_response(page_token(url, result))
+
+
+@app.route("/session", methods=["POST"])
+def open_session():
+    """
+    Opens a transaction session on the master and returns its token. Calls
+    made with the token go to the node and connection holding the session.
+    """
+    try:
+        _, master_ip = fetch_master_node(load_instance_details())
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 500
+
+    result = forward_query_request(f"http://{master_ip}:80/session", {})
+    if "session" not in result:
+        return jsonify(result), 200
+    return jsonify({"session": session_token(master_ip, result["session"])}), 200
+
+
+@app.route("/session/<token>/<action>", methods=["POST"])
+def session_call(token, action):
+    """
+    Forwards an execute, commit or rollback call to the node named by the
+    session token.
+    """
+    if action not in SESSION_ACTIONS:
+        return jsonify({"error": f"Unknown session action {action}"}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        url = resolve_session_url(token, load_instance_details(), action)
+        payload = forward_payload(data) if action == "execute" else {key: data[key] for key in ("ack",) if key in data}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 500
+
+    result = forward_query_request(url, payload)
+    record_session_result(action, data, result)
+    return encoded_response(result)
+
+
+@app.route("/stats/latency", methods=["GET"])
+def latency_stats():
+    """
+    Returns the per-replica latency and loss table used by CUSTOMIZED routing.
+    """
+    return jsonify(get_latency_prober().snapshot()), 200
+
+
+@app.route("/stats/balancer", methods=["GET"])
+def balancer_stats():
+    """
+    Returns the outstanding requests per read node.
+    """
+    return jsonify({"in_flight": in_flight.snapshot()}), 200
+
+
+@app.route("/stats/cache", methods=["GET"])
+def cache_stats():
+    """
+    Returns the hit, miss and eviction counters of the read-result cache.
+    """
+    return jsonify(result_cache.stats()), 200
+
+
+@app.route("/stats/breakers", methods=["GET"])
+def breaker_stats():
+    """
+    Returns the circuit breaker state of every data node and recent transitions.
+    """
+    return jsonify(breakers.snapshot()), 200
+
+
+@app.route("/stats/hedging", methods=["GET"])
+def hedging_stats():
+    """
+    Returns the hedge rate, win rate and current hedge delay of hedged reads.
+    """
+    return jsonify(hedge_policy.stats()), 200
+
+
+@app.route("/stats/positions", methods=["GET"])
+def position_stats():
+    """
+    Returns the last replication position known for each replica.
+    """
+    return jsonify(get_position_tracker().snapshot()), 200
+
+
+@app.route("/stats/direct", methods=["GET"])
+def direct_stats():
+    """
+    Returns the MySQL pools opened by direct reads.
+    """
+    return jsonify(direct_backend_stats()), 200
+
+
+@app.route("/stats/upstream", methods=["GET"])
+def upstream_stats():
+    """
+    Returns connection pool statistics of the upstream HTTP client.
+    """
+    return jsonify(upstream.stats()), 200
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """
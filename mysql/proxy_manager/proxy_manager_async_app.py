@@ -0,0 +1,610 @@
+from aiohttp import web
+import aiohttp
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+from batch import normalize_batch
+from bulk import CSV_MIMETYPE, read_bulk_target
+from codec import decode_body, encode_body, negotiate, upstream_accept
+from deadline import Deadline, DeadlineExceeded, current_deadline, set_current_deadline
+from routing import (
+    SESSION_ACTIONS,
+    batch_request,
+    breakers,
+    direct_backend_stats,
+    direct_read,
+    fetch_master_node,
+    forward_payload,
+    get_latency_prober,
+    get_position_tracker,
+    hedge_policy,
+    in_flight,
+    load_instance_details,
+    lookup_cached_result,
+    merge_batch_response,
+    page_token,
+    plan_batch,
+    record_batch_results,
+    record_bulk_result,
+    record_node_failure,
+    record_node_response,
+    record_result,
+    record_session_result,
+    record_write_positions,
+    resolve_page,
+    resolve_session_url,
+    resolve_target,
+    result_cache,
+    select_hedge_target,
+    session_token,
+    should_hedge,
+    should_read_directly,
+)
+from statements import read_statement, statement_payload
+from streaming import NDJSON_MIMETYPE
+from topology import install_reload_signal
+from upstream import IDEMPOTENT_RETRIES, RETRY_BACKOFF_FACTOR, RETRY_STATUS_CODES
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Upstream connection limits and timeouts
+UPSTREAM_CONNECTION_LIMIT = 4096
+UPSTREAM_CONNECTION_LIMIT_PER_HOST = 1024
+UPSTREAM_CONNECT_TIMEOUT = 2.0
+UPSTREAM_TOTAL_TIMEOUT = 30.0
+
+install_reload_signal()
+
+# Primaries of hedged reads left to complete after a hedge won
+_background_reads = set()
+
+
+# Utility Functions
+def deadline_options(headers, stream=False):
+    """
+    Returns the timeout and headers of a call to a data node made within the
+    deadline of the request: the timeouts shrink to the time it has left,
+    which is passed on to the node. A stream is only bounded between two
+    reads. Raises asyncio.TimeoutError once the deadline passed.
+    """
+    deadline = current_deadline() or Deadline(UPSTREAM_TOTAL_TIMEOUT)
+    if deadline.expired():
+        raise asyncio.TimeoutError("Request deadline exceeded")
+    connect, read = deadline.http_timeout(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_TOTAL_TIMEOUT)
+    if stream:
+        timeout = aiohttp.ClientTimeout(connect=connect, sock_read=read)
+    else:
+        timeout = aiohttp.ClientTimeout(total=read, connect=connect)
+    return {"timeout": timeout, "headers": {**headers, **deadline.headers()}}
+
+
+def encoded_response(request, body, status=200):
+    """
+    Encodes a result as JSON, MessagePack or Arrow, as asked for by the
+    Accept header of the request. JSON is the default.
+    """
+    payload, mimetype = encode_body(body, negotiate(request.headers.get("Accept")))
+    return web.Response(body=payload, status=status, content_type=mimetype)
+
+
+async def post_upstream(session, url, payload, headers, idempotent=False, **post_options):
+    """
+    Posts to a data node within the deadline of the request and returns the
+    status, content type and body of its response. An idempotent request
+    is retried like UpstreamClient does, unless its body is a stream.
+    """
+    data = post_options.get("data")
+    attempts = IDEMPOTENT_RETRIES + 1 if idempotent and (data is None or isinstance(data, bytes)) else 1
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(RETRY_BACKOFF_FACTOR * 2 ** (attempt - 1))
+        last_attempt = attempt == attempts - 1
+        options = {**post_options, **deadline_options(headers)}
+        try:
+            async with session.post(url, json=payload, **options) as response:
+                body = await response.read()
+                if last_attempt or response.status not in RETRY_STATUS_CODES:
+                    return response.status, response.headers.get("Content-Type"), body
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if last_attempt:
+                raise
+
+
+async def forward_query_request(session, url, payload, node_ip=None, **post_options):
+    """
+    Makes an API call to the specified URL with the given payload without
+    blocking the event loop. Mirrors the sync proxy manager's error contract.
+    `post_options` are passed on to the request, such as a raw body to send,
+    and `idempotent=True` allows retries.
+    Results are asked for in MessagePack when it is installed.
+    """
+    logging.info(f"Redirecting to URL: {url}")
+    breaker = breakers.get(urlsplit(url).hostname)
+    if not breaker.allow_request():
+        return {
+            "message": "Query forwarding failed",
+            "error": f"Circuit open for {breaker.name}",
+            "affected_rows": 0,
+        }
+    headers = {"Accept": upstream_accept(), **post_options.pop("headers", {})}
+    if node_ip is not None:
+        in_flight.acquire(node_ip)
+    try:
+        start_time = time.monotonic()
+        status, content_type, body = await post_upstream(session, url, payload, headers, **post_options)
+        latency_ms = (time.monotonic() - start_time) * 1000
+        record_node_response(breaker, status, latency_ms)
+        if node_ip is not None:
+            get_latency_prober().observe(node_ip, latency_ms)
+        if status == 200:
+            return decode_body(body, content_type)
+        return {
+            "message": "Query execution failed",
+            "error": body.decode(errors="replace"),
+            "affected_rows": 0,
+        }
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logging.error(f"API call failed: {e!r}")
+        record_node_failure(breaker, node_ip)
+        return {
+            "message": "Query forwarding failed",
+            "error": str(e) or repr(e),
+            "affected_rows": 0,
+        }
+    finally:
+        if node_ip is not None:
+            in_flight.release(node_ip)
+
+
+async def stream_query_request(request, session, url, payload, node_ip=None):
+    """
+    Forwards a streamed read and relays the NDJSON body of the data node
+    chunk by chunk. The total timeout does not apply to streams, only the
+    idle time between two reads does.
+    """
+    logging.info(f"Streaming from URL: {url}")
+    breaker = breakers.get(urlsplit(url).hostname)
+    if not breaker.allow_request():
+        return web.json_response({
+            "message": "Query forwarding failed",
+            "error": f"Circuit open for {breaker.name}",
+            "affected_rows": 0,
+        }, status=503)
+    if node_ip is not None:
+        in_flight.acquire(node_ip)
+    stream = None
+    try:
+        start_time = time.monotonic()
+        async with session.post(url, json=payload, **deadline_options({}, stream=True)) as response:
+            record_node_response(breaker, response.status, (time.monotonic() - start_time) * 1000)
+            if response.status != 200:
+                body = await response.read()
+                return web.json_response({
+                    "message": "Query execution failed",
+                    "error": body.decode(errors="replace"),
+                    "affected_rows": 0,
+                }, status=response.status)
+
+            stream = web.StreamResponse(headers={"Content-Type": NDJSON_MIMETYPE})
+            await stream.prepare(request)
+            async for chunk in response.content.iter_any():
+                await stream.write(chunk)
+            await stream.write_eof()
+            return stream
+    except ConnectionResetError:
+        if stream is None:
+            raise
+        logging.warning("Client went away during a streamed read")
+        return stream
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"API call failed: {e!r}")
+        if stream is not None:
+            # The status line is already sent, so report the failure as a final line
+            await stream.write((json.dumps({"error": f"Stream interrupted: {str(e) or repr(e)}"}) + "\n").encode())
+            await stream.write_eof()
+            return stream
+        record_node_failure(breaker)
+        return web.json_response({
+            "message": "Query forwarding failed",
+            "error": str(e) or repr(e),
+            "affected_rows": 0,
+        }, status=502)
+    finally:
+        if node_ip is not None:
+            in_flight.release(node_ip)
+
+
+async def forward_hedged_read(session, url, payload, node_ip, instance_details, min_position=None):
+    """
+    Forwards a read and, if it has not completed within the hedge delay,
+    sends it to a second replica as well. The first successful answer wins.
+    The hedge delay learns from the primary's own latency, so a primary
+    beaten by its hedge is left to complete, holding its in-flight slot
+    within the request's deadline, which hedges at most HEDGE_BUDGET_RATIO
+    of the reads; a losing hedge is cancelled.
+    """
+    hedge_policy.on_read()
+    start_time = time.monotonic()
+    primary = asyncio.ensure_future(forward_query_request(session, url, payload, node_ip))
+
+    def record_primary_latency(task):
+        if not task.cancelled() and "error" not in task.result():
+            hedge_policy.record_latency((time.monotonic() - start_time) * 1000)
+
+    primary.add_done_callback(record_primary_latency)
+    done, _ = await asyncio.wait({primary}, timeout=hedge_policy.hedge_delay())
+
+    hedge = None
+    if not done:
+        hedge_url, hedge_ip = select_hedge_target(instance_details, node_ip, min_position)
+        if hedge_url is not None and hedge_policy.try_acquire():
+            logging.info(f"Hedging read to {hedge_url}")
+            hedge = asyncio.ensure_future(forward_query_request(session, hedge_url, payload, hedge_ip))
+
+    pending = {primary} if hedge is None else {primary, hedge}
+    try:
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next(iter(done))
+            result = winner.result()
+            if "error" not in result or not pending:
+                break
+    finally:
+        for task in pending:
+            if task is primary:
+                _background_reads.add(task)
+                task.add_done_callback(_background_reads.discard)
+            else:
+                task.cancel()
+
+    if winner is hedge:
+        hedge_policy.record_hedge_win()
+    return result
+
+
+async def create_upstream_session(app):
+    """
+    Opens the shared upstream session when the application starts.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=UPSTREAM_CONNECTION_LIMIT, limit_per_host=UPSTREAM_CONNECTION_LIMIT_PER_HOST
+    )
+    timeout = aiohttp.ClientTimeout(total=UPSTREAM_TOTAL_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+    app["upstream"] = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    app["in_flight"] = 0
+
+
+async def close_upstream_session(app):
+    await app["upstream"].close()
+
+
+# Endpoints
+async def process_query(request):
+    """
+    Processes queries and forwards them based on mode (DIRECT, RANDOM, CUSTOMIZED, or AUTO).
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON payload"}, status=400)
+    mode = data.get("mode")
+    if not mode:
+        return web.json_response({"error": "Missing query or mode"}, status=400)
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+    min_position = data.get("min_position")
+    if min_position is not None and (not isinstance(min_position, int) or isinstance(min_position, bool)):
+        return web.json_response({"error": "min_position must be an integer"}, status=400)
+
+    try:
+        # Streamed reads bypass the cache and hedging and are relayed as NDJSON
+        stream = bool(data.get("stream"))
+        cached_result, cache_ticket = (None, None) if stream else lookup_cached_result(mode, query, min_position, params)
+        if cached_result is not None:
+            return encoded_response(request, cached_result)
+
+        # Mode-based routing logic
+        instance_details = load_instance_details()
+        url, node_ip = resolve_target(mode, instance_details, query, min_position)
+    except (FileNotFoundError, ValueError) as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    request.app["in_flight"] += 1
+    try:
+        session = request.app["upstream"]
+        if stream and url.endswith("/read"):
+            return await stream_query_request(request, session, f"{url}/stream", statement_payload(query, params), node_ip)
+        result = None
+        if should_hedge(data, node_ip):
+            result = await forward_hedged_read(
+                session, url, statement_payload(query, params), node_ip, instance_details, min_position
+            )
+        elif params is None and should_read_directly(url):
+            # The MySQL driver blocks, so direct reads run on the default executor
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, contextvars.copy_context().run, direct_read, url, query, node_ip
+            )
+        if result is None:
+            # A write carrying an idempotency key is safe to send again
+            result = await forward_query_request(
+                session, url, forward_payload(data), node_ip, idempotent="idempotency_key" in data
+            )
+        record_result(query, result, cache_ticket)
+        record_write_positions(result)
+        return encoded_response(request, result)
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        request.app["in_flight"] -= 1
+
+
+async def process_batch(request):
+    """
+    Processes a batch of queries. Items are routed like /process and grouped
+    by target node; each node receives its items in one request and the
+    groups run concurrently. Results are returned in request order.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON payload"}, status=400)
+    try:
+        items = normalize_batch(data)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+    try:
+        instance_details = load_instance_details()
+        results, tickets, groups = plan_batch(items, instance_details)
+    except (FileNotFoundError, ValueError) as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    request.app["in_flight"] += 1
+    try:
+        session = request.app["upstream"]
+        group_indices = list(groups.values())
+        node_requests = [batch_request(items, indices) for indices in group_indices]
+        responses = await asyncio.gather(*(
+            forward_query_request(session, f"{url}/batch", payload, idempotent=idempotent)
+            for (url, _), (payload, idempotent) in zip(groups, node_requests)
+        ))
+        for indices, response in zip(group_indices, responses):
+            merge_batch_response(results, indices, response)
+
+        record_batch_results(items, results, tickets)
+        return encoded_response(request, {"results": results})
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        request.app["in_flight"] -= 1
+
+
+async def process_bulk(request):
+    """
+    Relays a bulk insert to the master, streaming a CSV body as it arrives
+    unless the load is keyed, and drops the cached reads of the loaded table.
+    """
+    if request.content_type == CSV_MIMETYPE:
+        target, body = request.query, request.content
+    else:
+        try:
+            target = await request.json()
+        except ValueError:
+            return web.json_response({"error": "Invalid JSON payload"}, status=400)
+        body = await request.read()
+    try:
+        table, _ = read_bulk_target(target)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    # A keyed CSV load is read whole, so it can be sent again
+    if "idempotency_key" in target:
+        body = await request.read()
+    try:
+        _, master_ip = fetch_master_node(load_instance_details())
+    except (FileNotFoundError, ValueError) as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    request.app["in_flight"] += 1
+    try:
+        result = await forward_query_request(
+            request.app["upstream"],
+            f"http://{master_ip}:80/bulk",
+            None,
+            data=body,
+            params=request.query,
+            headers={"Content-Type": request.content_type},
+            idempotent="idempotency_key" in target,
+        )
+        record_bulk_result(table, result)
+        return web.json_response(result)
+    finally:
+        request.app["in_flight"] -= 1
+
+
+async def process_page(request):
+    """
+    Returns one page of a table and an opaque token for the next page. The
+    first page is routed by "mode" like a read; the following pages go to
+    the node named by the token.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON payload"}, status=400)
+    if not isinstance(data, dict):
+        return web.json_response({"error": "Invalid JSON payload"}, status=400)
+    try:
+        url, node_ip, payload = resolve_page(data, load_instance_details())
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except FileNotFoundError as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    request.app["in_flight"] += 1
+    try:
+        result = await forward_query_request(request.app["upstream"], url, payload, node_ip)
+        return encoded_response(request, page_token(url, result))
+    finally:
+        request.app["in_flight"] -= 1
+
+
+async def open_session(request):
+    """
+    Opens a transaction session on the master and returns its token. Calls
+    made with the token go to the node and connection holding the session.
+    """
+    try:
+        _, master_ip = fetch_master_node(load_instance_details())
+    except (FileNotFoundError, ValueError) as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    result = await forward_query_request(request.app["upstream"], f"http://{master_ip}:80/session", {})
+    if "session" not in result:
+        return web.json_response(result)
+    return web.json_response({"session": session_token(master_ip, result["session"])})
+
+
+async def session_call(request):
+    """
+    Forwards an execute, commit or rollback call to the node named by the
+    session token.
+    """
+    action = request.match_info["action"]
+    if action not in SESSION_ACTIONS:
+        return web.json_response({"error": f"Unknown session action {action}"}, status=404)
+    try:
+        data = await request.json() if request.can_read_body else {}
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON payload"}, status=400)
+    try:
+        url = resolve_session_url(request.match_info["token"], load_instance_details(), action)
+        payload = forward_payload(data) if action == "execute" else {key: data[key] for key in ("ack",) if key in data}
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except FileNotFoundError as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    result = await forward_query_request(request.app["upstream"], url, payload)
+    record_session_result(action, data, result)
+    return encoded_response(request, result)
+
+
+async def latency_stats(request):
+    """
+    Returns the per-replica latency and loss table used by CUSTOMIZED routing.
+    """
+    return web.json_response(get_latency_prober().snapshot())
+
+
+async def balancer_stats(request):
+    """
+    Returns the outstanding requests per read node.
+    """
+    return web.json_response({"in_flight": in_flight.snapshot()})
+
+
+async def cache_stats(request):
+    """
+    Returns the hit, miss and eviction counters of the read-result cache.
+    """
+    return web.json_response(result_cache.stats())
+
+
+async def breaker_stats(request):
+    """
+    Returns the circuit breaker state of every data node and recent transitions.
+    """
+    return web.json_response(breakers.snapshot())
+
+
+async def hedging_stats(request):
+    """
+    Returns the hedge rate, win rate and current hedge delay of hedged reads.
+    """
+    return web.json_response(hedge_policy.stats())
+
+
+async def position_stats(request):
+    """
+    Returns the last replication position known for each replica.
+    """
+    return web.json_response(get_position_tracker().snapshot())
+
+
+async def direct_stats(request):
+    """
+    Returns the MySQL pools opened by direct reads.
+    """
+    return web.json_response(direct_backend_stats())
+
+
+async def upstream_stats(request):
+    """
+    Returns the number of forwarded queries currently in flight.
+    """
+    connector = request.app["upstream"].connector
+    return web.json_response({
+        "in_flight": request.app["in_flight"],
+        "connection_limit": connector.limit,
+        "connection_limit_per_host": connector.limit_per_host,
+    })
+
+
+async def health_check(request):
+    """
+    Health check endpoint to verify the application status.
+    """
+    return web.json_response({"status": "healthy"})
+
+
+@web.middleware
+async def deadline_middleware(request, handler):
+    """
+    Starts the deadline of a request from the budget its caller has left.
+    """
+    deadline = Deadline.from_headers(request.headers)
+    set_current_deadline(deadline)
+    try:
+        deadline.check()
+        return await handler(request)
+    except DeadlineExceeded as e:
+        return web.json_response({"error": str(e)}, status=504)
+
+
+def create_app():
+    app = web.Application(middlewares=[deadline_middleware])
+    app.on_startup.append(create_upstream_session)
+    app.on_cleanup.append(close_upstream_session)
+    app.router.add_post("/process", process_query)
+    app.router.add_post("/batch", process_batch)
+    app.router.add_post("/bulk", process_bulk)
+    app.router.add_post("/page", process_page)
+    app.router.add_post("/session", open_session)
+    app.router.add_post("/session/{token}/{action}", session_call)
+    app.router.add_get("/stats/latency", latency_stats)
+    app.router.add_get("/stats/balancer", balancer_stats)
+    app.router.add_get("/stats/cache", cache_stats)
+    app.router.add_get("/stats/breakers", breaker_stats)
+    app.router.add_get("/stats/hedging", hedging_stats)
+    app.router.add_get("/stats/positions", position_stats)
+    app.router.add_get("/stats/direct", direct_stats)
+    app.router.add_get("/stats/upstream", upstream_stats)
+    app.router.add_get("/health", health_check)
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    logging.info("Starting aiohttp application")
+    web.run_app(app, host="0.0.0.0", port=80)
@@ -0,0 +1,68 @@
+import logging
+import threading
+
+
+class ReplicaPositionTracker:
+    """
+    Tracks the last replication position applied by each replica, so reads
+    carrying a minimum position are only sent to replicas that caught up.
+
+    Positions are polled in the background with `fetch_fn` and also learned
+    from the per-replica outcomes the master returns for each write.
+    """
+
+    def __init__(self, fetch_fn, targets_fn, interval=0.5):
+        self.fetch_fn = fetch_fn
+        self.targets_fn = targets_fn
+        self.interval = interval
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe(self, ip, position):
+        """
+        Records that `ip` applied every write up to `position`: its
+        contiguous watermark, never the position of a write it applied
+        past a missing one.
+        """
+        with self._lock:
+            if position > self._positions.get(ip, 0):
+                self._positions[ip] = position
+
+    def position(self, ip):
+        return self._positions.get(ip, 0)
+
+    def caught_up(self, ips, min_position):
+        """
+        Filters `ips` down to the replicas that applied `min_position` and
+        every write before it.
+        """
+        return [ip for ip in ips if self._positions.get(ip, 0) >= min_position]
+
+    def refresh(self):
+        for ip in self.targets_fn():
+            position = self.fetch_fn(ip)
+            if position is not None:
+                self.observe(ip, position)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._positions)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception("Replica position refresh failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="replica-positions", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of read results with a TTL and a memory cap.
+
+    Entries are indexed by the tables they read so that a write can drop
+    every result it may have changed. Each table carries a generation
+    number, and the cache as a whole an epoch: a read records both when it
+    starts (`begin`) and its result is only stored (`complete`) if no write
+    touched its tables in the meantime.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=30.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._tables = {}
+        self._generations = {}
+        self._epoch = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        value, tables, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+    def _versions(self, tables):
+        return self._epoch, tuple(self._generations.get(table, 0) for table in tables)
+
+    def get(self, key):
+        """
+        Returns the cached result of `key`, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.clock() >= entry[3]:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def begin(self, key, tables):
+        """
+        Returns a ticket recording the table generations seen by a read that
+        is about to be executed.
+        """
+        with self._lock:
+            return key, tuple(tables), self._versions(tables)
+
+    def complete(self, ticket, value):
+        """
+        Stores the result of a read started with `begin`, unless one of its
+        tables was written since or the result exceeds the memory cap.
+        """
+        key, tables, versions = ticket
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if self._versions(tables) != versions:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, tables, size, self.clock() + self.ttl)
+            self._bytes += size
+            for table in tables:
+                self._tables.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate_tables(self, tables):
+        """
+        Drops every entry reading one of `tables`. An empty table list means
+        the write could not be parsed, so the whole cache is dropped.
+        """
+        with self._lock:
+            if tables:
+                keys = {key for table in tables for key in self._tables.get(table, ())}
+                for table in tables:
+                    self._generations[table] = self._generations.get(table, 0) + 1
+            else:
+                keys = list(self._entries)
+                self._epoch += 1
+            for key in keys:
+                self._remove(key)
+                self.invalidations += 1
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,568 @@
+import subprocess
+import random
+import logging
+import threading
+import time
+import requests
+from urllib.parse import urlsplit
+from circuit_breaker import BreakerRegistry
+from deadline import DeadlineExceeded, current_deadline
+from balancer import BALANCING_MODES, InFlightTracker, WeightedRoundRobin, select_node
+from hedging import HedgePolicy
+from latency_prober import LatencyProber
+from replica_positions import ReplicaPositionTracker
+from result_cache import ResultCache
+from sql_classifier import WRITE, classify_query, extract_read_tables, extract_tables, normalize_query
+from statements import read_statement, statement_payload
+from topology import get_topology
+from upstream import UpstreamClient
+
+# Latency probing settings for CUSTOMIZED routing
+LATENCY_PROBE_INTERVAL = 2.0
+LATENCY_EWMA_ALPHA = 0.3
+
+_latency_prober = None
+_latency_prober_lock = threading.Lock()
+
+# Replication position polling settings for reads with a minimum position
+POSITION_POLL_INTERVAL = 0.5
+
+_position_tracker = None
+_position_tracker_lock = threading.Lock()
+_position_client = UpstreamClient(connect_timeout=0.5, read_timeout=1.0, retries=0)
+
+# Read-result cache settings. The cache is per process: a write only
+# invalidates the cache of the worker that forwarded it, so with several
+# workers the TTL bounds how long other workers may serve stale results.
+RESULT_CACHE_ENABLED = False
+RESULT_CACHE_MAX_ENTRIES = 10000
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 30.0
+
+result_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+
+# Hedged reads: when enabled (globally or with "hedge": true on a request),
+# a read still unanswered after the HEDGE_PERCENTILE latency is also sent
+# to a second replica, within a budget of HEDGE_BUDGET_RATIO extra reads.
+HEDGING_ENABLED = False
+HEDGE_PERCENTILE = 0.95
+HEDGE_BUDGET_RATIO = 0.05
+
+hedge_policy = HedgePolicy(percentile=HEDGE_PERCENTILE, budget_ratio=HEDGE_BUDGET_RATIO)
+
+# Direct reads: when enabled, reads run over MySQL connections pooled by the
+# proxy manager instead of through the /read endpoint of the node's Flask app.
+# Only plain read queries go direct: writes still go to the master's /write,
+# which stamps and replays them, and parameterized reads, hedged reads and
+# streamed reads take the HTTP hop, where the node runs them on its cached
+# prepared statements. Requires mysql-connector-python and the proxy_reader account on the nodes.
+DIRECT_READS_ENABLED = False
+
+_direct_backend = None
+_direct_backend_lock = threading.Lock()
+
+# Circuit breakers of the data nodes, fed by the forwarding code
+breakers = BreakerRegistry()
+
+# Outstanding requests per read node, maintained by the forwarding code
+in_flight = InFlightTracker()
+round_robin = WeightedRoundRobin()
+
+
+def load_instance_details():
+    """
+    Returns the cluster topology, reloaded only when instance_info.json changes.
+    """
+    return get_topology("instance_info.json")
+
+
+def ping_address(ip):
+    """
+    Pings an IP address and returns the average ping time in milliseconds.
+    Returns None if the ping fails.
+    """
+    command = ["ping", "-c", "1", ip]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=5)
+        if result.returncode == 0:
+            output = result.stdout
+            time_line = next(line for line in output.splitlines() if "time=" in line)
+            time_ms = float(time_line.split("time=")[1].split()[0])
+            return time_ms
+        return None
+    except Exception as e:
+        logging.warning(f"Ping failed for IP {ip}: {e}")
+        return None
+
+
+def read_node_ips():
+    """
+    Returns the IPs of the read nodes listed in the configuration file.
+    """
+    return load_instance_details().replica_ips
+
+
+def get_latency_prober():
+    """
+    Returns the latency prober of this worker, starting it on first use so
+    that each forked worker runs its own probe thread.
+    """
+    global _latency_prober
+    if _latency_prober is None:
+        with _latency_prober_lock:
+            if _latency_prober is None:
+                prober = LatencyProber(
+                    ping_address, read_node_ips, interval=LATENCY_PROBE_INTERVAL, alpha=LATENCY_EWMA_ALPHA
+                )
+                prober.start()
+                _latency_prober = prober
+    return _latency_prober
+
+
+def fetch_replica_position(ip):
+    """
+    Asks a replica for the position of the last write it applied.
+    Returns None if the replica cannot be reached.
+    """
+    try:
+        response = _position_client.get(f"http://{ip}:80/position")
+        if response.status_code == 200:
+            return response.json().get("position")
+    except (requests.RequestException, ValueError) as e:
+        logging.debug(f"Position poll failed for IP {ip}: {e}")
+    return None
+
+
+def get_position_tracker():
+    """
+    Returns the replica position tracker of this worker, starting its poll
+    thread on first use.
+    """
+    global _position_tracker
+    if _position_tracker is None:
+        with _position_tracker_lock:
+            if _position_tracker is None:
+                tracker = ReplicaPositionTracker(fetch_replica_position, read_node_ips, interval=POSITION_POLL_INTERVAL)
+                tracker.start()
+                _position_tracker = tracker
+    return _position_tracker
+
+
+def healthy_read_node_ips(instance_details, candidates=None):
+    """
+    Returns the candidate read nodes (all of them by default) whose circuit
+    breaker admits requests. When every candidate is ejected, all of them
+    are returned so that reads still get a chance to succeed.
+    """
+    if candidates is None:
+        candidates = instance_details.replica_ips
+    return breakers.available(candidates) or candidates
+
+
+def find_lowest_latency_instance(instance_details, candidates=None):
+    """
+    Finds the read node with the lowest measured latency. Falls back to a
+    random read node until the prober has measured at least one replica,
+    or when the fastest one is ejected.
+    """
+    best_ip = get_latency_prober().best()
+    if best_ip is not None and best_ip in healthy_read_node_ips(instance_details, candidates):
+        best_instance = instance_details.by_ip[best_ip]
+        return best_instance["InstanceID"], best_instance["PublicIP"]
+    return select_random_read_node(instance_details, candidates)
+
+
+def select_random_read_node(instance_details, candidates=None):
+    """
+    Finds a random read node IP among the healthy ones.
+    """
+    candidate_ips = healthy_read_node_ips(instance_details, candidates)
+    if not candidate_ips:
+        raise ValueError("No read nodes found")
+
+    selected_instance = instance_details.by_ip[random.choice(candidate_ips)]
+    return selected_instance["InstanceID"], selected_instance["PublicIP"]
+
+
+def fetch_master_node(instance_details):
+    """
+    Retrieves the master node ip from the list of instances.
+    """
+    master_node = instance_details.master
+    if not master_node:
+        raise ValueError("No master node found")
+    return master_node["InstanceID"], master_node["PublicIP"]
+
+
+def resolve_target(mode, instance_details, query=None, min_position=None):
+    """
+    Resolves the URL a query must be forwarded to for the given mode.
+    Returns the URL and the IP of the read node, or None for the master.
+
+    AUTO classifies the query: writes go to the master, reads to the
+    lowest latency replica. The BALANCING_MODES pick a replica from the
+    in-flight counters or the instance weights. A read with `min_position`
+    only goes to replicas that applied that write, or to the master when
+    none has.
+    """
+    if mode == "AUTO":
+        mode = "DIRECT" if classify_query(query or "") == WRITE else "CUSTOMIZED"
+
+    if mode == "DIRECT":
+        _, master_ip = fetch_master_node(instance_details)
+        return f"http://{master_ip}:80/write", None
+
+    candidates = None
+    if min_position is not None:
+        candidates = get_position_tracker().caught_up(instance_details.replica_ips, min_position)
+        if not candidates:
+            _, master_ip = fetch_master_node(instance_details)
+            return f"http://{master_ip}:80/read", None
+
+    if mode == "RANDOM":
+        _, node_ip = select_random_read_node(instance_details, candidates)
+    elif mode in BALANCING_MODES:
+        node_ip = select_node(
+            mode,
+            healthy_read_node_ips(instance_details, candidates),
+            in_flight.get,
+            lambda ip: instance_details.by_ip[ip].get("Weight", 1),
+            round_robin,
+        )
+    else:  # CUSTOMIZED or default mode
+        _, node_ip = find_lowest_latency_instance(instance_details, candidates)
+    return f"http://{node_ip}:80/read", node_ip
+
+
+def forward_payload(data):
+    """
+    Builds the body forwarded to a data node: the raw or parameterized
+    statement, plus the acknowledgement level and the idempotency key the
+    master applies to writes when they are given.
+    """
+    payload = statement_payload(*read_statement(data))
+    for key in ("ack", "idempotency_key"):
+        if key in data:
+            payload[key] = data[key]
+    return payload
+
+
+def select_hedge_target(instance_details, exclude_ip, min_position=None):
+    """
+    Picks a healthy replica other than `exclude_ip` to hedge a read to.
+    Returns the URL and IP of that replica, or (None, None) if there is none.
+    """
+    candidates = instance_details.replica_ips
+    if min_position is not None:
+        candidates = get_position_tracker().caught_up(candidates, min_position)
+    candidates = [ip for ip in breakers.available(candidates) if ip != exclude_ip]
+    if not candidates:
+        return None, None
+    node_ip = random.choice(candidates)
+    return f"http://{node_ip}:80/read", node_ip
+
+
+def should_hedge(data, node_ip):
+    """
+    Returns True when a read forwarded to `node_ip` may be hedged.
+    """
+    return node_ip is not None and bool(data.get("hedge", HEDGING_ENABLED))
+
+
+def lookup_cached_result(mode, query, min_position=None, params=None):
+    """
+    Looks a read query up in the result cache. Returns the cached result,
+    or None and a ticket to pass to `record_result` once the query ran.
+    Reads with a minimum position bypass the cache, and parameterized reads
+    are keyed by their parameters as well.
+    """
+    if not RESULT_CACHE_ENABLED or mode == "DIRECT" or min_position is not None or classify_query(query) == WRITE:
+        return None, None
+    tables = extract_read_tables(query)
+    if not tables:
+        return None, None
+    key = normalize_query(query) if params is None else (normalize_query(query), tuple(params))
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached, None
+    return None, result_cache.begin(key, tables)
+
+
+def record_result(query, result, ticket):
+    """
+    Stores a successful read result, or invalidates the tables touched by a write.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return
+    if ticket is not None:
+        if isinstance(result, dict) and "data" in result and "error" not in result:
+            result_cache.complete(ticket, result)
+    elif classify_query(query) == WRITE:
+        result_cache.invalidate_tables(extract_tables(query))
+
+
+def record_write_positions(result):
+    """
+    Learns the replica positions reported by the master for a write. A
+    replica's "applied_position" is the position up to which it applied
+    every write, unlike the position of the write itself, which it may
+    have applied past a write it missed.
+    """
+    if not isinstance(result, list):
+        return
+    tracker = get_position_tracker()
+    for outcome in result:
+        if isinstance(outcome, dict) and outcome.get("node") and outcome.get("applied_position") is not None:
+            tracker.observe(outcome["node"], outcome["applied_position"])
+
+
+def record_bulk_result(table, result):
+    """
+    Drops the cached reads of a table loaded in bulk and learns the replica
+    positions reported for the load.
+    """
+    if RESULT_CACHE_ENABLED:
+        result_cache.invalidate_tables((table.lower(),))
+    record_write_positions(result)
+
+
+# Calls accepted on an open transaction session
+SESSION_ACTIONS = ("execute", "commit", "rollback")
+
+
+def session_token(node_ip, session_id):
+    """
+    Builds the token of a transaction session. It names the node holding
+    the session, so any proxy worker can route the calls made with it.
+    """
+    return f"{session_id}@{node_ip}"
+
+
+def resolve_session_url(token, instance_details, action):
+    """
+    Returns the URL of `action` on the node holding the session of `token`.
+    Raises ValueError when the token is malformed or names an unknown node.
+    """
+    session_id, _, node_ip = token.rpartition("@")
+    if not session_id or node_ip not in instance_details.by_ip:
+        raise ValueError("Invalid session token")
+    return f"http://{node_ip}:80/session/{session_id}/{action}"
+
+
+def record_session_result(action, data, result):
+    """
+    Keeps the result cache and the replica positions up to date after a
+    session call. The tables a transaction wrote are only known to the
+    node, so a commit drops the whole cache.
+    """
+    if action == "execute":
+        record_result(read_statement(data)[0], result, None)
+    elif action == "commit" and isinstance(result, list):
+        if RESULT_CACHE_ENABLED:
+            result_cache.invalidate_tables(())
+        record_write_positions(result)
+
+
+# Fields of a first page request passed on to the node
+PAGE_FIELDS = ("table", "columns", "key", "filters", "page_size")
+
+
+def resolve_page(data, instance_details):
+    """
+    Returns the /page URL of the node serving a paginated read, the IP of
+    the read node (None for the master) and the payload to send it.
+
+    The token returned to the client names the node that served the page,
+    so the following pages stay on one replica's view of the table. Node
+    tokens hold no server state, so when that node left the topology the
+    page is routed like a first page. Raises ValueError on a malformed token.
+    """
+    payload = {key: data[key] for key in PAGE_FIELDS if key in data}
+    token = data.get("token")
+    if token is not None:
+        node_token, _, node_ip = token.rpartition("@") if isinstance(token, str) else ("", "", "")
+        if not node_token:
+            raise ValueError("Invalid page token")
+        payload["token"] = node_token
+        if node_ip in instance_details.by_ip:
+            return f"http://{node_ip}:80/page", node_ip if node_ip in instance_details.replica_ips else None, payload
+
+    mode = data.get("mode") or "CUSTOMIZED"
+    url, node_ip = resolve_target("CUSTOMIZED" if mode == "AUTO" else mode, instance_details)
+    return f"http://{urlsplit(url).hostname}:80/page", node_ip, payload
+
+
+def page_token(url, result):
+    """
+    Pins the next page token of a node's result to the node at `url`.
+    """
+    if isinstance(result, dict) and result.get("next"):
+        result["next"] = f"{result['next']}@{urlsplit(url).hostname}"
+    return result
+
+
+def plan_batch(items, instance_details):
+    """
+    Resolves the target of every batch item and answers cached reads.
+    Returns the per-item results found so far (None for the others), the
+    cache tickets, and the remaining item indices grouped by target URL and
+    read node IP, in request order within each group.
+    """
+    results = [None] * len(items)
+    tickets = [None] * len(items)
+    groups = {}
+    for index, item in enumerate(items):
+        query, params = read_statement(item)
+        mode = item.get("mode")
+        if not mode:
+            results[index] = {"error": "Missing query or mode"}
+            continue
+        min_position = item.get("min_position")
+        if min_position is not None and (not isinstance(min_position, int) or isinstance(min_position, bool)):
+            results[index] = {"error": "min_position must be an integer"}
+            continue
+        cached_result, tickets[index] = lookup_cached_result(mode, query, min_position, params)
+        if cached_result is not None:
+            results[index] = cached_result
+            continue
+        try:
+            target = resolve_target(mode, instance_details, query, min_position)
+        except ValueError as e:
+            results[index] = {"error": str(e)}
+            continue
+        groups.setdefault(target, []).append(index)
+    return results, tickets, groups
+
+
+def batch_request(items, indices):
+    """
+    Returns the body of the batch sent to one node for the items at
+    `indices`, each forwarded like a /process request, and whether it may be
+    retried: only when every item carries an idempotency key.
+    """
+    payload = {"queries": [forward_payload(items[index]) for index in indices]}
+    return payload, all("idempotency_key" in items[index] for index in indices)
+
+
+def merge_batch_response(results, indices, response):
+    """
+    Spreads the response of a node batch over the items it carried. When the
+    node request failed as a whole, its error becomes the result of each item.
+    """
+    node_results = response.get("results") if isinstance(response, dict) else None
+    if not isinstance(node_results, list) or len(node_results) != len(indices):
+        node_results = [response] * len(indices)
+    for index, result in zip(indices, node_results):
+        results[index] = result
+
+
+def record_batch_results(items, results, tickets):
+    for item, result, ticket in zip(items, results, tickets):
+        record_result(read_statement(item)[0], result, ticket)
+        record_write_positions(result)
+
+
+def record_node_failure(breaker, node_ip=None):
+    """
+    Records a call to a node that failed, unless the deadline of the request
+    had passed: the call then ran out of the caller's budget rather than hit
+    a failing node, and only its half-open probe slot is given back.
+    """
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        breaker.release()
+        return
+    breaker.record_failure()
+    if node_ip is not None:
+        get_latency_prober().observe_failure(node_ip)
+
+
+def record_node_response(breaker, status_code, latency_ms=None):
+    """
+    Records the HTTP response of a node. A node answers 504 when the request
+    reached it past its deadline, which does not count against the node.
+    """
+    if status_code == 504:
+        breaker.release()
+    else:
+        breaker.record_response(status_code, latency_ms)
+
+
+def get_direct_backend():
+    """
+    Returns the direct MySQL backend of this worker. The module is imported
+    on first use, so mysql-connector-python is only needed when enabled.
+    """
+    global _direct_backend
+    if _direct_backend is None:
+        with _direct_backend_lock:
+            if _direct_backend is None:
+                from direct_backend import DirectBackend
+                _direct_backend = DirectBackend()
+    return _direct_backend
+
+
+def direct_backend_stats():
+    if not DIRECT_READS_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, "pools": get_direct_backend().stats()}
+
+
+def should_read_directly(url):
+    """
+    Tells whether a read routed to `url` runs on the node's MySQL server.
+    Only applies to reads without parameters, which DirectBackend cannot bind.
+    """
+    return DIRECT_READS_ENABLED and url.endswith("/read")
+
+
+def direct_read(url, query, node_ip=None):
+    """
+    Runs a read routed to `url` on the node's MySQL server, with the same
+    breaker, in-flight and latency bookkeeping as an HTTP forward. MySQL is
+    reached on the node's private IP, the only address port 3306 is open
+    to the proxy manager on. Returns
+    None when every pooled connection to the node is busy, in which case
+    the caller forwards the read over HTTP instead.
+    """
+    from direct_backend import NodeUnavailable, PoolExhausted
+
+    host = urlsplit(url).hostname
+    address = load_instance_details().private_ip(host)
+    breaker = breakers.get(host)
+    if not breaker.allow_request():
+        return {
+            "message": "Query forwarding failed",
+            "error": f"Circuit open for {host}",
+            "affected_rows": 0,
+        }
+    try:
+        start_time = time.monotonic()
+        if node_ip is not None:
+            with in_flight.track(node_ip):
+                result = get_direct_backend().read(address, query)
+        else:
+            result = get_direct_backend().read(address, query)
+    except PoolExhausted:
+        breaker.release()
+        return None
+    except DeadlineExceeded as e:
+        breaker.release()
+        return {
+            "message": "Query forwarding failed",
+            "error": str(e),
+            "affected_rows": 0,
+        }
+    except NodeUnavailable as e:
+        logging.error(f"Direct read failed: {e}")
+        record_node_failure(breaker, node_ip)
+        return {
+            "message": "Query forwarding failed",
+            "error": str(e),
+            "affected_rows": 0,
+        }
+    latency_ms = (time.monotonic() - start_time) * 1000
+    breaker.record_success(latency_ms)
+    if node_ip is not None:
+        get_latency_prober().observe(node_ip, latency_ms)
+    return result
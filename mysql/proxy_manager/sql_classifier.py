@@ -0,0 +1,159 @@
+import re
+from functools import lru_cache
+
+READ = "READ"
+WRITE = "WRITE"
+
+# Statements that never modify data and can be served by a replica
+READ_KEYWORDS = {"select", "show", "describe", "desc", "explain", "help"}
+
+# Keywords that turn a read-looking statement into one that must run on the master
+WRITE_MARKERS = re.compile(
+    r"\b(insert|update|delete|replace|into|for\s+update|for\s+share|lock\s+in\s+share\s+mode)\b"
+)
+
+FINGERPRINT_CACHE_SIZE = 4096
+
+# Literals, quoted identifiers and comments, matched in one left-to-right pass
+# so comment markers inside a string are never taken for a comment and quotes
+# inside a comment never open a string. Version comments (/*! ... */) are run
+# by MySQL and so are kept.
+_TOKEN_REGEX = re.compile(
+    r"(?P<literal>'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|\b\d+(?:\.\d+)?\b)"
+    r"|(?P<identifier>`[^`]*`)"
+    r"|(?P<comment>/\*(?!!).*?\*/|--(?=\s|$)[^\n]*|#[^\n]*)",
+    re.DOTALL,
+)
+_WHITESPACE_REGEX = re.compile(r"\s+")
+_QUOTED_OR_WHITESPACE_REGEX = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\")|\s+")
+_IDENTIFIER = r"`?[\w$]+`?(?:\.`?[\w$]+`?)?"
+_TABLE_REFERENCE_REGEX = re.compile(
+    rf"\b(?:from|join|into|update|table)\s+({_IDENTIFIER}(?:\s+(?:as\s+)?(?!where\b|join\b|on\b|set\b)\w+)?"
+    rf"(?:\s*,\s*{_IDENTIFIER}(?:\s+(?:as\s+)?(?!where\b|join\b|on\b|set\b)\w+)?)*)"
+)
+
+# Reference corpus of statements and their expected verdict
+CLASSIFIER_CORPUS = [
+    ("SELECT * FROM customer WHERE customer_id = 1;", READ),
+    ("  select first_name from actor", READ),
+    ("(SELECT 1) UNION (SELECT 2)", READ),
+    ("/* report */ SELECT COUNT(*) FROM rental", READ),
+    ("SHOW TABLES", READ),
+    ("DESCRIBE film", READ),
+    ("EXPLAIN SELECT * FROM payment", READ),
+    ("WITH recent AS (SELECT * FROM rental) SELECT * FROM recent", READ),
+    ("SELECT * FROM customer WHERE last_name = 'update'", READ),
+    ("SELECT * FROM film WHERE title = 'INSERT INTO'", READ),
+    ("INSERT INTO customer (store_id, first_name) VALUES (1, 'Customer1');", WRITE),
+    ("UPDATE customer SET last_name = 'Lastname1' WHERE first_name = 'Customer1';", WRITE),
+    ("DELETE FROM payment WHERE payment_id = 3", WRITE),
+    ("REPLACE INTO actor VALUES (1, 'A', 'B', NOW())", WRITE),
+    ("CREATE TABLE t (id INT)", WRITE),
+    ("SELECT * FROM inventory WHERE inventory_id = 1 FOR UPDATE", WRITE),
+    ("SELECT * FROM inventory LOCK IN SHARE MODE", WRITE),
+    ("SELECT COUNT(*) INTO @total FROM rental", WRITE),
+    ("WITH old AS (SELECT rental_id FROM rental) DELETE FROM rental WHERE rental_id IN (SELECT rental_id FROM old)", WRITE),
+    ("SELECT 1; DELETE FROM actor", WRITE),
+    ("SELECT * FROM t WHERE a = '--'; DELETE FROM actor", WRITE),
+    ("SELECT * FROM t WHERE a='#'; DELETE FROM actor", WRITE),
+    ("SELECT * FROM t WHERE a = '/*'; DELETE FROM actor; SELECT '*/'", WRITE),
+    ("SELECT * FROM t WHERE a = \"--\"; DELETE FROM actor", WRITE),
+    ("SELECT * FROM t WHERE a = 'it''s -- fine'", READ),
+    ("SELECT 1 -- ; DELETE FROM actor", READ),
+    ("SELECT 1 /* '; DELETE FROM actor */", READ),
+    ("SELECT 1 /*! ; DELETE FROM actor */", WRITE),
+    ("", WRITE),
+]
+
+
+def _fingerprint_token(match):
+    if match.group("literal") is not None:
+        return "?"
+    if match.group("identifier") is not None:
+        return match.group("identifier")
+    return " "
+
+
+def fingerprint(query):
+    """
+    Normalizes a query so that statements differing only in literal values,
+    comments, case or whitespace share one fingerprint.
+    """
+    query = _TOKEN_REGEX.sub(_fingerprint_token, query)
+    return _WHITESPACE_REGEX.sub(" ", query).strip().lower()
+
+
+def normalize_query(query):
+    """
+    Collapses whitespace outside string literals and drops the trailing
+    semicolon, keeping literal values so the result can key a cache.
+    """
+    query = _QUOTED_OR_WHITESPACE_REGEX.sub(lambda match: match.group(1) or " ", query)
+    return query.strip().rstrip(";").strip()
+
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def extract_fingerprint_tables(query_fingerprint):
+    """
+    Returns the lower-cased names of the tables referenced by a fingerprinted
+    query, without schema prefix or backticks.
+    """
+    tables = set()
+    for match in _TABLE_REFERENCE_REGEX.finditer(query_fingerprint):
+        for reference in match.group(1).split(","):
+            name = reference.split()[0].replace("`", "").split(".")[-1]
+            if name not in ("select", "?"):
+                tables.add(name)
+    return frozenset(tables)
+
+
+def extract_tables(query):
+    """
+    Returns the set of tables a query reads or writes. An empty set means
+    the tables could not be determined.
+    """
+    return extract_fingerprint_tables(fingerprint(query))
+
+
+def extract_read_tables(query):
+    """
+    Returns the tables of a single SELECT without joins or subqueries, for
+    which the table list is known to be complete. Returns an empty set for
+    any other statement.
+    """
+    query_fingerprint = fingerprint(query)
+    if query_fingerprint.count("select") != 1 or re.search(r"\bjoin\b", query_fingerprint):
+        return frozenset()
+    return extract_fingerprint_tables(query_fingerprint)
+
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def classify_fingerprint(query_fingerprint):
+    """
+    Classifies a fingerprinted query as READ or WRITE. Anything that is not
+    clearly a read is treated as a write so it is sent to the master.
+    """
+    statements = [statement.strip() for statement in query_fingerprint.split(";") if statement.strip()]
+    if not statements:
+        return WRITE
+    for statement in statements:
+        keyword = statement.lstrip("( ").split(" ", 1)[0]
+        if keyword == "with":
+            keyword = "select"
+        if keyword not in READ_KEYWORDS or WRITE_MARKERS.search(statement):
+            return WRITE
+    return READ
+
+
+def classify_query(query):
+    """
+    Returns READ when the query can be served by a replica, WRITE otherwise.
+    """
+    return classify_fingerprint(fingerprint(query))
+
+
+if __name__ == "__main__":
+    failures = [(query, expected) for query, expected in CLASSIFIER_CORPUS if classify_query(query) != expected]
+    for query, expected in failures:
+        print(f"Expected {expected} for: {query}")
+    print(f"{len(CLASSIFIER_CORPUS) - len(failures)}/{len(CLASSIFIER_CORPUS)} statements classified correctly")
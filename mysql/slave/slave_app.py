@@ -1,5 +1,13 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import mysql.connector
+import threading
+from codec import encode_body, negotiate
+from db_pool import ConnectionPool
+from deadline import Deadline, DeadlineExceeded, limit_execution_time, set_current_deadline
+from pagination import read_page
+from replication_state import advance_position, ensure_replication_state, read_applied_ahead, read_position
+from statements import execute_statement, prepared_statement_stats, read_statement
+from streaming import NDJSON_MIMETYPE, STREAM_BUDGET, STREAM_FETCH_SIZE
 
 app = Flask(__name__)
 
@@ -11,16 +19,104 @@ DB_CONFIG = {
     "database": "sakila",
 }
 
+# Warm MySQL connections shared by the threads of this worker
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 8
 
-# Utility function to establish a database connection
-def get_db_connection():
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+# Utility function to open the database connection pool
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(DB_CONFIG, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+    return _db_pool
+
+
+# Utility function to check out a database connection
+def get_db_connection(deadline=None):
     """
-    Establishes and returns a connection to the database.
+    Checks a connection out of the pool; closing it returns it to the pool.
+    Its reads are limited to the time left before `deadline`, by default
+    the request's deadline.
     """
     try:
-        return mysql.connector.connect(**DB_CONFIG)
+        connection = get_db_pool().acquire()
     except mysql.connector.Error as err:
         raise ConnectionError(f"Database connection failed: {err}")
+    try:
+        limit_execution_time(connection, deadline)
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+# Utility function to encode a response in the negotiated format
+def encoded_response(body, status=200):
+    """
+    Encodes a result as JSON, MessagePack or Arrow, as asked for by the
+    Accept header of the request. JSON is the default.
+    """
+    payload, mimetype = encode_body(body, negotiate(request.headers.get("Accept")))
+    return Response(payload, status=status, mimetype=mimetype)
+
+
+# Utility function to stream the rows of an executed query
+def stream_rows(connection, cursor):
+    """
+    Yields the rows of an executed query as NDJSON lines, STREAM_FETCH_SIZE
+    rows at a time. The status line is already sent when a fetch fails,
+    so the failure is reported as a final error line.
+    """
+    try:
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            yield "".join(app.json.dumps(row) + "\n" for row in rows)
+    except mysql.connector.Error as err:
+        yield app.json.dumps({"error": str(err)}) + "\n"
+    finally:
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+
+# Database Pool Stats Endpoint
+@app.route("/stats/db_pool", methods=["GET"])
+def db_pool_stats():
+    """
+    Returns the size, saturation and checkout waits of the connection pool.
+    """
+    return jsonify(get_db_pool().stats()), 200
+
+
+# Prepared Statement Stats Endpoint
+@app.route("/stats/statements", methods=["GET"])
+def statement_stats():
+    """
+    Returns the hit ratio of the prepared statement caches.
+    """
+    return jsonify(prepared_statement_stats()), 200
+
+
+# Deadline of each request, from the budget its caller has left
+@app.before_request
+def start_deadline():
+    deadline = Deadline.from_headers(request.headers)
+    set_current_deadline(deadline)
+    deadline.check()
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(err):
+    return jsonify({"error": str(err)}), 504
 
 
 # Health Check Endpoint
@@ -38,55 +134,235 @@ def health_check():
         return jsonify({"status": "unhealthy", "error": str(err)}), 500
 
 
+# Replication Position Endpoint
+@app.route("/position", methods=["GET"])
+def replication_position():
+    """
+    Returns the position of the last write replayed from the master.
+    """
+    try:
+        connection = get_db_connection()
+        ensure_replication_state(connection)
+        cursor = connection.cursor()
+        position = read_position(cursor)
+        connection.close()
+        return jsonify({"position": position}), 200
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+
 # Execute a Read Query Endpoint
 @app.route("/read", methods=["POST"])
 def read_data():
     """
-    Executes a read query and returns the results.
+    Executes a read query and returns the results. Parameterized queries
+    run as cached prepared statements.
     """
     data = request.json
-    query = data.get("query")
-
-    if not query:
-        return jsonify({"error": "Query is missing"}), 400
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(query)
+        cursor = execute_statement(connection, query, params, dictionary=True)
         rows = cursor.fetchall()
         connection.close()
-        return jsonify({"data": rows}), 200
+        return encoded_response({"data": rows})
     except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
         return jsonify({"error": str(err)}), 500
+
+
+# Stream a Read Query Endpoint
+@app.route("/read/stream", methods=["POST"])
+def read_stream():
+    """
+    Executes a read query on an unbuffered cursor and streams the rows as
+    NDJSON, so memory stays flat however many rows come back. The read may
+    run for STREAM_BUDGET rather than the request's deadline, since rows
+    keep flowing to the client long after it would have passed.
+    """
+    data = request.json
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        connection = get_db_connection(Deadline(STREAM_BUDGET))
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+
+    try:
+        cursor = execute_statement(connection, query, params, dictionary=True)
     except mysql.connector.Error as err:
+        connection.close()
         return jsonify({"error": str(err)}), 500
+    return Response(stream_rows(connection, cursor), mimetype=NDJSON_MIMETYPE)
 
 
 # Execute a Write Query Endpoint
 @app.route("/write", methods=["POST"])
 def write_data():
     """
-    Executes a write query and returns the result.
+    Executes a write query and returns the result. A write replayed by the
+    master carries its position, which is recorded in the same transaction;
+    "applied_position" is then the position up to which this slave applied
+    every write, which stays below a write it missed.
     """
     data = request.json
-    query = data.get("query")
-
-    if not query:
-        return jsonify({"error": "Query is missing"}), 400
+    position = data.get("position")
+    try:
+        query, params = read_statement(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
         connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute(query)
+        ensure_replication_state(connection)
+        affected_rows = execute_statement(connection, query, params, buffered=True).rowcount
+        applied_position = None
+        if position is not None:
+            applied_position = advance_position(connection.cursor(buffered=True), position)
         connection.commit()
-        affected_rows = cursor.rowcount
         connection.close()
-        return jsonify({"message": "Query executed successfully", "affected_rows": affected_rows}), 200
+        return jsonify({
+            "message": "Query executed successfully",
+            "affected_rows": affected_rows,
+            "position": position,
+            "applied_position": applied_position
+        }), 200
     except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
         return jsonify({"error": str(err)}), 500
+
+
+# Paginated Read Endpoint
+@app.route("/page", methods=["POST"])
+def page_data():
+    """
+    Returns one page of a table in key order and the token of the next page.
+    """
+    try:
+        connection = get_db_connection()
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    try:
+        return encoded_response(read_page(connection, request.get_json(silent=True)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except mysql.connector.Error as err:
         return jsonify({"error": str(err)}), 500
+    finally:
+        connection.close()
+
+
+# Execute a Batch of Read Queries Endpoint
+@app.route("/read/batch", methods=["POST"])
+def read_batch():
+    """
+    Executes a list of reads on one connection, each a query string or a
+    statement payload. Returns the results in request order, with an error
+    entry for each query that failed.
+    """
+    data = request.json
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Queries are missing"}), 400
+
+    try:
+        connection = get_db_connection()
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+
+    results = []
+    for query in queries:
+        try:
+            sql, params = read_statement({"query": query} if isinstance(query, str) else query)
+            cursor = execute_statement(connection, sql, params, dictionary=True, buffered=True)
+            results.append({"data": cursor.fetchall()})
+        except ValueError as e:
+            results.append({"error": str(e)})
+        except mysql.connector.Error as err:
+            results.append({"error": str(err)})
+    connection.close()
+    return encoded_response({"results": results})
+
+
+# Execute a Batch of Write Queries Endpoint
+@app.route("/write/batch", methods=["POST"])
+def write_batch():
+    """
+    Executes a list of writes on one connection, each in its own transaction.
+    Items replayed by the master are objects carrying the query and its
+    position; plain strings are accepted for direct writes. With
+    "skip_applied", items at or below the slave's position were already
+    applied and are skipped, so the master's log replicator can resend them.
+    Positioned items are applied in order: once one fails, the later ones
+    are not applied, so the position never moves past a missing write and
+    the master resends from the failed one.
+    """
+    data = request.json
+    items = data.get("queries")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Queries are missing"}), 400
+
+    try:
+        connection = get_db_connection()
+        ensure_replication_state(connection)
+    except ConnectionError as err:
+        return jsonify({"error": str(err)}), 503
+    except mysql.connector.Error as err:
+        return jsonify({"error": str(err)}), 500
+
+    results = []
+    cursor = connection.cursor(buffered=True)
+    applied_position = read_position(cursor) if data.get("skip_applied") else None
+    applied_ahead = read_applied_ahead(cursor) if data.get("skip_applied") else set()
+    failed_position = None
+    for item in items:
+        position = item.get("position") if isinstance(item, dict) else None
+        if failed_position is not None and position is not None:
+            results.append({
+                "error": f"Not applied after the failure at position {failed_position}",
+                "position": position
+            })
+            continue
+        try:
+            query, params = read_statement(item if isinstance(item, dict) else {"query": item})
+        except ValueError as e:
+            results.append({"error": str(e)})
+            failed_position = position
+            continue
+        if applied_position is not None and position is not None and (
+            position <= applied_position or position in applied_ahead
+        ):
+            results.append({"message": "Query already applied", "affected_rows": 0, "position": position})
+            continue
+        try:
+            affected_rows = execute_statement(connection, query, params, buffered=True).rowcount
+            watermark = None
+            if position is not None:
+                watermark = advance_position(cursor, position)
+            connection.commit()
+            results.append({
+                "message": "Query executed successfully",
+                "affected_rows": affected_rows,
+                "position": position,
+                "applied_position": watermark
+            })
+        except mysql.connector.Error as err:
+            connection.rollback()
+            results.append({"error": str(err)})
+            failed_position = position
+    connection.close()
+    return jsonify({"results": results}), 200
 
 
 if __name__ == "__main__":
@@ -1,8 +1,18 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import logging
 import re
 import requests
-import json
+import time
+from urllib.parse import urlsplit
+from batch import normalize_batch
+from bulk import CSV_MIMETYPE
+from circuit_breaker import BreakerRegistry
+from codec import JSON_MIMETYPE
+from deadline import Deadline, DeadlineExceeded, current_deadline, set_current_deadline
+from statements import read_statement
+from streaming import relay_stream
+from topology import get_topology, install_reload_signal
+from upstream import UpstreamClient
 
 app = Flask(__name__)
 
@@ -17,11 +27,22 @@ logging.basicConfig(
 )
 
 # Constants
-ALLOWED_MODES = {"DIRECT", "RANDOM", "CUSTOMIZED"}
+ALLOWED_MODES = {
+    "DIRECT", "RANDOM", "CUSTOMIZED", "AUTO",
+    "LEAST_OUTSTANDING", "POWER_OF_TWO", "WEIGHTED_ROUND_ROBIN",
+}
 VALID_CREDENTIALS = {
     "admin_elaa": "admin_elaa_password123"
 }
 
+install_reload_signal()
+
+# Pooled keep-alive client used to reach the proxy manager
+upstream = UpstreamClient()
+
+# Circuit breakers of the proxy managers
+breakers = BreakerRegistry()
+
 
 # Utility Functions
 def validate_user_credentials(headers):
@@ -45,29 +66,42 @@ def validate_user_credentials(headers):
 
 def load_proxy_manager_details():
     """
-    Loads proxy manager details from a configuration file.
+    Returns the proxy manager topology, reloaded only when proxy_info.json changes.
     """
-    try:
-        with open("proxy_info.json", "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        app.logger.error("proxy_info.json not found")
-        raise FileNotFoundError("proxy_info.json not found")
-    except json.JSONDecodeError:
-        app.logger.error("Error decoding JSON from proxy_info.json")
-        raise ValueError("Error decoding JSON from proxy_info.json")
+    return get_topology("proxy_info.json")
 
 
-def forward_query(url, data):
+def forward_query(url, payload, **post_options):
     """
     Forwards the query to the specified URL and handles the response.
+    Fails fast while the circuit breaker of the proxy manager is open.
+    `post_options` are passed on to the request, such as a raw body to send.
+    The client's Accept header is passed on, and a successful body is relayed
+    as raw bytes while it arrives, in the encoding the proxy manager
+    negotiated, without being decoded.
     """
+    breaker = breakers.get(urlsplit(url).hostname)
+    if not breaker.allow_request():
+        app.logger.error(f"Circuit open for proxy manager {breaker.name}")
+        return {
+            "message": "Query forwarding failed",
+            "error": f"Circuit open for {breaker.name}",
+            "affected_rows": 0
+        }, 503
+    post_options["headers"] = {"Accept": request.headers.get("Accept", JSON_MIMETYPE), **post_options.get("headers", {})}
     try:
         app.logger.info(f"Forwarding request to {url}")
-        response = requests.post(url, json=data)
+        start_time = time.monotonic()
+        response = upstream.post(url, json=payload, stream=True, **post_options)
+        # The proxy manager answers 504 when the request's deadline passed,
+        # which does not count against it
+        if response.status_code == 504:
+            breaker.release()
+        else:
+            breaker.record_response(response.status_code, (time.monotonic() - start_time) * 1000)
         if response.status_code == 200:
             app.logger.info("Query processed successfully")
-            return response.json(), 200
+            return Response(relay_stream(response), content_type=response.headers.get("Content-Type")), 200
         else:
             app.logger.error(f"Query execution failed: {response.text}")
             return {
@@ -77,6 +111,11 @@ def forward_query(url, data):
             }, response.status_code
     except requests.RequestException as e:
         app.logger.critical(f"Query forwarding failed: {str(e)}")
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            breaker.release()
+        else:
+            breaker.record_failure()
         return {
             "message": "Query forwarding failed",
             "error": str(e),
@@ -84,7 +123,51 @@ def forward_query(url, data):
         }, 500
 
 
+def relayed_body():
+    """
+    Options forwarding the request body as received, without re-encoding it.
+    """
+    return {"data": request.get_data(), "headers": {"Content-Type": request.content_type or JSON_MIMETYPE}}
+
+
+def forward_session_call(path):
+    """
+    Authenticates the user and forwards a transaction session call to the proxy manager.
+    """
+    is_authenticated, auth_error = validate_user_credentials(request.headers)
+    if not is_authenticated:
+        return jsonify({"error": auth_error}), 401
+
+    try:
+        proxy_manager_ip = load_proxy_manager_details().first_ip
+
+        if not proxy_manager_ip:
+            app.logger.error("No proxy manager IP found in the configuration")
+            return jsonify({"error": "No proxy manager IP found"}), 500
+
+        return forward_query(f"http://{proxy_manager_ip}:80{path}", None, **relayed_body())
+
+    except (FileNotFoundError, ValueError) as e:
+        app.logger.error(str(e))
+        return jsonify({"error": str(e)}), 500
+
+
 # Endpoints
+@app.before_request
+def start_deadline():
+    """
+    Starts the deadline of a request from the budget its caller has left.
+    """
+    deadline = Deadline.from_headers(request.headers)
+    set_current_deadline(deadline)
+    deadline.check()
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(err):
+    return jsonify({"error": str(err)}), 504
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """
@@ -94,6 +177,22 @@ def health_check():
     return jsonify({"status": "healthy"}), 200
 
 
+@app.route("/stats/breakers", methods=["GET"])
+def breaker_stats():
+    """
+    Returns the circuit breaker state of every upstream node and recent transitions.
+    """
+    return jsonify(breakers.snapshot()), 200
+
+
+@app.route("/stats/upstream", methods=["GET"])
+def upstream_stats():
+    """
+    Returns connection pool statistics of the upstream HTTP client.
+    """
+    return jsonify(upstream.stats()), 200
+
+
 @app.route("/process", methods=["POST"])
 def process_query():
     """
@@ -103,9 +202,15 @@ def process_query():
     app.logger.debug(f"Received request payload: {data}")
 
     # Validate request payload
-    if "query" not in data or "mode" not in data:
+    if ("query" not in data and "sql" not in data) or "mode" not in data:
         app.logger.warning("Missing required keys in request payload")
-        return jsonify({"error": "Missing required keys. Required keys: 'query', 'mode'"}), 400
+        return jsonify({"error": "Missing required keys. Required keys: 'query' (or 'sql' and 'params'), 'mode'"}), 400
+
+    try:
+        read_statement(data)
+    except ValueError as e:
+        app.logger.warning(f"Invalid query: {e}")
+        return jsonify({"error": str(e)}), 400
 
     mode = data.get("mode").upper()
     if mode not in ALLOWED_MODES:
@@ -119,21 +224,162 @@ def process_query():
 
     # Forward query to the proxy manager
     try:
-        instance_details = load_proxy_manager_details()
-        proxy_manager_ip = next((instance["PublicIP"] for instance in instance_details), None)
+        proxy_manager_ip = load_proxy_manager_details().first_ip
 
         if not proxy_manager_ip:
             app.logger.error("No proxy manager IP found in the configuration")
             return jsonify({"error": "No proxy manager IP found"}), 500
 
+        # A write carrying an idempotency key is retried when the proxy manager fails
         url = f"http://{proxy_manager_ip}:80/process"
-        return forward_query(url, data)
+        return forward_query(url, None, idempotent="idempotency_key" in data, **relayed_body())
+
+    except (FileNotFoundError, ValueError) as e:
+        app.logger.error(str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/batch", methods=["POST"])
+def process_batch():
+    """
+    Validates and authenticates a batch of queries once and forwards it to
+    the proxy manager as a unit.
+    """
+    data = request.json
+    try:
+        items = normalize_batch(data)
+    except ValueError as e:
+        app.logger.warning(f"Invalid batch: {e}")
+        return jsonify({"error": str(e)}), 400
+    app.logger.debug(f"Received batch of {len(items)} queries")
+
+    for index, item in enumerate(items):
+        mode = item.get("mode")
+        if not isinstance(mode, str) or mode.upper() not in ALLOWED_MODES:
+            app.logger.warning(f"Invalid mode provided for batch query {index}: {mode}")
+            return jsonify({
+                "error": f"Invalid mode for query {index}. Allowed modes are: {', '.join(ALLOWED_MODES)}"
+            }), 400
+        item["mode"] = mode.upper()
+
+    # Authenticate user
+    is_authenticated, auth_error = validate_user_credentials(request.headers)
+    if not is_authenticated:
+        return jsonify({"error": auth_error}), 401
+
+    try:
+        proxy_manager_ip = load_proxy_manager_details().first_ip
+
+        if not proxy_manager_ip:
+            app.logger.error("No proxy manager IP found in the configuration")
+            return jsonify({"error": "No proxy manager IP found"}), 500
+
+        # The modes were upper-cased, so the batch is re-encoded rather than relayed
+        url = f"http://{proxy_manager_ip}:80/batch"
+        return forward_query(url, {"queries": items})
+
+    except (FileNotFoundError, ValueError) as e:
+        app.logger.error(str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/bulk", methods=["POST"])
+def process_bulk():
+    """
+    Authenticates the user and relays a bulk insert body to the proxy manager,
+    with its content type and query arguments. A CSV body is relayed as it
+    arrives, unless the load carries an idempotency key.
+    """
+    is_authenticated, auth_error = validate_user_credentials(request.headers)
+    if not is_authenticated:
+        return jsonify({"error": auth_error}), 401
+
+    if request.mimetype == CSV_MIMETYPE:
+        target = request.args
+    else:
+        target = request.get_json(silent=True) or {}
+    # A load carrying an idempotency key is read whole, so it can be sent
+    # again when the proxy manager fails
+    idempotent = "idempotency_key" in target
+    body = request.get_data() if idempotent or request.mimetype != CSV_MIMETYPE else request.stream
+
+    try:
+        proxy_manager_ip = load_proxy_manager_details().first_ip
+
+        if not proxy_manager_ip:
+            app.logger.error("No proxy manager IP found in the configuration")
+            return jsonify({"error": "No proxy manager IP found"}), 500
+
+        return forward_query(
+            f"http://{proxy_manager_ip}:80/bulk",
+            None,
+            data=body,
+            params=request.args,
+            headers={"Content-Type": request.content_type},
+            idempotent=idempotent,
+        )
 
     except (FileNotFoundError, ValueError) as e:
         app.logger.error(str(e))
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/page", methods=["POST"])
+def process_page():
+    """
+    Authenticates the user and relays a paginated read to the proxy manager.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or ("table" not in data and "token" not in data):
+        app.logger.warning("Missing required keys in page request")
+        return jsonify({"error": "Missing required keys. Required keys: 'table' or 'token'"}), 400
+
+    mode = data.get("mode")
+    if mode is not None and (not isinstance(mode, str) or mode.upper() not in ALLOWED_MODES):
+        app.logger.warning(f"Invalid mode provided: {mode}")
+        return jsonify({"error": f"Invalid mode. Allowed modes are: {', '.join(ALLOWED_MODES)}"}), 400
+
+    is_authenticated, auth_error = validate_user_credentials(request.headers)
+    if not is_authenticated:
+        return jsonify({"error": auth_error}), 401
+
+    try:
+        proxy_manager_ip = load_proxy_manager_details().first_ip
+
+        if not proxy_manager_ip:
+            app.logger.error("No proxy manager IP found in the configuration")
+            return jsonify({"error": "No proxy manager IP found"}), 500
+
+        return forward_query(f"http://{proxy_manager_ip}:80/page", None, **relayed_body())
+
+    except (FileNotFoundError, ValueError) as e:
+        app.logger.error(str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/session", methods=["POST"])
+def open_session():
+    """
+    Authenticates the user and opens a transaction session through the proxy manager.
+    """
+    return forward_session_call("/session")
+
+
+@app.route("/session/<token>/<action>", methods=["POST"])
+def session_call(token, action):
+    """
+    Authenticates the user and forwards a call made with a session token.
+    """
+    data = request.get_json(silent=True) or {}
+    if action == "execute":
+        try:
+            read_statement(data)
+        except ValueError as e:
+            app.logger.warning(f"Invalid query: {e}")
+            return jsonify({"error": str(e)}), 400
+    return forward_session_call(f"/session/{token}/{action}")
+
+
 if __name__ == "__main__":
     app.logger.info("Starting Flask application")
     app.run(host="0.0.0.0", port=80)
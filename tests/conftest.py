@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The tiers are deployed as flat directories next to mysql/common, so their
+# modules import each other by bare name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for tier in ("common", "master", "proxy_manager"):
+    sys.path.insert(0, os.path.join(ROOT, "mysql", tier))
+
+
+class FakeClock:
+    """
+    Monotonic clock advanced by hand, for the components taking a `clock`.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,80 @@
+import random
+from collections import Counter
+
+import pytest
+
+from balancer import (
+    LEAST_OUTSTANDING,
+    POWER_OF_TWO,
+    WEIGHTED_ROUND_ROBIN,
+    InFlightTracker,
+    WeightedRoundRobin,
+    least_outstanding,
+    power_of_two_choices,
+    select_node,
+)
+
+NODES = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+
+def test_tracker_counts_outstanding_requests():
+    tracker = InFlightTracker()
+    tracker.acquire("a")
+    with tracker.track("a"):
+        assert tracker.get("a") == 2
+        with pytest.raises(RuntimeError):
+            with tracker.track("b"):
+                raise RuntimeError("Upstream failed")
+    assert tracker.snapshot() == {"a": 1}
+    tracker.release("a")
+    assert tracker.get("a") == 0
+    assert tracker.snapshot() == {}
+
+
+def test_least_outstanding_picks_the_idlest_node():
+    counts = {"10.0.0.1": 3, "10.0.0.2": 1, "10.0.0.3": 2}
+    assert least_outstanding(NODES, counts.get) == "10.0.0.2"
+
+
+def test_least_outstanding_breaks_ties_at_random():
+    counts = {"10.0.0.1": 0, "10.0.0.2": 0, "10.0.0.3": 5}
+    picks = {least_outstanding(NODES, counts.get, random.Random(seed)) for seed in range(20)}
+    assert picks == {"10.0.0.1", "10.0.0.2"}
+
+
+def test_power_of_two_never_picks_the_busier_of_its_sample():
+    counts = {"10.0.0.1": 0, "10.0.0.2": 1, "10.0.0.3": 2}
+    rng = random.Random(7)
+    picks = Counter(power_of_two_choices(NODES, counts.get, rng) for _ in range(300))
+    assert "10.0.0.3" not in picks
+    assert picks["10.0.0.1"] > picks["10.0.0.2"]
+
+
+def test_power_of_two_with_one_candidate():
+    assert power_of_two_choices(["10.0.0.1"], lambda node: 9) == "10.0.0.1"
+
+
+def test_weighted_round_robin_is_smooth():
+    round_robin = WeightedRoundRobin()
+    weights = {"a": 5, "b": 1, "c": 1}
+    picks = [round_robin.select(["a", "b", "c"], weights.get) for _ in range(7)]
+    assert picks == ["a", "a", "b", "a", "c", "a", "a"]
+
+
+def test_weighted_round_robin_forgets_removed_nodes():
+    round_robin = WeightedRoundRobin()
+    for _ in range(3):
+        round_robin.select(["a", "b"], lambda node: 1)
+    picks = Counter(round_robin.select(["a", "c"], lambda node: 1) for _ in range(4))
+    assert picks == {"a": 2, "c": 2}
+
+
+@pytest.mark.parametrize("strategy", [LEAST_OUTSTANDING, POWER_OF_TWO, WEIGHTED_ROUND_ROBIN])
+def test_no_candidates_is_an_error(strategy):
+    with pytest.raises(ValueError):
+        select_node(strategy, [], lambda node: 0, lambda node: 1, WeightedRoundRobin())
+
+
+def test_unknown_strategy_is_an_error():
+    with pytest.raises(ValueError):
+        select_node("FASTEST", NODES, lambda node: 0, lambda node: 1, WeightedRoundRobin())
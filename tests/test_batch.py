@@ -0,0 +1,49 @@
+import pytest
+
+from batch import normalize_batch
+from routing import batch_request
+
+
+def test_items_take_the_batch_defaults():
+    items = normalize_batch({
+        "queries": ["SELECT 1", {"query": "DELETE FROM t", "mode": "DIRECT", "ack": "all"}],
+        "mode": "AUTO",
+        "ack": "one",
+    })
+    assert items == [
+        {"query": "SELECT 1", "mode": "AUTO", "ack": "one"},
+        {"query": "DELETE FROM t", "mode": "DIRECT", "ack": "all"},
+    ]
+
+
+def test_statement_payloads_and_keys_are_accepted():
+    item = {"sql": "INSERT INTO t VALUES (?)", "params": [1], "idempotency_key": "key-1"}
+    assert normalize_batch({"queries": [item]}) == [item]
+
+
+@pytest.mark.parametrize("data, message", [
+    (None, "Batch body must be a JSON object"),
+    ({"queries": []}, "Queries are missing"),
+    ({"queries": ["SELECT 1"] * 3}, "Batch exceeds 2 queries"),
+    ({"queries": ["SELECT 1", 7]}, "Query 1 is missing"),
+    ({"queries": ["  "]}, "Query 0: Query is missing"),
+    ({"queries": [{"sql": "SELECT ?", "params": [{}]}]}, "Query 0: Params must be"),
+    ({"queries": [{"query": "SELECT 1", "idempotency_key": ""}]}, "Query 0: idempotency_key must be"),
+])
+def test_invalid_batches_are_rejected(data, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_batch(data, max_queries=2)
+
+
+def test_node_batches_forward_whole_items():
+    items = normalize_batch({
+        "queries": [
+            {"sql": "UPDATE t SET a = ?", "params": [2], "idempotency_key": "key-1", "min_position": 3},
+            "SELECT 1",
+        ],
+        "mode": "AUTO",
+    })
+    payload, idempotent = batch_request(items, [0])
+    assert payload == {"queries": [{"sql": "UPDATE t SET a = ?", "params": [2], "idempotency_key": "key-1"}]}
+    assert idempotent
+    assert batch_request(items, [0, 1])[1] is False
@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+from bulk import bulk_insert_statements, iter_csv_rows, read_bulk_target
+
+
+def test_rows_are_grouped_into_chunks_sharing_their_sql():
+    rows = [[index, f"name{index}"] for index in range(5)]
+    statements = list(bulk_insert_statements("actor", ["actor_id", "first_name"], rows, chunk_rows=2))
+    assert [len(statement["params"]) for statement in statements] == [4, 4, 2]
+    assert statements[0]["sql"] == "INSERT INTO `actor` (`actor_id`, `first_name`) VALUES (?, ?), (?, ?)"
+    assert statements[0]["sql"] is statements[1]["sql"]
+    assert statements[2]["sql"] == "INSERT INTO `actor` (`actor_id`, `first_name`) VALUES (?, ?)"
+    assert statements[2]["params"] == [4, "name4"]
+
+
+def test_chunks_stay_under_the_placeholder_limit():
+    columns = [f"c{index}" for index in range(40000)]
+    statement = next(bulk_insert_statements("wide", columns, [[0] * 40000] * 2))
+    assert len(statement["params"]) == 40000
+
+
+@pytest.mark.parametrize("rows, message", [
+    ([[1]], "Row 0 does not have 2 values"),
+    ([[1, 2], [1, {}]], "Row 1 holds a value"),
+    ([[1, 2]] * 4, "Bulk insert exceeds 3 rows"),
+])
+def test_malformed_rows_are_rejected(rows, message):
+    with pytest.raises(ValueError, match=message):
+        list(bulk_insert_statements("t", ["a", "b"], rows, max_rows=3))
+
+
+def test_bulk_target_from_json_or_query_arguments():
+    assert read_bulk_target({"table": "t", "columns": ["a", "b"]}) == ("t", ["a", "b"])
+    assert read_bulk_target({"table": "t", "columns": "a, b"}) == ("t", ["a", "b"])
+    with pytest.raises(ValueError, match="Columns must be plain identifiers"):
+        read_bulk_target({"table": "t", "columns": "a, b)"})
+
+
+def test_csv_rows_read_null_markers():
+    stream = io.BytesIO(b"1,\\N\n\n2,x\n")
+    assert list(iter_csv_rows(stream)) == [["1", None], ["2", "x"]]
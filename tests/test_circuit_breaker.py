@@ -0,0 +1,71 @@
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker
+
+
+def make_breaker(clock, **options):
+    return CircuitBreaker("node", failure_threshold=3, base_ejection_s=1.0, max_ejection_s=4.0, clock=clock, **options)
+
+
+def eject(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_consecutive_failures_open_the_circuit(clock):
+    breaker = make_breaker(clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    eject(breaker)
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_admits_a_single_probe(clock):
+    breaker = make_breaker(clock)
+    eject(breaker)
+    clock.advance(1.0)
+    assert breaker.available()
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()
+    assert not breaker.available()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = make_breaker(clock)
+    eject(breaker)
+    clock.advance(1.0)
+    assert breaker.allow_request()
+    breaker.record_success(latency_ms=10.0)
+    assert breaker.state == CLOSED
+    assert breaker.ejections == 0
+
+
+def test_ejection_time_doubles_up_to_the_maximum(clock):
+    breaker = make_breaker(clock)
+    eject(breaker)
+    for ejection in (2.0, 4.0, 4.0):
+        clock.advance(breaker.open_until - clock.now)
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.open_until - clock.now == ejection
+
+
+def test_slow_calls_and_failure_statuses_count_as_failures(clock):
+    breaker = make_breaker(clock, slow_call_ms=100.0)
+    breaker.record_success(latency_ms=150.0)
+    breaker.record_response(503)
+    breaker.record_response(200, latency_ms=500.0)
+    assert breaker.state == OPEN
+
+
+def test_registry_records_transitions(clock):
+    registry = BreakerRegistry(clock=clock, failure_threshold=1)
+    registry.get("a").record_failure()
+    assert registry.available(["a", "b"]) == ["b"]
+    assert registry.snapshot()["transitions"] == [{"node": "a", "from": CLOSED, "to": OPEN, "at": 0.0}]
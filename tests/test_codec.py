@@ -0,0 +1,82 @@
+import datetime
+import decimal
+import json
+
+import pytest
+
+from codec import (
+    ARROW_MIMETYPE,
+    JSON_MIMETYPE,
+    MSGPACK_MIMETYPE,
+    decode_body,
+    encode_body,
+    negotiate,
+    to_json_row,
+)
+
+ROWS = {
+    "data": [
+        {"film_id": 1, "rental_rate": decimal.Decimal("0.99"), "last_update": datetime.datetime(2006, 2, 15, 5, 3, 42)},
+        {"film_id": 2, "rental_rate": decimal.Decimal("4.99"), "last_update": datetime.datetime(2006, 2, 15, 5, 3, 43)},
+    ]
+}
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON_MIMETYPE),
+    ("*/*", JSON_MIMETYPE),
+    ("text/html", JSON_MIMETYPE),
+    ("application/x-msgpack", MSGPACK_MIMETYPE),
+    (f"{JSON_MIMETYPE};q=0.5, {MSGPACK_MIMETYPE}", MSGPACK_MIMETYPE),
+    (f"{MSGPACK_MIMETYPE};q=0.2, {JSON_MIMETYPE};q=0.9", JSON_MIMETYPE),
+    (f"{MSGPACK_MIMETYPE};q=oops, {JSON_MIMETYPE};q=0.1", JSON_MIMETYPE),
+])
+def test_negotiate_picks_the_preferred_available_encoding(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_msgpack_keeps_column_types():
+    pytest.importorskip("msgpack")
+    body = {"data": [{"amount": decimal.Decimal("2.99"), "released": datetime.date(2006, 2, 15)}]}
+    data, mimetype = encode_body(body, MSGPACK_MIMETYPE)
+    assert mimetype == MSGPACK_MIMETYPE
+    assert decode_body(data, mimetype) == body
+
+
+def test_arrow_carries_rows_as_columns():
+    pytest.importorskip("pyarrow")
+    data, mimetype = encode_body({**ROWS, "position": 4}, ARROW_MIMETYPE)
+    assert mimetype == ARROW_MIMETYPE
+    decoded = decode_body(data, mimetype)
+    assert decoded["position"] == 4
+    assert [row["rental_rate"] for row in decoded["data"]] == [decimal.Decimal("0.99"), decimal.Decimal("4.99")]
+
+
+def test_bodies_without_rows_fall_back_to_json():
+    pytest.importorskip("pyarrow")
+    data, mimetype = encode_body({"message": "Query executed successfully"}, ARROW_MIMETYPE)
+    assert mimetype == JSON_MIMETYPE
+    assert json.loads(data) == {"message": "Query executed successfully"}
+
+
+@pytest.mark.parametrize("content_type", [MSGPACK_MIMETYPE, ARROW_MIMETYPE])
+def test_malformed_bodies_are_rejected(content_type):
+    with pytest.raises(ValueError):
+        decode_body(b"\xc1not a body", content_type)
+
+
+def test_direct_rows_match_the_json_of_a_node():
+    row = {
+        "id": 1,
+        "amount": decimal.Decimal("2.99"),
+        "rented_at": datetime.datetime(2006, 2, 15, 4, 57, 12),
+        "released": datetime.date(2006, 2, 15),
+        "length": datetime.timedelta(hours=1, minutes=26),
+        "features": {"Trailers", "Commentaries"},
+        "picture": b"\xff\x00ok",
+        "title": None,
+    }
+    body, _ = encode_body({"data": [row]}, JSON_MIMETYPE)
+    assert [to_json_row(row)] == json.loads(body)["data"]
+    assert to_json_row(row)["features"] == ["Commentaries", "Trailers"]
+    assert to_json_row(row)["released"] == "Wed, 15 Feb 2006 00:00:00 GMT"
@@ -0,0 +1,80 @@
+import itertools
+import threading
+from types import SimpleNamespace
+
+import mysql.connector
+import pytest
+
+import master_app
+from replication_log import ReplicationLog
+
+WRITERS = 8
+
+
+class FakeConnection:
+    def __init__(self):
+        self.committed = False
+        self.rolled_back = False
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    log = ReplicationLog(str(tmp_path), fsync_interval=0.1)
+    counter = itertools.count(1)
+    counter_lock = threading.Lock()
+
+    def allocate_positions(cursor, count):
+        with counter_lock:
+            return [next(counter) for _ in range(count)]
+
+    monkeypatch.setattr(master_app, "REPLICATION_LOG_ENABLED", True)
+    monkeypatch.setattr(master_app, "_log_replicator", SimpleNamespace(log=log))
+    monkeypatch.setattr(master_app, "allocate_positions", allocate_positions)
+    return log
+
+
+def test_concurrent_writes_share_a_flush(log):
+    start = threading.Barrier(WRITERS)
+    results = [None] * WRITERS
+
+    def write(index):
+        connection = FakeConnection()
+        start.wait()
+        positions = master_app.commit_writes(connection, None, [{"query": f"INSERT {index}"}])
+        results[index] = (connection.committed, positions, log.durable_position)
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for committed, positions, durable_position in results:
+        assert committed
+        assert durable_position >= positions[-1]
+    assert sorted(result[1][0] for result in results) == list(range(1, WRITERS + 1))
+    stats = log.stats()
+    assert stats["fsyncs"] < WRITERS
+    assert stats["entries_per_fsync"] > 1
+    assert stats["committed_position"] == WRITERS
+
+
+def test_failed_commit_discards_its_entries(log):
+    class FailingConnection(FakeConnection):
+        def commit(self):
+            raise mysql.connector.errors.OperationalError(msg="Lost connection")
+
+    master_app.commit_writes(FakeConnection(), None, [{"query": "INSERT 1"}])
+    connection = FailingConnection()
+    with pytest.raises(mysql.connector.Error):
+        master_app.commit_writes(connection, None, [{"query": "INSERT 2"}, {"query": "INSERT 3"}])
+
+    assert connection.rolled_back
+    assert log.last_position == 1
+    assert log.committed_position == 1
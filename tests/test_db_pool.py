@@ -0,0 +1,118 @@
+import gc
+
+import mysql.connector
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.unread_result = False
+        self.closed = False
+        self.rollbacks = 0
+        self.fail_rollback = False
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise mysql.connector.errors.OperationalError(msg="Lost connection")
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector:
+    """
+    Opens FakeConnections, failing the next connect when `fail` is set.
+    """
+
+    def __init__(self):
+        self.opened = []
+        self.fail = False
+
+    def connect(self, **config):
+        if self.fail:
+            self.fail = False
+            raise mysql.connector.errors.InterfaceError(msg="Can't connect to MySQL server")
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    connector = FakeConnector()
+    monkeypatch.setattr(db_pool.mysql.connector, "connect", connector.connect)
+    return connector
+
+
+def make_pool(**options):
+    return ConnectionPool({}, min_size=0, maintenance_interval=3600.0, **options)
+
+
+def test_returned_connection_is_reused_after_a_rollback(connections):
+    pool = make_pool(max_size=1)
+    connection = pool.acquire()
+    connections.opened[0].in_transaction = True
+    connection.close()
+    connection.close()
+    again = pool.acquire()
+    assert again._connection is connections.opened[0]
+    assert connections.opened[0].rollbacks == 1
+    assert pool.stats()["created"] == 1
+
+
+def test_failed_connect_frees_its_slot(connections):
+    pool = make_pool(max_size=1, checkout_timeout=0.05)
+    connections.fail = True
+    with pytest.raises(mysql.connector.Error):
+        pool.acquire()
+    assert pool.stats()["size"] == 0
+    connection = pool.acquire()
+    assert pool.stats()["in_use"] == 1
+    connection.close()
+
+
+def test_failed_rollback_discards_the_connection(connections):
+    pool = make_pool(max_size=1)
+    connection = pool.acquire()
+    connections.opened[0].in_transaction = True
+    connections.opened[0].fail_rollback = True
+    connection.close()
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["closed"]) == (0, 0, 1)
+    assert connections.opened[0].closed
+
+
+def test_dropped_connection_gives_its_slot_back(connections):
+    pool = make_pool(max_size=1, checkout_timeout=0.05)
+    connection = pool.acquire()
+    del connection
+    gc.collect()
+    assert pool.stats()["size"] == 0
+    pool.acquire()
+
+
+def test_discarded_connection_is_replaced(connections):
+    pool = make_pool(max_size=1)
+    pool.acquire().discard()
+    assert pool.acquire()._connection is connections.opened[1]
+
+
+def test_saturated_pool_times_out(connections):
+    pool = make_pool(max_size=1, checkout_timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["waiting"] == 0
+    held.close()
+    pool.acquire()
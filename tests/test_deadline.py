@@ -0,0 +1,26 @@
+import pytest
+
+from deadline import DEADLINE_HEADER, MAX_BUDGET, Deadline, DeadlineExceeded
+
+
+def test_execution_time_rounds_down_to_stay_within_deadline(clock):
+    deadline = Deadline(2.9, clock=clock)
+    assert deadline.execution_time_ms() == 2000
+    clock.now = 2.05
+    assert deadline.execution_time_ms() == 800
+    clock.now = 2.899
+    assert deadline.execution_time_ms() == 1
+
+
+def test_check_raises_once_expired(clock):
+    deadline = Deadline(1.0, clock=clock)
+    deadline.check()
+    clock.now = 1.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+
+
+def test_from_headers_clamps_budget():
+    assert Deadline.from_headers({DEADLINE_HEADER: "1e12"}).remaining() <= MAX_BUDGET
+    assert Deadline.from_headers({DEADLINE_HEADER: "nan"}, default=5.0).remaining() <= 5.0
+    assert Deadline.from_headers({DEADLINE_HEADER: "-10"}).expired()
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from group_commit import GroupCommitter, is_groupable
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("INSERT INTO t VALUES (1)", True),
+    ("  update t SET a = 1", True),
+    ("DELETE FROM t", True),
+    ("REPLACE INTO t VALUES (1)", True),
+    ("CREATE TABLE t (a INT)", False),
+    ("SELECT * FROM t", False),
+    ("inserted", False),
+])
+def test_only_plain_dml_is_groupable(query, expected):
+    assert is_groupable(query) is expected
+
+
+def submit_concurrently(committer, statements):
+    results = [None] * len(statements)
+    errors = [None] * len(statements)
+
+    def submit(index):
+        try:
+            results[index] = committer.submit(statements[index])
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(statements))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_writes_are_committed_together():
+    groups = []
+
+    def commit_fn(statements):
+        groups.append(list(statements))
+        return [{"query": statement["query"]} for statement in statements]
+
+    committer = GroupCommitter(commit_fn, batch_size=4, max_wait=0.2)
+    statements = [{"query": f"INSERT INTO t VALUES ({index})"} for index in range(4)]
+    results, errors = submit_concurrently(committer, statements)
+
+    assert errors == [None] * 4
+    assert results == [{"query": statement["query"]} for statement in statements]
+    assert len(groups) == 1
+    stats = committer.stats()
+    assert stats["groups"] == 1
+    assert stats["average_group_size"] == 4
+
+
+def test_groups_are_capped_at_the_batch_size():
+    groups = []
+
+    def commit_fn(statements):
+        groups.append(len(statements))
+        return [None] * len(statements)
+
+    committer = GroupCommitter(commit_fn, batch_size=2, max_wait=0.05)
+    submit_concurrently(committer, [{"query": f"INSERT INTO t VALUES ({index})"} for index in range(5)])
+    assert max(groups) <= 2
+    assert sum(groups) == 5
+
+
+def test_failed_group_fails_every_write_in_it():
+    def commit_fn(statements):
+        raise ConnectionError("Lost connection")
+
+    committer = GroupCommitter(commit_fn, batch_size=3, max_wait=0.2)
+    results, errors = submit_concurrently(committer, [{"query": "INSERT INTO t VALUES (1)"}] * 3)
+    assert results == [None] * 3
+    assert all(isinstance(error, ConnectionError) for error in errors)
+    assert committer.stats()["failed_groups"] >= 1
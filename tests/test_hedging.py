@@ -0,0 +1,47 @@
+import pytest
+
+from hedging import HedgePolicy
+
+
+def test_budget_earns_a_hedge_per_share_of_reads():
+    policy = HedgePolicy(budget_ratio=0.25)
+    for _ in range(3):
+        policy.on_read()
+    assert not policy.try_acquire()
+    policy.on_read()
+    assert policy.try_acquire()
+    assert not policy.try_acquire()
+    assert policy.stats()["hedges"] == 1
+    assert policy.stats()["budget_denials"] == 2
+
+
+def test_budget_is_capped():
+    policy = HedgePolicy(budget_ratio=1.0, max_tokens=2.0)
+    for _ in range(10):
+        policy.on_read()
+    assert policy.try_acquire()
+    assert policy.try_acquire()
+    assert not policy.try_acquire()
+
+
+def test_delay_is_the_default_until_enough_samples():
+    policy = HedgePolicy(min_samples=5, default_delay_ms=50.0)
+    for latency in range(4):
+        policy.record_latency(1000.0 + latency)
+    assert policy.hedge_delay() == pytest.approx(0.05)
+
+
+def test_delay_follows_the_percentile_of_recent_latencies():
+    policy = HedgePolicy(percentile=0.9, window=10, min_samples=10)
+    for latency in range(1, 11):
+        policy.record_latency(float(latency))
+    assert policy.hedge_delay() == pytest.approx(0.010)
+    for _ in range(10):
+        policy.record_latency(2.0)
+    assert policy.hedge_delay() == pytest.approx(0.002)
+
+
+def test_delay_has_a_floor():
+    policy = HedgePolicy(min_samples=1, min_delay_ms=1.0)
+    policy.record_latency(0.1)
+    assert policy.hedge_delay() == pytest.approx(0.001)
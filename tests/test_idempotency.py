@@ -0,0 +1,118 @@
+import mysql.connector
+import pytest
+
+import master_app
+from idempotency import (
+    IdempotencyConflict,
+    IdempotencyStore,
+    is_duplicate_key,
+    read_idempotency_key,
+    request_fingerprint,
+)
+
+
+class FakeKeyTable:
+    """
+    In-memory idempotency_keys table answering the store's statements.
+    """
+
+    def __init__(self):
+        self.rows = {}
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+        self.rolled_back = False
+
+    def cursor(self, **options):
+        return FakeCursor(self.table)
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.row = None
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT fingerprint, response"):
+            self.row = self.table.rows.get(params[0])
+        elif sql.startswith("INSERT INTO idempotency_keys"):
+            key, fingerprint, response = params
+            if key in self.table.rows:
+                raise mysql.connector.errors.IntegrityError(msg="Duplicate entry", errno=1062)
+            self.table.rows[key] = (fingerprint, response)
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def table():
+    return FakeKeyTable()
+
+
+@pytest.fixture
+def store(table):
+    return IdempotencyStore(table.connection, purge_interval=3600.0)
+
+
+@pytest.mark.parametrize("key", ["", " spaced", "k" * 256, 42, "naïve"])
+def test_invalid_keys_are_rejected(key):
+    with pytest.raises(ValueError):
+        read_idempotency_key({"idempotency_key": key})
+
+
+def test_missing_key_is_none():
+    assert read_idempotency_key({"query": "INSERT INTO t VALUES (1)"}) is None
+
+
+def test_fingerprint_tells_requests_apart():
+    fingerprint = request_fingerprint("write", "INSERT INTO t VALUES (?)", [1])
+    assert fingerprint == request_fingerprint("write", "INSERT INTO t VALUES (?)", [1])
+    assert fingerprint != request_fingerprint("write", "INSERT INTO t VALUES (?)", [2])
+
+
+def test_recorded_response_is_returned_for_the_same_request(table, store):
+    fingerprint = request_fingerprint("write", "INSERT INTO t VALUES (1)", None)
+    response = {"message": "Query executed successfully", "affected_rows": 1, "position": 7}
+    store.record(table.connection().cursor(), "key-1", fingerprint, response)
+    assert store.lookup(table.connection(), "key-1", fingerprint) == response
+    assert store.lookup(table.connection(), "key-2", fingerprint) is None
+    assert store.stats()["recorded"] == 1
+    assert store.stats()["replayed"] == 1
+
+
+def test_key_sent_with_another_request_conflicts(table, store):
+    store.record(table.connection().cursor(), "key-1", request_fingerprint("write", "A", None), {"position": 1})
+    with pytest.raises(IdempotencyConflict):
+        store.lookup(table.connection(), "key-1", request_fingerprint("write", "B", None))
+    assert store.stats()["conflicts"] == 1
+
+
+def test_concurrent_record_fails_as_a_duplicate(table, store):
+    store.record(table.connection().cursor(), "key-1", "fp", {"position": 1})
+    with pytest.raises(mysql.connector.Error) as raised:
+        store.record(table.connection().cursor(), "key-1", "fp", {"position": 2})
+    assert is_duplicate_key(raised.value)
+
+
+def test_replayed_key_returns_the_stored_response(table, store, monkeypatch):
+    monkeypatch.setattr(master_app, "_idempotency_store", store)
+    fingerprint = request_fingerprint("write", "INSERT INTO t VALUES (1)", None)
+    connection = table.connection()
+    assert master_app.stored_write_result(connection, "key-1", fingerprint) is None
+
+    store.record(connection.cursor(), "key-1", fingerprint, {"message": "Query executed successfully", "position": 3})
+    replayed = master_app.stored_write_result(connection, "key-1", fingerprint)
+    assert replayed == {"message": "Query executed successfully", "position": 3, "replayed": True}
+    assert connection.rolled_back
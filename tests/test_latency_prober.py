@@ -0,0 +1,53 @@
+import pytest
+
+from latency_prober import LatencyProber
+
+
+def make_prober(clock):
+    return LatencyProber(lambda ip: None, lambda: ["a", "b"], alpha=0.5, stale_after=10.0, clock=clock)
+
+
+def test_latency_decays_towards_new_samples(clock):
+    prober = make_prober(clock)
+    prober.observe("a", 100.0)
+    prober.observe("a", 20.0)
+    assert prober.snapshot()["replicas"]["a"]["latency_ms"] == pytest.approx(60.0)
+    prober.observe("a", 20.0)
+    assert prober.snapshot()["replicas"]["a"]["latency_ms"] == pytest.approx(40.0)
+
+
+def test_lost_samples_inflate_the_score(clock):
+    prober = make_prober(clock)
+    prober.observe("a", 10.0)
+    prober.observe("b", 15.0)
+    assert prober.best() == "a"
+    prober.observe_failure("a")
+    prober.observe_failure("a")
+    replica = prober.snapshot()["replicas"]["a"]
+    assert replica["loss"] == pytest.approx(0.75)
+    assert replica["latency_ms"] == pytest.approx(10.0)
+    assert prober.best() == "b"
+
+
+def test_stale_replicas_are_not_eligible(clock):
+    prober = make_prober(clock)
+    prober.observe("a", 10.0)
+    clock.advance(5.0)
+    prober.observe("b", 50.0)
+    assert prober.best() == "a"
+    clock.advance(6.0)
+    prober.observe("b", 50.0)
+    assert prober.best() == "b"
+    assert prober.snapshot()["replicas"]["a"]["score"] is None
+
+
+def test_refresh_probes_targets_and_drops_removed_replicas(clock):
+    targets = ["a", "b"]
+    prober = LatencyProber({"a": 30.0, "b": None}.get, lambda: targets, clock=clock)
+    prober.refresh()
+    assert prober.best() == "a"
+    assert prober.snapshot()["replicas"]["b"]["loss"] == 1.0
+    targets.remove("a")
+    prober.refresh()
+    assert set(prober.snapshot()["replicas"]) == {"b"}
+    assert prober.best() is None
@@ -0,0 +1,110 @@
+import threading
+
+from log_replicator import STALLED, STREAMING, LogReplicator
+from replication_log import ReplicationLog
+
+
+class FakeSlave:
+    """
+    Slave applying shipped entries in order, which can be told to stop
+    after a given position for one batch.
+    """
+
+    def __init__(self, position=0):
+        self.position = position
+        self.fail_after = None
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def send(self, ip, entries):
+        with self._lock:
+            self.batches.append([entry["position"] for entry in entries])
+            for entry in entries:
+                if self.fail_after is not None and entry["position"] > self.fail_after:
+                    self.fail_after = None
+                    break
+                if entry["position"] == self.position + 1:
+                    self.position = entry["position"]
+            return self.position
+
+    def fetch_position(self, ip):
+        with self._lock:
+            return self.position
+
+
+def logged_entries(tmp_path, count):
+    log = ReplicationLog(str(tmp_path), fsync_interval=0.01)
+    for position in range(1, count + 1):
+        log.append(position, {"query": f"INSERT INTO t VALUES ({position})"})
+    log.mark_committed(count)
+    assert log.wait_durable(count, timeout=2.0)
+    return log
+
+
+def replicator_for(log, slave, targets):
+    return LogReplicator(
+        log, lambda: targets, slave.send, slave.fetch_position, batch_size=3, idle_wait=0.01, retry_backoff=0.01
+    )
+
+
+def test_entries_are_streamed_in_batches(tmp_path):
+    log = logged_entries(tmp_path, 5)
+    slave = FakeSlave()
+    targets = ["10.0.0.1"]
+    replicator = replicator_for(log, slave, targets)
+    replicator.sync_targets()
+    assert replicator.wait_for(targets, 5, 1, timeout=2.0) == {"10.0.0.1": 5}
+    assert slave.batches == [[1, 2, 3], [4, 5]]
+    assert replicator.snapshot()["10.0.0.1"]["state"] == STREAMING
+    targets.clear()
+    replicator.sync_targets()
+
+
+def test_stream_resends_from_the_failed_position(tmp_path):
+    log = logged_entries(tmp_path, 5)
+    slave = FakeSlave()
+    slave.fail_after = 1
+    targets = ["10.0.0.1"]
+    replicator = replicator_for(log, slave, targets)
+    replicator.sync_targets()
+    assert replicator.wait_for(targets, 5, 1, timeout=2.0) == {"10.0.0.1": 5}
+    assert slave.batches[0] == [1, 2, 3]
+    assert slave.batches[1] == [2, 3, 4]
+    assert slave.position == 5
+    targets.clear()
+    replicator.sync_targets()
+
+
+def test_stream_resumes_from_the_slave_position(tmp_path):
+    log = logged_entries(tmp_path, 5)
+    slave = FakeSlave(position=3)
+    targets = ["10.0.0.1"]
+    replicator = replicator_for(log, slave, targets)
+    replicator.sync_targets()
+    assert replicator.wait_for(targets, 5, 1, timeout=2.0) == {"10.0.0.1": 5}
+    assert slave.batches == [[4, 5]]
+    targets.clear()
+    replicator.sync_targets()
+
+
+def test_unreachable_slave_stalls_without_blocking_the_others(tmp_path):
+    log = logged_entries(tmp_path, 2)
+    slave = FakeSlave()
+
+    def fetch_position(ip):
+        if ip == "10.0.0.2":
+            raise ConnectionError("Connection refused")
+        return slave.fetch_position(ip)
+
+    targets = ["10.0.0.1", "10.0.0.2"]
+    replicator = LogReplicator(
+        log, lambda: targets, slave.send, fetch_position, idle_wait=0.01, retry_backoff=5.0
+    )
+    replicator.sync_targets()
+    acked = replicator.wait_for(targets, 2, 2, timeout=0.2)
+    assert acked == {"10.0.0.1": 2, "10.0.0.2": None}
+    snapshot = replicator.snapshot()["10.0.0.2"]
+    assert snapshot["state"] == STALLED
+    assert snapshot["last_error"] == "Connection refused"
+    targets.clear()
+    replicator.sync_targets()
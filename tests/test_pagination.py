@@ -0,0 +1,46 @@
+import pytest
+
+from pagination import MAX_PAGE_SIZE, PAGE_SIZE, encode_page_token, read_page_request
+
+
+def test_first_page_request():
+    page = read_page_request({"table": "film", "columns": ["film_id", "title"], "filters": {"rating": "PG"}})
+    assert page == {
+        "table": "film",
+        "columns": ["film_id", "title"],
+        "key": None,
+        "filters": {"rating": "PG"},
+        "after": None,
+        "page_size": PAGE_SIZE,
+    }
+
+
+def test_token_resumes_after_the_last_key():
+    token = encode_page_token({"table": "rental", "key": ["rental_id"], "after": [42], "page_size": 10})
+    page = read_page_request({"token": token})
+    assert page["table"] == "rental"
+    assert page["key"] == ["rental_id"]
+    assert page["after"] == [42]
+    assert page["page_size"] == 10
+    assert read_page_request({"token": token, "page_size": 5})["page_size"] == 5
+
+
+@pytest.mark.parametrize("data, message", [
+    ("film", "Table or token is missing"),
+    ({"table": "film; DROP TABLE film"}, "Table must be a plain identifier"),
+    ({"table": "film", "columns": ["title`"]}, "Columns must be a list of plain identifiers"),
+    ({"table": "film", "filters": {"rating": ["PG"]}}, "Filters must map"),
+    ({"table": "film", "page_size": MAX_PAGE_SIZE + 1}, "page_size must be"),
+    ({"table": "film", "page_size": True}, "page_size must be"),
+    ({"token": "not a token"}, "Invalid page token"),
+    ({"token": 7}, "Invalid page token"),
+])
+def test_invalid_requests_are_rejected(data, message):
+    with pytest.raises(ValueError, match=message):
+        read_page_request(data)
+
+
+def test_token_with_a_mismatched_key_is_rejected():
+    token = encode_page_token({"table": "rental", "key": ["rental_id"], "after": [1, 2]})
+    with pytest.raises(ValueError, match="Invalid page token"):
+        read_page_request({"token": token})
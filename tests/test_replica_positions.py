@@ -0,0 +1,42 @@
+import routing
+from replica_positions import ReplicaPositionTracker
+
+
+def make_tracker(positions=None, targets=("a", "b")):
+    positions = positions if positions is not None else {}
+    return ReplicaPositionTracker(positions.get, lambda: targets)
+
+
+def test_observe_keeps_the_highest_position():
+    tracker = make_tracker()
+    tracker.observe("a", 5)
+    tracker.observe("a", 3)
+    assert tracker.position("a") == 5
+    assert tracker.position("b") == 0
+
+
+def test_caught_up_filters_replicas_behind():
+    tracker = make_tracker()
+    tracker.observe("a", 5)
+    tracker.observe("b", 7)
+    assert tracker.caught_up(["a", "b", "c"], 6) == ["b"]
+    assert tracker.caught_up(["a", "b", "c"], 0) == ["a", "b", "c"]
+
+
+def test_refresh_polls_each_target():
+    tracker = make_tracker({"a": 4, "b": None})
+    tracker.refresh()
+    assert tracker.snapshot() == {"a": 4}
+
+
+def test_write_positions_are_learned_from_the_applied_watermark(monkeypatch):
+    tracker = make_tracker()
+    monkeypatch.setattr(routing, "_position_tracker", tracker)
+    routing.record_write_positions([
+        {"message": "Query executed successfully", "position": 9},
+        {"node": "a", "position": 9, "applied_position": 7},
+        {"node": "b", "position": 9, "applied_position": 9},
+        {"node": "c", "message": "Query failed", "error": "timeout"},
+    ])
+    assert tracker.snapshot() == {"a": 7, "b": 9}
+    assert tracker.caught_up(["a", "b", "c"], 9) == ["b"]
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from replication_log import LogGap, ReplicationLog
+
+
+def append_committed(log, positions):
+    for position in positions:
+        log.append(position, {"query": f"INSERT INTO t VALUES ({position})"})
+    log.mark_committed(positions[-1])
+
+
+def test_appended_entries_become_durable_in_one_flush(tmp_path):
+    log = ReplicationLog(str(tmp_path), fsync_interval=0.01)
+    append_committed(log, [1, 2, 3])
+    assert log.wait_durable(3, timeout=2.0)
+    stats = log.stats()
+    assert stats["durable_position"] == 3
+    assert stats["fsyncs"] == 1
+    assert stats["entries_per_fsync"] == 3
+
+
+def test_wait_durable_times_out_before_the_flush(tmp_path):
+    log = ReplicationLog(str(tmp_path), fsync_interval=10.0)
+    log.append(1, {"query": "INSERT INTO t VALUES (1)"})
+    assert not log.wait_durable(1, timeout=0.05)
+    assert log.durable_position == 0
+
+
+def test_positions_must_increase(tmp_path):
+    log = ReplicationLog(str(tmp_path))
+    log.append(1, {"query": "INSERT INTO t VALUES (1)"})
+    with pytest.raises(ValueError):
+        log.append(1, {"query": "INSERT INTO t VALUES (1)"})
+
+
+def test_reader_only_ships_committed_and_durable_entries(tmp_path):
+    log = ReplicationLog(str(tmp_path), fsync_interval=0.01)
+    append_committed(log, [1, 2])
+    log.append(3, {"sql": "INSERT INTO t VALUES (?)", "params": [3]})
+    assert log.wait_durable(3, timeout=2.0)
+    reader = log.reader(0)
+    assert [entry["position"] for entry in reader.read(10)] == [1, 2]
+    log.mark_committed(3)
+    assert reader.read(10) == [{"position": 3, "sql": "INSERT INTO t VALUES (?)", "params": [3]}]
+    reader.close()
+
+
+def test_reader_follows_segment_rollovers(tmp_path):
+    log = ReplicationLog(str(tmp_path), segment_max_bytes=1, fsync_interval=0.01)
+    append_committed(log, [1, 2, 3, 4])
+    assert log.wait_durable(4, timeout=2.0)
+    assert [first for first, _ in log.segments()] == [1, 2, 3, 4]
+    reader = log.reader(1)
+    assert [entry["position"] for entry in reader.read(2)] == [2, 3]
+    assert [entry["position"] for entry in reader.read(2)] == [4]
+    reader.close()
+
+
+def test_truncated_segments_raise_a_gap(tmp_path):
+    log = ReplicationLog(str(tmp_path), segment_max_bytes=1, fsync_interval=0.01)
+    append_committed(log, [1, 2, 3])
+    assert log.wait_durable(3, timeout=2.0)
+    log.truncate(2)
+    assert [first for first, _ in log.segments()] == [3]
+    with pytest.raises(LogGap):
+        log.reader(0).read(10)
+
+
+def test_recovery_cuts_off_a_torn_entry(tmp_path):
+    log = ReplicationLog(str(tmp_path / "log"), fsync_interval=0.01)
+    append_committed(log, [1, 2])
+    assert log.wait_durable(2, timeout=2.0)
+    _, path = log.segments()[-1]
+    with open(path, "a") as segment:
+        segment.write('{"position": 3, "que')
+    size = os.path.getsize(path)
+
+    # The crashed process no longer holds the directory lock
+    log._lock_file.close()
+    recovered = ReplicationLog(str(tmp_path / "log"))
+    assert recovered.last_position == 2
+    assert os.path.getsize(path) < size
+    recovered.append(3, {"query": "INSERT INTO t VALUES (3)"})
+    recovered.mark_committed(3)
+    assert recovered.wait_durable(3, timeout=2.0)
+    assert [entry["position"] for entry in recovered.reader(0).read(10)] == [1, 2, 3]
+
+
+def test_discard_drops_uncommitted_entries(tmp_path):
+    log = ReplicationLog(str(tmp_path), segment_max_bytes=1, fsync_interval=0.01)
+    append_committed(log, [1, 2])
+    log.append(3, {"query": "INSERT INTO t VALUES (3)"})
+    log.append(4, {"query": "INSERT INTO t VALUES (4)"})
+    log.discard(2)
+    assert log.last_position == 2
+    assert [first for first, _ in log.segments()] == [1, 2]
+    with pytest.raises(ValueError):
+        log.discard(1)
+    append_committed(log, [3])
+    assert log.wait_durable(3, timeout=2.0)
+    assert [entry["position"] for entry in log.reader(0).read(10)] == [1, 2, 3]
+
+
+def test_a_second_process_cannot_open_the_log(tmp_path):
+    ReplicationLog(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        ReplicationLog(str(tmp_path))
@@ -0,0 +1,74 @@
+from result_cache import ResultCache
+
+ROWS = {"data": [[1, "PENELOPE"]]}
+
+
+def cached(cache, key, tables, value=ROWS):
+    return cache.complete(cache.begin(key, tables), value)
+
+
+def test_completed_read_is_served_until_its_ttl(clock):
+    cache = ResultCache(ttl=30.0, clock=clock)
+    assert cache.get("q") is None
+    assert cached(cache, "q", ["actor"])
+    assert cache.get("q") == ROWS
+    clock.advance(30.0)
+    assert cache.get("q") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+def test_read_is_rejected_when_its_table_was_written_after_begin(clock):
+    cache = ResultCache(clock=clock)
+    ticket = cache.begin("q", ["actor"])
+    cache.invalidate_tables(["actor"])
+    assert not cache.complete(ticket, ROWS)
+    assert cache.get("q") is None
+
+
+def test_write_to_another_table_does_not_reject_the_read(clock):
+    cache = ResultCache(clock=clock)
+    ticket = cache.begin("q", ["actor"])
+    cache.invalidate_tables(["film"])
+    assert cache.complete(ticket, ROWS)
+
+
+def test_unparsed_write_rejects_every_read_in_progress(clock):
+    cache = ResultCache(clock=clock)
+    ticket = cache.begin("q", ["actor"])
+    cache.invalidate_tables([])
+    assert not cache.complete(ticket, ROWS)
+
+
+def test_write_drops_the_reads_of_its_tables(clock):
+    cache = ResultCache(clock=clock)
+    cached(cache, "actors", ["actor"])
+    cached(cache, "join", ["actor", "film"])
+    cached(cache, "films", ["film"])
+    assert cache.invalidate_tables(["actor"]) == 2
+    assert cache.get("actors") is None
+    assert cache.get("join") is None
+    assert cache.get("films") == ROWS
+    assert cache.invalidate_tables([]) == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResultCache(max_entries=2, clock=clock)
+    cached(cache, "a", ["t"])
+    cached(cache, "b", ["t"])
+    cache.get("a")
+    cached(cache, "c", ["t"])
+    assert cache.get("b") is None
+    assert cache.get("a") == ROWS
+    assert cache.get("c") == ROWS
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_cap_bounds_the_cache(clock):
+    cache = ResultCache(max_bytes=40, clock=clock)
+    assert not cached(cache, "big", ["t"], {"data": ["x" * 100]})
+    assert cached(cache, "a", ["t"])
+    assert cached(cache, "b", ["t"])
+    assert cache.stats()["bytes"] <= 40
+    assert cache.get("a") is None
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from sessions import SessionLimitReached, SessionRegistry, is_session_statement
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def registry():
+    return SessionRegistry(idle_timeout=60.0, max_sessions=2, reap_interval=3600.0)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM t", True),
+    ("insert INTO t VALUES (1)", True),
+    ("UPDATE t SET a = 1", True),
+    ("ALTER TABLE t ADD b INT", False),
+    ("COMMIT", False),
+])
+def test_sessions_only_run_reads_and_plain_dml(query, expected):
+    assert is_session_statement(query) is expected
+
+
+def test_open_sessions_are_capped(registry):
+    first = registry.open(FakeConnection())
+    registry.open(FakeConnection())
+    with pytest.raises(SessionLimitReached):
+        registry.open(FakeConnection())
+    with first.lock:
+        registry.end(first, committed=True)
+    registry.open(FakeConnection())
+    assert registry.stats()["committed"] == 1
+
+
+def test_ended_session_is_forgotten(registry):
+    session = registry.open(FakeConnection())
+    assert registry.get(session.id) is session
+    with session.lock:
+        registry.end(session, committed=False)
+    assert session.closed
+    assert registry.get(session.id) is None
+    assert registry.stats()["rolled_back"] == 1
+
+
+def test_reaper_rolls_back_idle_sessions(registry):
+    idle = registry.open(FakeConnection())
+    active = registry.open(FakeConnection())
+    idle.last_used = time.monotonic() - 61.0
+    registry.reap()
+    assert idle.closed
+    assert idle.connection.closed
+    assert registry.get(idle.id) is None
+    assert registry.get(active.id) is active
+    assert registry.stats()["expired"] == 1
+
+
+def test_reaper_skips_a_session_in_use(registry):
+    session = registry.open(FakeConnection())
+    session.last_used = time.monotonic() - 61.0
+    with session.lock:
+        registry.reap()
+    assert not session.closed
+    assert registry.get(session.id) is session
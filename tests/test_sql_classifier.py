@@ -0,0 +1,29 @@
+import pytest
+
+from sql_classifier import CLASSIFIER_CORPUS, READ, WRITE, classify_query, extract_read_tables, fingerprint
+
+
+@pytest.mark.parametrize("query, expected", CLASSIFIER_CORPUS)
+def test_classifier_corpus(query, expected):
+    assert classify_query(query) == expected
+
+
+@pytest.mark.parametrize("marker", ["--", "#", "/*"])
+def test_comment_marker_in_literal_does_not_hide_statement(marker):
+    assert classify_query(f"SELECT * FROM t WHERE a = '{marker}'; DELETE FROM actor") == WRITE
+
+
+def test_fingerprint_replaces_literals_and_drops_comments():
+    assert fingerprint("SELECT * FROM t /* note */ WHERE a = 'x' AND b = 42 -- tail") == (
+        "select * from t where a = ? and b = ?"
+    )
+
+
+def test_fingerprint_keeps_comment_markers_in_quoted_identifiers():
+    assert fingerprint("SELECT `a#b` FROM t") == "select `a#b` from t"
+
+
+def test_read_tables_of_single_select():
+    assert extract_read_tables("SELECT * FROM film WHERE film_id = 1") == {"film"}
+    assert extract_read_tables("SELECT * FROM film JOIN actor") == frozenset()
+    assert classify_query("SELECT * FROM film") == READ
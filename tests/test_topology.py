@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from topology import MASTER_NODE_NAME, Topology, TopologyFile
+
+MASTER = {"Name": MASTER_NODE_NAME, "PublicIP": "1.1.1.1", "PrivateIP": "10.0.0.1"}
+SLAVE = {"Name": "mysql_slave_node_1", "PublicIP": "2.2.2.2", "PrivateIP": "10.0.0.2"}
+
+
+def write_topology(path, instances, mtime_ns=None):
+    with open(path, "w") as file:
+        json.dump(instances, file)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_topology_splits_the_master_from_the_replicas():
+    topology = Topology([MASTER, SLAVE, {"Name": "mysql_slave_node_2", "PublicIP": "3.3.3.3"}])
+    assert topology.master is MASTER
+    assert topology.replica_ips == ["2.2.2.2", "3.3.3.3"]
+    assert topology.upstream_ips == ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+    assert topology.first_ip == "1.1.1.1"
+
+
+def test_file_is_checked_at_most_once_per_interval(tmp_path, clock):
+    path = str(tmp_path / "instance_info.json")
+    write_topology(path, [MASTER], mtime_ns=1_000_000_000)
+    topology_file = TopologyFile(path, check_interval=1.0, clock=clock)
+    first = topology_file.get()
+    assert first.upstream_ips == ["1.1.1.1"]
+
+    write_topology(path, [MASTER, SLAVE], mtime_ns=2_000_000_000)
+    assert topology_file.get() is first
+    clock.advance(1.0)
+    assert topology_file.get().upstream_ips == ["1.1.1.1", "2.2.2.2"]
+
+
+def test_unchanged_file_is_not_parsed_again(tmp_path, clock):
+    path = str(tmp_path / "instance_info.json")
+    write_topology(path, [MASTER])
+    topology_file = TopologyFile(path, clock=clock)
+    first = topology_file.get()
+    clock.advance(5.0)
+    assert topology_file.get() is first
+    topology_file.invalidate()
+    assert topology_file.get() is not first
+
+
+def test_broken_or_missing_file_keeps_the_last_topology(tmp_path, clock):
+    path = str(tmp_path / "instance_info.json")
+    write_topology(path, [MASTER])
+    topology_file = TopologyFile(path, clock=clock)
+    first = topology_file.get()
+
+    with open(path, "w") as file:
+        file.write("[{")
+    clock.advance(1.0)
+    assert topology_file.get() is first
+    os.remove(path)
+    clock.advance(1.0)
+    assert topology_file.get() is first
+
+
+def test_missing_or_broken_file_on_first_load_is_an_error(tmp_path, clock):
+    path = str(tmp_path / "instance_info.json")
+    with pytest.raises(FileNotFoundError):
+        TopologyFile(path, clock=clock).get()
+    with open(path, "w") as file:
+        file.write("[{")
+    with pytest.raises(ValueError):
+        TopologyFile(path, clock=clock).get()
+
+
+def test_private_ip_falls_back_to_the_public_ip():
+    topology = Topology([MASTER, {"Name": "mysql_slave_node_2", "PublicIP": "3.3.3.3"}])
+    assert topology.private_ip("1.1.1.1") == "10.0.0.1"
+    assert topology.private_ip("3.3.3.3") == "3.3.3.3"
+    assert topology.private_ip("4.4.4.4") == "4.4.4.4"
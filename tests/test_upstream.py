@@ -0,0 +1,104 @@
+import io
+
+import pytest
+import requests
+
+from deadline import DEADLINE_HEADER, Deadline, set_current_deadline
+from upstream import UpstreamClient
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client():
+    return UpstreamClient(connect_timeout=2.0, read_timeout=30.0, backoff_factor=0.0, idempotent_retries=2)
+
+
+def script(client, outcomes):
+    """
+    Answers the client's requests with `outcomes` in turn: a status code or
+    an exception to raise. Returns the list of calls made.
+    """
+    calls = []
+    outcomes = iter(outcomes)
+
+    def request(method, url, timeout=None, **kwargs):
+        calls.append((method, url, timeout, kwargs))
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    client.session.request = request
+    return calls
+
+
+def test_idempotent_request_is_retried_after_unavailable_statuses(client):
+    calls = script(client, [503, 502, 200])
+    response = client.post("http://node/write", json={"query": "INSERT"}, idempotent=True)
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_idempotent_request_is_retried_after_a_dropped_connection(client):
+    calls = script(client, [requests.ConnectionError("Connection reset"), 200])
+    assert client.post("http://node/write", data=b"{}", idempotent=True).status_code == 200
+    assert len(calls) == 2
+
+
+def test_idempotent_retries_are_bounded(client):
+    calls = script(client, [requests.Timeout("Read timed out")] * 3)
+    with pytest.raises(requests.Timeout):
+        client.post("http://node/write", json={}, idempotent=True)
+    assert len(calls) == 3
+    calls = script(client, [503, 503, 503])
+    assert client.post("http://node/write", json={}, idempotent=True).status_code == 503
+    assert len(calls) == 3
+
+
+def test_other_requests_are_sent_once(client):
+    calls = script(client, [503])
+    assert client.post("http://node/write", json={}).status_code == 503
+    assert len(calls) == 1
+    calls = script(client, [requests.Timeout("Read timed out")])
+    with pytest.raises(requests.Timeout):
+        client.post("http://node/write", json={})
+    assert len(calls) == 1
+
+
+def test_streamed_body_is_never_sent_twice(client):
+    calls = script(client, [503])
+    assert client.post("http://node/bulk", data=io.BytesIO(b"1,a\n"), idempotent=True).status_code == 503
+    assert len(calls) == 1
+
+
+def test_deadline_shrinks_the_timeouts_and_is_passed_on(client, clock):
+    calls = script(client, [200])
+    set_current_deadline(Deadline(1.5, clock=clock))
+    try:
+        client.get("http://node/read")
+    finally:
+        set_current_deadline(None)
+    _, _, timeout, kwargs = calls[0]
+    assert timeout == (1.5, 1.5)
+    assert DEADLINE_HEADER in kwargs["headers"]
+
+
+def test_expired_deadline_sends_nothing(client, clock):
+    calls = script(client, [200])
+    deadline = Deadline(1.0, clock=clock)
+    clock.advance(2.0)
+    set_current_deadline(deadline)
+    try:
+        with pytest.raises(requests.Timeout):
+            client.get("http://node/read")
+    finally:
+        set_current_deadline(None)
+    assert calls == []